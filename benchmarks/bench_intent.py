@@ -0,0 +1,89 @@
+"""
+Đo tốc độ nhận dạng intent trên bộ câu hỏi tiếng Việt mẫu.
+
+    python benchmarks/bench_intent.py [--repeat 200] [--file questions.txt]
+
+--file: mỗi dòng một câu hỏi (vd trích từ log) thay cho bộ câu hỏi mẫu bên dưới.
+"""
+import argparse
+import os
+import sys
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from intent_handler import parse_intent  # noqa: E402
+
+QUESTIONS = [
+    "Sản phẩm nào gửi bảo hành nhiều nhất?",
+    "Sản phẩm gì nhiều nhất trong tháng 3 năm 2024?",
+    "Sản phẩm nào bị lỗi nhiều trong quý 2?",
+    "Khách hàng nào gửi nhiều nhất năm 2023?",
+    "Khách nào gởi bảo hành nhiều nhất quý IV 2024",
+    "Top khách hàng gửi nhiều trong tháng 12",
+    "Cái gì hư nhiều nhất?",
+    "Loại nào lỗi nhiều nhất trong năm 2024",
+    "Mặt hàng gì gửi về nhiều nhất tháng 5",
+    "Phong Vũ gửi gì nhiều nhất?",
+    "Phong Vu gửi gì nhiều trong quý 1 năm 2024",
+    "Khách hàng FPT Shop gửi gì nhiều nhất năm 2023",
+    "An Khang gởi gì nhiều",
+    "Ai gửi sản phẩm SSD nhiều nhất?",
+    "Khách hàng nào gửi sản phẩm RAM DDR4 nhiều nhất trong năm 2024",
+    "Khách nào gửi sản phẩm màn hình nhiều",
+    "KTV nào xử lý nhiều nhất?",
+    "Kỹ thuật viên nào sửa nhiều máy nhất tháng 6 năm 2024",
+    "Tháng 3 năm 2024 đã gửi bao nhiêu sản phẩm?",
+    "Năm 2023 nhận bảo hành bao nhiêu sản phẩm",
+    "Quý 2 năm 2024 có bao nhiêu sản phẩm được gửi?",
+    "Khách hàng Thế Giới Di Động đã gửi bao nhiêu sản phẩm năm 2024",
+    "Phong Vũ gửi bao nhiêu sản phẩm trong tháng 8",
+    "Đức Trí đã gửi bao nhiêu sản phẩm quý III",
+    "Tỉ lệ sửa xong tháng này là bao nhiêu?",
+    "Có bao nhiêu đơn từ chối bảo hành?",
+    "Thời gian xử lý trung bình là bao lâu",
+    "Serial 5CD1234XYZ gửi mấy lần rồi?",
+    "Lỗi nào phổ biến nhất với laptop?",
+    "So sánh số lượng bảo hành năm 2023 và 2024",
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--file", help="File câu hỏi, mỗi dòng một câu")
+    args = parser.parse_args()
+
+    questions = QUESTIONS
+    if args.file:
+        with open(args.file, encoding="utf-8") as f:
+            questions = [line.strip() for line in f if line.strip()]
+
+    # Lượt lạnh: xoá cache để đo đúng chi phí chuẩn hoá + so khớp + tách khe
+    cold = []
+    for _ in range(args.repeat):
+        parse_intent.cache_clear()
+        started = time.perf_counter()
+        for question in questions:
+            parse_intent(question)
+        cold.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    for _ in range(args.repeat):
+        for question in questions:
+            parse_intent(question)
+    warm = time.perf_counter() - started
+
+    n = len(questions)
+    best = min(cold)
+    print(f"{n} câu hỏi × {args.repeat} lượt")
+    print(f"lạnh : {best / n * 1e6:8.1f} µs/câu (tốt nhất), {n / best:10.0f} câu/s")
+    print(f"nóng : {warm / (n * args.repeat) * 1e6:8.1f} µs/câu (cache), {n * args.repeat / warm:10.0f} câu/s")
+    print("phân bố intent:")
+    for name, count in Counter(parse_intent(q).name for q in questions).most_common():
+        print(f"  {name:<28}{count}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Đo chuẩn hoá cả cột tiếng Việt: cách cũ (map từng dòng, NFKD + lọc dấu) so với
+clean_text/normalize_for_match mới và normalize_column (mỗi giá trị phân biệt một lần).
+
+    python benchmarks/bench_normalize.py [--rows 1000000] [--distinct 5000]
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import time
+import unicodedata
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rma_utils import clean_text, normalize_for_match, normalize_column  # noqa: E402
+
+NAMES = [
+    "Phong Vũ", "Thế Giới Di Động", "Đức Trí", "An Khang", "FPT Shop", "Hoàng Hà Mobile",
+    "Nguyễn Kim", "Điện Máy Xanh", "Công ty TNHH Tin Học Ngôi Sao", "Laptop Thành Đạt",
+    "SSD Kingston A400 240GB", "RAM DDR4 8GB", "Màn hình LG 24\" IPS", "Bàn phím cơ E-Dra",
+    "Chuột không dây Logitech", "Ổ cứng WD Blue 1TB", "Tai nghe HyperX", "Nguồn Cooler Master 650W",
+]
+
+
+def old_clean_text(text):
+    # Bản trước khi tối ưu, giữ lại để so kết quả và tốc độ
+    if not isinstance(text, str): return ""
+    text = unicodedata.normalize('NFKD', text)
+    text = ''.join([c for c in text if not unicodedata.combining(c)])
+    text = text.replace('đ', 'd').replace('Đ', 'd')
+    text = text.lower().strip()
+    text = re.sub(r'[\W_]+', ' ', text)
+    text = re.sub(r'\s+', ' ', text)
+    return text
+
+
+def old_normalize_for_match(text):
+    text = str(text).lower()
+    text = unicodedata.normalize('NFKD', text)
+    text = ''.join([c for c in text if not unicodedata.combining(c)])
+    text = re.sub(r'[\-_\&]', '', text)
+    text = re.sub(r'\s+', ' ', text)
+    return text.strip()
+
+
+def make_column(rows, distinct, seed=0):
+    rng = random.Random(seed)
+    values = [f"{rng.choice(NAMES)} {rng.choice(['', 'chi nhánh', 'Q.', 'CN'])} {i}".strip()
+              for i in range(distinct)]
+    picks = np.random.default_rng(seed).integers(0, distinct, rows)
+    column = pd.Series(np.asarray(values, dtype=object)[picks])
+    column[::97] = None
+    return column
+
+
+def timed(fn):
+    started = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--distinct", type=int, default=5000)
+    args = parser.parse_args()
+
+    column = make_column(args.rows, args.distinct)
+    print(f"{args.rows} dòng, {args.distinct} giá trị phân biệt")
+    for how, old, new in (("clean", old_clean_text, clean_text),
+                          ("match", old_normalize_for_match, normalize_for_match)):
+        present = column.notna()
+        expected, t_old = timed(lambda: column[present].map(old))
+        scalar, t_new = timed(lambda: column[present].map(new))
+        bulk, t_bulk = timed(lambda: normalize_column(column, how))
+        bulk_cat, t_cat = timed(lambda: normalize_column(column.astype("category"), how))
+        expected = expected.tolist()
+        assert scalar.tolist() == expected, f"{how}: hàm mới khác hàm cũ"
+        assert bulk[present].tolist() == expected, f"{how}: normalize_column khác hàm cũ"
+        assert bulk_cat[present].tolist() == expected
+        assert bulk[~present].isna().all()
+        print(f"[{how}] map cũ {t_old:.2f}s · map mới {t_new:.2f}s ({t_old / t_new:.1f}x) · "
+              f"normalize_column {t_bulk:.3f}s ({t_old / t_bulk:.0f}x) · "
+              f"từ cột category {t_cat:.3f}s · {len(bulk.cat.categories)} dạng chuẩn")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,363 @@
+"""
+Đo toàn bộ đường xử lý trên dữ liệu giả lập ở nhiều kích thước: tải + parse sheet,
+dựng chỉ mục, các bộ lọc, mọi mẫu query_* (có/không cube, chỉ mục serial) và intent.
+
+    python benchmarks/bench_suite.py [--rows 10k,100k,1M] [--repeat 3] [-o results.json]
+                                     [--compare baseline.json] [--threshold 1.25] [--no-memory]
+
+Mỗi bước chạy `--repeat` lần để lấy thời gian tốt nhất/trung vị, thêm một lần riêng dưới
+tracemalloc để lấy bộ nhớ đỉnh (không tính vào thời gian). Frame không mang phiên bản dữ
+liệu nên các cache theo phiên bản (mask, resolver…) không che mất chi phí thật.
+--compare: so với một file kết quả trước đó, báo các bước chậm hơn `--threshold` lần
+(thoát mã 1) để thấy hồi quy trước khi tới người dùng. Mẫu query_* trả về bảng rỗng trên
+dữ liệu giả lập được đánh dấu "empty" và cũng làm lệnh thoát mã 1. 10M dòng cần vài GB RAM.
+"""
+import argparse
+import http.server
+import inspect
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+from collections import defaultdict
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import rma_query_templates as q  # noqa: E402
+from intent_handler import handle_intent, parse_intent  # noqa: E402
+from rma_ai import chuan_hoa_ten_cot  # noqa: E402
+from rma_cube import RMACube  # noqa: E402
+from rma_data import parse_sheet_csv, read_google_sheet  # noqa: E402
+from rma_filters import FilterSpec  # noqa: E402
+from rma_search import SearchIndex  # noqa: E402
+from rma_serial import SerialIndex  # noqa: E402
+from rma_utils import ColumnMap, normalize_column  # noqa: E402
+
+from bench_intent import QUESTIONS  # noqa: E402
+from synth_data import cached_csv, parse_rows  # noqa: E402
+
+DEFAULT_SIZES = "10k,100k,1M"
+GROUPS = ("parse", "index", "filter", "template", "intent")
+# Từ khoá tìm nhanh (có dấu để cả đường quét chuỗi không bỏ dấu cũng khớp)
+KEYWORD = "phong vũ"
+
+
+class Suite:
+    """
+    Gom kết quả đo: mỗi bước là (nhóm, tên, số dòng) → thời gian tốt nhất/trung vị, bộ nhớ đỉnh
+    """
+
+    def __init__(self, repeat=3, memory=True):
+        self.repeat = repeat
+        self.memory = memory
+        self.results = []
+
+    def measure(self, group, name, rows, fn):
+        times = []
+        result = None
+        for _ in range(self.repeat):
+            started = time.perf_counter()
+            result = fn()
+            times.append((time.perf_counter() - started) * 1000)
+        peak_mb = None
+        if self.memory:
+            tracemalloc.start()
+            try:
+                fn()
+                peak_mb = tracemalloc.get_traced_memory()[1] / 2**20
+            finally:
+                tracemalloc.stop()
+        record = {
+            "group": group,
+            "name": name,
+            "rows": rows,
+            "best_ms": round(min(times), 2),
+            "median_ms": round(statistics.median(times), 2),
+            "repeat": self.repeat,
+            "peak_mb": round(peak_mb, 2) if peak_mb is not None else None,
+            "out_rows": _out_rows(result),
+        }
+        self.results.append(record)
+        memory = f"{record['peak_mb']:9.1f} MB" if peak_mb is not None else ""
+        print(f"  {group:<9} {name:<58} {record['best_ms']:10.1f} ms {memory}", file=sys.stderr)
+        return result
+
+
+def _out_rows(result):
+    if isinstance(result, tuple):
+        result = next((part for part in result if isinstance(part, (pd.DataFrame, pd.Series))), None)
+    if isinstance(result, (pd.DataFrame, pd.Series, np.ndarray)):
+        return len(result)
+    return None
+
+
+def _serve(content):
+    """
+    HTTP server cục bộ trả `content` để đo read_google_sheet (tải + parse) không phụ thuộc mạng
+    """
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/csv; charset=utf-8")
+            self.send_header("Content-Length", str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+
+        def log_message(self, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def bench_parse(suite, rows, content):
+    server = _serve(content)
+    try:
+        url = f"http://127.0.0.1:{server.server_port}/sheet.csv"
+        suite.measure("parse", "read_google_sheet", rows, lambda: read_google_sheet(url))
+    finally:
+        server.shutdown()
+    data, _ = suite.measure("parse", "parse_sheet_csv", rows, lambda: parse_sheet_csv(content))
+    return data
+
+
+def bench_index(suite, rows, data, colmap):
+    suite.measure("index", "ColumnMap", rows, lambda: ColumnMap(data.columns))
+    suite.measure("index", "chuan_hoa_ten_cot", rows, lambda: chuan_hoa_ten_cot(data))
+    cube = suite.measure("index", "RMACube", rows, lambda: RMACube(data, colmap))
+    serial_index = suite.measure("index", "SerialIndex", rows, lambda: SerialIndex(data, colmap))
+    suite.measure("index", "SearchIndex", rows, lambda: SearchIndex(data, colmap))
+    customer_col = colmap.get("tên khách hàng")
+    suite.measure("index", "normalize_column(khách hàng)", rows,
+                  lambda: normalize_column(data[customer_col].astype(object), "match"))
+    return cube, serial_index
+
+
+def _top(data, col, n=1):
+    return data[col].value_counts().index[:n].tolist() if col else []
+
+
+def filter_specs(data, colmap):
+    """
+    Các đường lọc của bo_loc_da_nang / tìm nhanh ở tab 1 / khoảng ngày ở tab 3
+    """
+    years = sorted(data["Năm"].dropna().unique().tolist())
+    dates = data[colmap.get("ngày tiếp nhận")]
+    customers = _top(data, colmap.get("tên khách hàng"), 3)
+    return {
+        "năm": FilterSpec.build(years=years[-1:]),
+        "năm + quý": FilterSpec.build(years=years[-1:], quarters=[4]),
+        "năm + tháng": FilterSpec.build(years=years[-2:], months=[1, 2, 3]),
+        "khoảng ngày": FilterSpec.build(date_from=dates.min() + (dates.max() - dates.min()) / 2, date_to=dates.max()),
+        "khách hàng (3)": FilterSpec.build(customers=customers),
+        "sản phẩm": FilterSpec.build(products=_top(data, colmap.get("sản phẩm"))),
+        "KTV": FilterSpec.build(ktvs=_top(data, colmap.get("ktv"))),
+        "nhóm hàng": FilterSpec.build(groups=_top(data, colmap.get("nhóm hàng"))),
+        "từ khoá khách hàng": FilterSpec.build(keyword=KEYWORD, keyword_field="khách hàng"),
+        "kết hợp": FilterSpec.build(years=years[-1:], customers=customers, groups=_top(data, colmap.get("nhóm hàng"))),
+    }
+
+
+def bench_filters(suite, rows, data, colmap):
+    search = SearchIndex(data, colmap)
+    for name, spec in filter_specs(data, colmap).items():
+        suite.measure("filter", name, rows, lambda spec=spec: spec.apply(data, colmap=colmap, search=search))
+    # Không có chỉ mục tìm kiếm: quét chuỗi trên cả cột
+    spec = FilterSpec.build(keyword=KEYWORD, keyword_field="khách hàng")
+    suite.measure("filter", "từ khoá (không chỉ mục)", rows, lambda: spec.apply(data, colmap=colmap))
+
+
+def template_calls(data, colmap, cube, serial_index):
+    """
+    (tên, hàm không tham số) cho mọi hàm query_* trong rma_query_templates; tham số
+    bắt buộc lấy giá trị phổ biến nhất trong dữ liệu. Hàm nhận cube/serial_index được
+    đo cả hai cách (tính trên frame và dùng cube/chỉ mục dựng sẵn).
+    """
+    customer = (_top(data, colmap.get("tên khách hàng")) or [None])[0]
+    product = (_top(data, colmap.get("sản phẩm")) or [None])[0]
+    values = {
+        "group_by": "Tháng",
+        "customer_name": customer,
+        "selected_khach": customer,
+        "product_name": product,
+        "quarter": 4,
+        "month": 12,
+        "colmap": colmap,
+    }
+    calls = []
+    for name, fn in inspect.getmembers(q, inspect.isfunction):
+        if not name.startswith("query_") or fn.__module__ != q.__name__:
+            continue
+        params = list(inspect.signature(fn).parameters.values())
+        if not params:
+            continue
+        kwargs = {p.name: values[p.name] for p in params[1:] if p.name in values}
+        missing = [p.name for p in params[1:] if p.default is p.empty and p.name not in kwargs]
+        if missing:
+            print(f"  bỏ qua {name}: thiếu giá trị cho {missing}", file=sys.stderr)
+            continue
+        calls.append((name, lambda fn=fn, kwargs=kwargs: fn(data, **kwargs)))
+        for extra, value in (("cube", cube), ("serial_index", serial_index)):
+            if extra in {p.name for p in params}:
+                calls.append((f"{name} [{extra}]", lambda fn=fn, kwargs=kwargs, extra=extra, value=value:
+                              fn(data, **kwargs, **{extra: value})))
+    return calls
+
+
+def bench_templates(suite, rows, data, colmap, cube, serial_index):
+    """
+    Đo mọi mẫu; mẫu trả về bảng rỗng (thường là nhánh "không tìm thấy cột") bị đánh dấu
+    empty vì thời gian đo được không phải của phép tính thật. Trả về tên các mẫu đó.
+    """
+    empty = []
+    for name, call in template_calls(data, colmap, cube, serial_index):
+        result = suite.measure("template", name, rows, call)
+        if not _out_rows(result):
+            suite.results[-1]["empty"] = True
+            title = result[0] if isinstance(result, tuple) else ""
+            print(f"  RỖNG: {name} @ {rows} dòng: {title}", file=sys.stderr)
+            empty.append(name)
+    return empty
+
+
+def bench_intents(suite, rows, raw):
+    by_intent = defaultdict(list)
+    for question in QUESTIONS:
+        by_intent[parse_intent(question).name].append(question)
+
+    def parse_all():
+        parse_intent.cache_clear()
+        return [parse_intent(question) for question in QUESTIONS]
+
+    suite.measure("intent", "parse_intent (tất cả câu, lạnh)", rows, parse_all)
+    for intent, questions in sorted(by_intent.items()):
+        suite.measure("intent", f"handle_intent:{intent} ({len(questions)} câu)", rows,
+                      lambda questions=questions: [handle_intent(question, raw) for question in questions])
+
+
+def run_size(suite, rows, seed, groups):
+    started = time.perf_counter()
+    path = cached_csv(rows, seed)
+    with open(path, "rb") as f:
+        content = f.read()
+    print(f"{rows} dòng ({len(content) / 2**20:.1f} MB CSV, sẵn sau {time.perf_counter() - started:.1f}s)",
+          file=sys.stderr)
+
+    if "parse" in groups:
+        data = bench_parse(suite, rows, content)
+    else:
+        data, _ = parse_sheet_csv(content)
+    del content
+    colmap = ColumnMap(data.columns)
+    if "index" in groups:
+        cube, serial_index = bench_index(suite, rows, data, colmap)
+    else:
+        cube, serial_index = RMACube(data, colmap), SerialIndex(data, colmap)
+    if "filter" in groups:
+        bench_filters(suite, rows, data, colmap)
+    empty = []
+    if "template" in groups:
+        empty = bench_templates(suite, rows, data, colmap, cube, serial_index)
+    if "intent" in groups:
+        bench_intents(suite, rows, chuan_hoa_ten_cot(data))
+    return empty
+
+
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                                text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "git_commit": commit,
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def compare(results, baseline, threshold):
+    """
+    Các bước chậm hơn `threshold` lần so với baseline: [(khoá, ms cũ, ms mới, tỉ lệ)]
+    """
+    old = {(r["group"], r["name"], r["rows"]): r["best_ms"] for r in baseline["results"]}
+    slower = []
+    for r in results:
+        key = (r["group"], r["name"], r["rows"])
+        # Bước quá nhanh (<1 ms) dao động nhiều, không tính là hồi quy
+        if key in old and old[key] >= 1.0 and r["best_ms"] > old[key] * threshold:
+            slower.append((key, old[key], r["best_ms"], round(r["best_ms"] / old[key], 2)))
+    return slower
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", default=DEFAULT_SIZES, help="Các kích thước, cách nhau dấu phẩy (vd 10k,100k,1M,10M)")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--only", default=",".join(GROUPS), help=f"Nhóm cần đo ({','.join(GROUPS)})")
+    parser.add_argument("--no-memory", action="store_true", help="Không đo bộ nhớ đỉnh (nhanh hơn)")
+    parser.add_argument("-o", "--output", help="Ghi kết quả JSON (mặc định: stdout)")
+    parser.add_argument("--compare", help="File kết quả cũ để so sánh")
+    parser.add_argument("--threshold", type=float, default=1.25, help="Tỉ lệ chậm hơn bị coi là hồi quy")
+    args = parser.parse_args()
+
+    groups = {group.strip() for group in args.only.split(",") if group.strip()}
+    unknown = groups - set(GROUPS)
+    if unknown:
+        parser.error(f"Nhóm không hợp lệ: {', '.join(sorted(unknown))}")
+    sizes = [parse_rows(size) for size in args.rows.split(",") if size.strip()]
+
+    suite = Suite(repeat=args.repeat, memory=not args.no_memory)
+    empty = {}
+    for rows in sizes:
+        for name in run_size(suite, rows, args.seed, groups):
+            empty.setdefault(name, []).append(rows)
+
+    report = {
+        "environment": environment(),
+        "config": {"sizes": sizes, "repeat": args.repeat, "seed": args.seed, "groups": sorted(groups),
+                   "memory": not args.no_memory},
+        "results": suite.results,
+    }
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+    status = 0
+    if empty:
+        print(f"{len(empty)} mẫu trả về bảng rỗng trên dữ liệu giả lập (thời gian không có ý nghĩa): "
+              + ", ".join(sorted(empty)), file=sys.stderr)
+        status = 1
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        slower = compare(suite.results, baseline, args.threshold)
+        for (group, name, rows), old_ms, new_ms, ratio in slower:
+            print(f"CHẬM HƠN {ratio}x: {group} / {name} @ {rows} dòng: {old_ms} → {new_ms} ms", file=sys.stderr)
+        if slower:
+            return 1
+        print(f"Không bước nào chậm hơn {args.threshold}x so với {args.compare}", file=sys.stderr)
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
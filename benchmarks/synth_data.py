@@ -0,0 +1,203 @@
+"""
+Sinh dữ liệu RMA giả lập (cùng bộ cột với Google Sheet) để đo hiệu năng ở 10k–10M dòng.
+
+    python benchmarks/synth_data.py --rows 1M [-o synth.csv] [--seed 0]
+
+Phân phối gần với dữ liệu thật: khách hàng/sản phẩm theo luật Zipf (vài khách lớn gửi
+phần lớn), sản phẩm thuộc cố định một nhóm hàng, lỗi phụ thuộc nhóm hàng, một phần lượt
+(REPEAT_RATE) gửi lại serial đã có, trạng thái sửa xong/không sửa được/từ chối/đang xử lý,
+ngày trả khách cách ngày tiếp nhận theo phân phối gamma (trống khi chưa xử lý xong).
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+# Thư mục nhớ lại các file CSV đã sinh (sinh 10M dòng mất vài phút)
+CACHE_DIR = os.path.join(".rma_cache", "bench")
+# Tăng khi đổi bộ cột/phân phối để các file CSV cũ trong cache được sinh lại
+GENERATOR_VERSION = 2
+START_DATE = "2021-01-01"
+END_DATE = "2025-12-31"
+
+CUSTOMER_BRANDS = [
+    "Phong Vũ", "Thế Giới Di Động", "Điện Máy Xanh", "FPT Shop", "Đức Trí", "An Khang", "Hoàng Hà Mobile",
+    "Nguyễn Kim", "CellphoneS", "GearVN", "Hacom", "Phúc Anh", "Tin Học Ngôi Sao", "An Phát", "Hanoicomputer",
+    "Mai Hoàng", "Viễn Sơn", "Thành Nhân", "Memoryzone", "Laptop88",
+]
+CUSTOMER_PREFIXES = ["", "Công ty TNHH ", "Công ty CP ", "Cửa hàng ", "Đại lý "]
+CUSTOMER_SUFFIXES = ["", " Hà Nội", " TP.HCM", " Đà Nẵng", " Cần Thơ", " Hải Phòng", " Nha Trang", " Biên Hoà"]
+
+# Nhóm hàng → (sản phẩm, lỗi thường gặp)
+CATALOG = {
+    "Mạng": (
+        ["Router AX3000", "Router AC1200", "Switch 24P Gigabit", "Switch 8P PoE", "Access Point WiFi 6",
+         "Bộ phát 4G LTE", "Mesh WiFi 3 pack", "Card mạng PCIe 2.5G"],
+        ["Mất wifi", "Không lên nguồn", "Rớt mạng liên tục", "Cổng LAN chết", "Treo thiết bị", "Nóng máy"],
+    ),
+    "Camera": (
+        ["Camera IP 2MP", "Camera IP 4MP ngoài trời", "Camera Dome 5MP", "Đầu ghi NVR 8 kênh",
+         "Đầu ghi NVR 16 kênh", "Camera WiFi trong nhà"],
+        ["Mất hình", "Hình bị nhoè", "Không nhận ổ cứng", "Hồng ngoại hỏng", "Không lên nguồn", "Mất kết nối"],
+    ),
+    "Lưu trữ": (
+        ["SSD 240GB SATA", "SSD 512GB NVMe", "SSD 1TB NVMe", "HDD 1TB", "HDD 4TB NAS", "USB 64GB", "Thẻ nhớ 128GB"],
+        ["Không nhận ổ", "Bad sector", "Tốc độ chậm", "Mất dữ liệu", "Chập mạch"],
+    ),
+    "Linh kiện": (
+        ["RAM DDR4 8GB", "RAM DDR4 16GB", "RAM DDR5 32GB", "Nguồn 650W", "Mainboard B660", "VGA RTX 3060",
+         "Tản nhiệt nước 240mm"],
+        ["Không lên hình", "Lỗi khe RAM", "Chạy chập chờn", "Quạt kêu to", "Không lên nguồn", "Cháy tụ"],
+    ),
+    "Màn hình": (
+        ["Màn hình 24\" IPS", "Màn hình 27\" 2K", "Màn hình 32\" cong", "Màn hình 22\" văn phòng"],
+        ["Sọc màn hình", "Điểm chết", "Hở sáng", "Không lên nguồn", "Chập chờn tín hiệu"],
+    ),
+    "Phụ kiện": (
+        ["Chuột không dây", "Bàn phím cơ", "Tai nghe gaming", "Webcam Full HD", "Loa bluetooth", "Bộ chia HDMI"],
+        ["Double click", "Liệt phím", "Mất tiếng", "Không kết nối bluetooth", "Đứt dây"],
+    ),
+}
+
+TECHNICIANS = [
+    "Nguyễn Văn Minh", "Trần Quốc Tuấn", "Lê Thị Lan", "Phạm Đức Anh", "Hoàng Văn Hùng", "Võ Thị Mai",
+    "Đặng Quang Huy", "Bùi Thanh Sơn", "Đỗ Ngọc Hân", "Ngô Văn Dũng", "Dương Minh Khoa", "Lý Thị Thu",
+]
+SERVICE_TYPES = (["Bảo hành", "Sửa dịch vụ", "Đổi mới"], [0.72, 0.22, 0.06])
+# Trạng thái: sửa xong / không sửa được / từ chối bảo hành / đang xử lý (cả ba cột trống)
+STATUS_P = [0.70, 0.13, 0.10, 0.07]
+REPEAT_RATE = 0.08
+
+
+def parse_rows(text):
+    """
+    "10k" → 10_000, "1M" → 1_000_000, "2500" → 2500
+    """
+    text = str(text).strip().lower().replace("_", "")
+    scale = {"k": 1_000, "m": 1_000_000}.get(text[-1:], 1)
+    return int(float(text[:-1] if scale > 1 else text) * scale)
+
+
+def _zipf_p(n, s=1.1):
+    weights = 1.0 / np.arange(1, n + 1) ** s
+    return weights / weights.sum()
+
+
+def _customers():
+    names = []
+    for i, brand in enumerate(CUSTOMER_BRANDS):
+        for j, suffix in enumerate(CUSTOMER_SUFFIXES):
+            names.append(f"{CUSTOMER_PREFIXES[(i + j) % len(CUSTOMER_PREFIXES)]}{brand}{suffix}")
+    return names
+
+
+def _categorical(rng, values, n, p=None):
+    codes = rng.choice(len(values), size=n, p=p)
+    return pd.Categorical.from_codes(codes, categories=values), codes
+
+
+def make_frame(rows, seed=0):
+    """
+    DataFrame `rows` dòng với cột như bản xuất CSV của sheet (ngày dạng yyyy-mm-dd, cờ trạng thái 1/trống)
+    """
+    rng = np.random.default_rng(seed)
+    groups = list(CATALOG)
+    products = [p for g in groups for p in CATALOG[g][0]]
+    product_group = np.array([gi for gi, g in enumerate(groups) for _ in CATALOG[g][0]])
+    errors = sorted({e for g in groups for e in CATALOG[g][1]})
+    group_errors = [np.array([errors.index(e) for e in CATALOG[g][1]]) for g in groups]
+
+    customers = _customers()
+    rng.shuffle(customers)
+    customer, _ = _categorical(rng, customers, rows, _zipf_p(len(customers)))
+    product_codes = rng.choice(len(products), size=rows, p=_zipf_p(len(products), 0.8))
+    group_codes = product_group[product_codes]
+    error_codes = np.empty(rows, dtype=np.int64)
+    for gi, choices in enumerate(group_errors):
+        in_group = group_codes == gi
+        error_codes[in_group] = rng.choice(choices, size=int(in_group.sum()), p=_zipf_p(len(choices), 0.7))
+
+    # Lượng hàng tăng dần theo thời gian + mùa cao điểm cuối năm
+    start, end = np.datetime64(START_DATE), np.datetime64(END_DATE)
+    span = int((end - start).astype(int)) + 1
+    day_p = np.linspace(0.6, 1.4, span) * (1 + 0.25 * np.cos((np.arange(span) % 365 - 330) / 365 * 2 * np.pi))
+    received = start + rng.choice(span, size=rows, p=day_p / day_p.sum()).astype("timedelta64[D]")
+
+    serial_ids = rng.permutation(rows).astype(np.int64) + 10_000_000
+    repeat = rng.random(rows) < REPEAT_RATE
+    # Lượt quay lại dùng serial của một lượt khác (thường là sản phẩm đã sửa trước đó)
+    serial_ids[repeat] = serial_ids[rng.integers(0, rows, int(repeat.sum()))]
+    prefixes = np.array(["SN", "RM", "VN", "HK"])[product_group[product_codes] % 4]
+
+    status = rng.choice(4, size=rows, p=STATUS_P)
+    turnaround = np.ceil(rng.gamma(2.0, 3.5, rows)).astype(np.int64)
+    returned = received + turnaround.astype("timedelta64[D]")
+    returned_text = pd.Series(pd.to_datetime(returned).strftime("%Y-%m-%d"))
+    returned_text[status == 3] = None
+
+    def flag(value):
+        return np.where(status == value, 1.0, np.nan)
+
+    frame = pd.DataFrame({
+        "Ngày tiếp nhận": pd.to_datetime(received).strftime("%Y-%m-%d"),
+        "Tên khách hàng": customer,
+        "Sản phẩm": pd.Categorical.from_codes(product_codes, categories=products),
+        "Nhóm hàng": pd.Categorical.from_codes(group_codes, categories=groups),
+        "Serial": pd.Series(prefixes).str.cat(pd.Series(serial_ids).astype(str)),
+        # Tên cột như sheet thật: khớp cả "tên lỗi" lẫn "tên lỗi (báo lỗi)" của query_top_errors
+        "Tên lỗi (báo lỗi)": pd.Categorical.from_codes(error_codes, categories=errors),
+        "KTV": _categorical(rng, TECHNICIANS, rows, _zipf_p(len(TECHNICIANS), 0.5))[0],
+        "Đã sửa xong": flag(0),
+        "Không sửa được": flag(1),
+        "Từ chối bảo hành": flag(2),
+        "Ngày trả khách": returned_text,
+        "Loại dịch vụ": _categorical(rng, SERVICE_TYPES[0], rows, SERVICE_TYPES[1])[0],
+    })
+    return frame
+
+
+def make_csv(rows, seed=0):
+    """
+    Nội dung CSV (bytes, utf-8) như tải từ Google Sheet
+    """
+    return make_frame(rows, seed).to_csv(index=False).encode("utf-8")
+
+
+def cached_csv(rows, seed=0, directory=CACHE_DIR):
+    """
+    Đường dẫn file CSV giả lập, sinh một lần rồi dùng lại cho các lần chạy sau
+    """
+    path = os.path.join(directory, f"synth_{rows}_{seed}_v{GENERATOR_VERSION}.csv")
+    if not os.path.exists(path):
+        os.makedirs(directory, exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(make_csv(rows, seed))
+        os.replace(tmp_path, path)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", default="100k", help="Số dòng (vd 10k, 1M)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("-o", "--output", help="File CSV (mặc định: thư mục cache)")
+    args = parser.parse_args()
+
+    rows = parse_rows(args.rows)
+    started = time.perf_counter()
+    if args.output:
+        with open(args.output, "wb") as f:
+            f.write(make_csv(rows, args.seed))
+        path = args.output
+    else:
+        path = cached_csv(rows, args.seed)
+    size_mb = os.path.getsize(path) / 2**20
+    print(f"{rows} dòng → {path} ({size_mb:.1f} MB, {time.perf_counter() - started:.1f}s)", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
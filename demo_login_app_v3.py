@@ -1,30 +1,38 @@
 import streamlit as st
-import pandas as pd
 import os
 from dotenv import load_dotenv
-import requests
-import io
-import plotly.express as px
 from rma_ai import query_openai
-from rma_ai import chuan_hoa_ten_cot
-from rma_utils import bo_loc_da_nang, ensure_time_columns, find_col
-import io
-import time
-def export_excel_button(df, filename="bao_cao_rma.xlsx", label="📥 Tải file Excel"):
+from rma_answer_cache import get_answer_cache
+from rma_openai_client import get_client_manager
+from rma_prompt import PROMPT_TOKEN_BUDGET
+from rma_utils import bo_loc_da_nang_spec
+from rma_filters import FilterSpec
+from rma_cube import cube_for_spec, get_cube
+from rma_search import get_search_index
+from rma_data import SheetLoader, GOOGLE_SHEET_URL
+from rma_snapshot import SnapshotStore
+from rma_ingest import IngestLoader, DATA_DIR
+from rma_refresh import BackgroundRefresher, BACKGROUND_REFRESH
+def export_excel_button(df, filename="bao_cao_rma.xlsx", label="📥 Tải file Excel", scope=None):
+    # File chỉ được dựng khi bấm tải (data là hàm), kết quả được cache theo phạm vi + nội dung
     if df.empty:
         return
-    buffer = io.BytesIO()
-    with pd.ExcelWriter(buffer, engine="xlsxwriter") as writer:
-        df.to_excel(writer, index=False, sheet_name="RMA_Report")
-    buffer.seek(0)
-    st.download_button(
-        label=label,
-        data=buffer.getvalue(),
-        file_name=filename,
-        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-    )
-
-import rma_query_templates
+    base = os.path.splitext(filename)[0]
+    scope = scope or (base, dataset.version)
+    for column, fmt in zip(st.columns(len(available_formats())), available_formats()):
+        button_label, ext, mime = FORMATS[fmt]
+        column.download_button(
+            label=label if fmt == "xlsx" else button_label,
+            data=lazy_export(df, fmt, scope),
+            file_name=f"{base}.{ext}",
+            mime=mime,
+            key=f"export_{base}_{fmt}",
+            on_click="ignore",
+        )
+
+from rma_reports import REPORTS, ReportContext, get_report_executor
+from rma_view import render_table
+from rma_export import FORMATS, available_formats, lazy_export
 
 load_dotenv()
 
@@ -32,51 +40,70 @@ st.set_page_config(page_title="Trợ lý RMA AI", layout="wide")
 st.title("🧠 RMA – Dữ Liệu Bảo Hành")
 
 # === 1. Load dữ liệu từ Google Sheet ===
-GOOGLE_SHEET_URL = "https://docs.google.com/spreadsheets/d/1fWFLZWyCAXn_B8jcZ0oY4KhJ8krbLPsH/export?format=csv"
-
-def read_google_sheet(url):
-    try:
-        response = requests.get(url)
-        if response.status_code == 200:
-            df = pd.read_csv(io.StringIO(response.content.decode("utf-8")))
-            df.columns = [col.strip() for col in df.columns]
-            return ensure_time_columns(df)
-    except Exception as e:
-        st.error(f"Lỗi khi tải dữ liệu: {e}")
-    return pd.DataFrame()
-
-data = read_google_sheet(GOOGLE_SHEET_URL)
-df_raw = read_google_sheet(GOOGLE_SHEET_URL)
-df_raw = chuan_hoa_ten_cot(df_raw)
+# Loader dùng chung cho mọi phiên: chỉ tải lại khi hết TTL và sheet thực sự thay đổi,
+# khởi động lại thì đọc snapshot trên đĩa (vẫn chạy được khi không truy cập được sheet)
+# Đặt RMA_DATA_DIR (thư mục hoặc manifest các file chi nhánh) để nạp từ nhiều file thay cho sheet
+# Luồng nền tải + dựng chỉ mục rồi mới thay bản dùng chung; lượt chạy chỉ đọc bản đã dựng xong
+@st.cache_resource
+def get_refresher():
+    if DATA_DIR:
+        loader = IngestLoader(DATA_DIR)
+    else:
+        loader = SheetLoader(GOOGLE_SHEET_URL, snapshot=SnapshotStore())
+    refresher = BackgroundRefresher(loader)
+    return refresher.start() if BACKGROUND_REFRESH else refresher
+
+refresher = get_refresher()
+try:
+    handle = refresher.current()
+except Exception as e:
+    st.error(f"Lỗi khi tải dữ liệu: {e}")
+    st.stop()
+if refresher.last_error:
+    st.warning(f"⚠️ Không cập nhật được dữ liệu mới, đang dùng bản đã tải: {refresher.last_error}")
+
+dataset = handle.dataset
+data = dataset.data
+df_raw = dataset.raw
+# Tra tên cột một lần cho cả phiên chạy (data và các bản lọc có cùng bộ cột)
+colmap = handle.colmap
 
 if data.empty:
     st.stop()
 
+with st.sidebar.expander("📡 Trạng thái dữ liệu", expanded=False):
+    st.json(refresher.stats())
+    if colmap.missing:
+        st.caption("Cột chưa nhận diện: " + ", ".join(colmap.missing))
+
 # === 2. Tạo tabs giao diện mới ===
 tab1, tab2, tab3 = st.tabs(["📊 Dữ liệu RMA", "🤖 Trợ lý AI", "📋 Báo cáo & Thống kê"])
 
 # === TAB 1: Xem và lọc dữ liệu ===
 with tab1:
     st.header("📊 Bảng dữ liệu và bộ lọc")
-    data_filtered = bo_loc_da_nang(data)
+    # Các bộ lọc chỉ gom điều kiện vào FilterSpec, dữ liệu được lọc một lần ở cuối
+    filter_spec = bo_loc_da_nang_spec(data)
+    search_index = get_search_index(data, dataset.version, colmap=colmap)
+    selected_types = []
+    selected_errors = []
 
     # === TÌM KIẾM NHANH ===
     with st.expander("🔍 Tìm kiếm nhanh"):
         search_mode = st.radio("Chọn loại tìm kiếm:", ["🔎 Theo khách hàng", "🔎 Theo sản phẩm", "🔎 Theo số serial"], horizontal=True)
         keyword = st.text_input("Nhập từ khóa cần tìm:")
 
-        # GỢI Ý KHỚP
+        # GỢI Ý KHỚP (tra chỉ mục, không phân biệt dấu)
         if keyword:
             if search_mode == "🔎 Theo khách hàng":
-                col_name = find_col(data.columns, "khách hàng")
+                search_field = "customer"
             elif search_mode == "🔎 Theo sản phẩm":
-                col_name = find_col(data.columns, "sản phẩm")
+                search_field = "product"
             else:
-                col_name = None
+                search_field = None
 
-            if col_name:
-                all_values = data[col_name].dropna().unique().tolist()
-                suggestions = [s for s in all_values if keyword.lower() in s.lower()]
+            if search_field:
+                suggestions = search_index.suggest(search_field, keyword, limit=3)
                 if suggestions:
                     st.markdown('<div style="font-size: 0.85rem; color: #aaa;"><b>🔎 Gợi ý khớp:</b></div>', unsafe_allow_html=True)
                     for s in suggestions[:3]:
@@ -84,54 +111,48 @@ with tab1:
 
         # LỌC DỮ LIỆU THEO TỪ KHÓA
         if keyword:
-            keyword_lower = keyword.lower()
             if search_mode == "🔎 Theo khách hàng":
-                col_name = find_col(data_filtered.columns, "khách hàng")
+                keyword_field = "khách hàng"
             elif search_mode == "🔎 Theo sản phẩm":
-                col_name = find_col(data_filtered.columns, "sản phẩm")
+                keyword_field = "sản phẩm"
             else:
-                col_name = find_col(data_filtered.columns, "serial")
+                keyword_field = "serial"
 
-            if col_name:
-                data_filtered = data_filtered[
-                    data_filtered[col_name].astype(str).str.lower().str.contains(keyword_lower, na=False)
-                ]
+            if colmap.get(keyword_field):
+                filter_spec = filter_spec.with_(keyword=keyword, keyword_field=keyword_field)
             else:
                 st.warning("Không tìm thấy cột phù hợp để tìm kiếm.")
 
     # === LỌC THEO LOẠI DỊCH VỤ ===
     with st.expander("📌 Lọc theo loại dịch vụ"):
-        col_dichvu = find_col(data_filtered.columns, "loại dịch vụ")
+        col_dichvu = colmap.get("loại dịch vụ")
         if col_dichvu:
-            unique_types = data_filtered[col_dichvu].dropna().unique().tolist()
+            # Chỉ lấy một cột theo mask hiện tại để liệt kê lựa chọn, không copy cả frame
+            current_mask = filter_spec.mask(data, version=dataset.version, colmap=colmap, search=search_index)
+            unique_types = data[col_dichvu][current_mask].dropna().unique().tolist()
             selected_types = st.multiselect("Chọn loại dịch vụ:", unique_types)
             if selected_types:
-                data_filtered = data_filtered[data_filtered[col_dichvu].isin(selected_types)]
+                filter_spec = filter_spec.with_(service_types=selected_types)
 
     # === LỌC THEO LỖI KỸ THUẬT ===
     with st.expander("📌 Lọc theo kỹ thuật viên"):
-        col_loi = find_col(data_filtered.columns, "KTV")
+        col_loi = colmap.get("KTV")
         if col_loi:
-            unique_errors = data_filtered[col_loi].dropna().unique().tolist()
+            current_mask = filter_spec.mask(data, version=dataset.version, colmap=colmap, search=search_index)
+            unique_errors = data[col_loi][current_mask].dropna().unique().tolist()
             selected_errors = st.multiselect("Chọn KTV cần lọc:", unique_errors)
             if selected_errors:
-                data_filtered = data_filtered[data_filtered[col_loi].isin(selected_errors)]
+                filter_spec = filter_spec.with_(ktvs=selected_errors)
+
+    data_filtered = filter_spec.apply(data, version=dataset.version, colmap=colmap, search=search_index)
 
     # === HIỂN THỊ KẾT QUẢ & TẢI FILE ===
     if keyword or selected_types or selected_errors:
         st.markdown(f"**Số dòng sau khi lọc:** {len(data_filtered)} / {len(data)}")
-        st.dataframe(data_filtered, use_container_width=True)
-
-        buffer = io.BytesIO()
-        with pd.ExcelWriter(buffer, engine="xlsxwriter") as writer:
-            data_filtered.to_excel(writer, index=False, sheet_name="RMA_Loc")
-        buffer.seek(0)
-        st.download_button(
-            label="📥 Tải kết quả Excel",
-            data=buffer.getvalue(),
-            file_name="RMA_Ketqua_Loc.xlsx",
-            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-        )
+        render_table(data_filtered, key="tab1_table", cache_key=("tab1", dataset.version, filter_spec))
+
+        export_excel_button(data_filtered, filename="RMA_Ketqua_Loc.xlsx", label="📥 Tải kết quả Excel",
+                            scope=("tab1", dataset.version, filter_spec))
 
 # === TAB 2: Trợ lý AI ===
 with tab2:
@@ -141,56 +162,50 @@ with tab2:
     # 👉 Sidebar: slider trong expander
     with st.sidebar:
         with st.expander("⚙️ Tuỳ chọn gửi AI", expanded=False):
-            max_rows = st.slider("📌 Giới hạn số dòng gửi AI", 50, 1000, 200)
+            token_budget = st.slider("📌 Ngân sách token dữ liệu gửi AI", 500, 8000, PROMPT_TOKEN_BUDGET, step=250)
+            st.caption("Cache câu trả lời")
+            st.json(get_answer_cache().stats())
+            st.caption("Kết nối OpenAI")
+            st.json(get_client_manager().stats())
 
-    # 👉 Lấy dữ liệu giới hạn
-    df_ai = data_filtered.tail(max_rows)
+    # 👉 Gửi số liệu tổng hợp trên toàn bộ dữ liệu đã lọc (không cắt dòng)
+    df_ai = data_filtered
 
     if st.button("💬 Gửi câu hỏi"):
         if question.strip() == "":
             st.warning("❗ Vui lòng nhập câu hỏi.")
         else:
+            # 🧠 Gọi hàm AI (chế độ stream: hiện câu trả lời ngay khi có token đầu tiên)
+            api_key = os.getenv("OPENAI_API_KEY")
             with st.spinner("⏳ Đang truy vấn AI, vui lòng chờ..."):
-
-                # 🔁 Tạo progress bar có thể ẩn
-                progress_placeholder = st.empty()
-                progress_bar = progress_placeholder.progress(0)
-
-                for percent_complete in range(100):
-                    time.sleep(0.01)
-                    progress_bar.progress(percent_complete + 1)
-
-                progress_placeholder.empty()  # ✅ Ẩn thanh sau khi xong
-
-                # 🧠 Gọi hàm AI
-                csv_data = df_ai.to_csv(index=False)
-                api_key = os.getenv("OPENAI_API_KEY")
-
                 ai_response, prompt_used = query_openai(
                     user_question=question,
                     df_summary=df_ai,
                     df_raw=df_raw,
-                    api_key=api_key
+                    api_key=api_key,
+                    token_budget=token_budget,
+                    stream=True
                 )
 
-            # ✅ Hiện thông báo thành công 1 giây
-            success_box = st.empty()
-            success_box.success("✅ Đã xử lý xong câu hỏi.")
-            time.sleep(1)
-            success_box.empty()
-
             # 📌 Kết quả
             st.markdown("### 📌 Kết quả:")
-            st.markdown(ai_response, unsafe_allow_html=True)
+            if ai_response.streamed:
+                st.write_stream(ai_response)
+            else:
+                list(ai_response)
+                st.markdown(ai_response.text, unsafe_allow_html=True)
+            timing = ai_response.stats()
+            if timing["ttft_ms"] is not None:
+                st.caption(f"⏱️ Token đầu tiên sau {timing['ttft_ms']:.0f} ms · tổng {timing['total_ms']:.0f} ms · nguồn: {timing['source']}")
 
 # === TAB 3: Truy vấn thống kê nhanh ===
 with tab3:
     st.header("📋 Thống kê theo mẫu")
 
     # Bộ lọc khoảng thời gian
-    col_date = find_col(data.columns, "ngày tiếp nhận")
+    report_spec = FilterSpec()
+    col_date = colmap.get("ngày tiếp nhận")
     if col_date:
-        data[col_date] = pd.to_datetime(data[col_date], errors='coerce')
         min_date = data[col_date].min()
         max_date = data[col_date].max()
         ngay_bat_dau, ngay_ket_thuc = st.date_input(
@@ -199,240 +214,66 @@ with tab3:
             min_value=min_date,
             max_value=max_date
         )
-        data = data[(data[col_date] >= pd.to_datetime(ngay_bat_dau)) &
-                    (data[col_date] <= pd.to_datetime(ngay_ket_thuc))]
+        report_spec = report_spec.with_(date_from=ngay_bat_dau, date_to=ngay_ket_thuc)
 
     # Bộ lọc nhóm hàng
-    col_nhom = find_col(data.columns, "nhóm hàng")
+    col_nhom = colmap.get("nhóm hàng")
     if col_nhom:
-        nhom_list = data[col_nhom].dropna().unique().tolist()
+        date_mask = report_spec.mask(data, version=dataset.version, colmap=colmap)
+        nhom_list = data[col_nhom][date_mask].dropna().unique().tolist()
         selected_nhoms = st.multiselect("📦 Chọn nhóm hàng cần phân tích:", nhom_list)
         if selected_nhoms:
-            data = data[data[col_nhom].isin(selected_nhoms)]
-
-    # Danh sách truy vấn
-    options = [
-        "Tổng số sản phẩm tiếp nhận theo tháng/năm/quý",
-        "Tỷ lệ sửa chữa thành công theo tháng/năm/quý",
-        "Danh sách sản phẩm chưa sửa xong",
-        "Top 10 khách hàng gửi nhiều nhất",
-        "Top 10 sản phẩm bảo hành nhiều nhất",
-        "Top lỗi phổ biến theo nhóm hàng",
-        "Thời gian xử lý trung bình",
-        "Top sản phẩm gửi nhiều trong nhóm đã chọn",
-        "Thời gian xử lý trung bình theo khách hàng",
-        "Serial bị gửi nhiều lần",
-        "Hiệu suất sửa chữa theo kỹ thuật viên",
-        "Top khách hàng gửi nhiều nhất theo sản phẩm",
-        "Top sản phẩm gửi nhiều nhất theo khách hàng"
-    ]
-
-    selected = st.selectbox("Chọn loại thống kê:", options)
-
-    if selected == options[0]:
-        group_by = st.selectbox("Nhóm theo:", ["Năm", "Tháng", "Quý"])
-
-        if group_by:
-            with st.spinner("🔄 Đang truy vấn dữ liệu..."):
-                time.sleep(1)
-                title, df_out = rma_query_templates.query_1_total_by_group(data, group_by)
-
-            if not df_out.empty:
-                st.toast("✅ Đã xử lý xong truy vấn!", icon="🎉")
-                st.subheader(title)
-                st.dataframe(df_out)
-                export_excel_button(df_out, filename="tong_so_tiep_nhan.xlsx")
-            else:
-                st.warning("⚠️ Không tìm thấy dữ liệu phù hợp.")
-
-    elif selected == options[1]:
-        group_by = st.selectbox("Nhóm theo:", ["Năm", "Tháng", "Quý"])
-
-        if group_by:
-            with st.spinner("🔄 Đang truy vấn dữ liệu..."):
-                time.sleep(1)
-                title, df_out = rma_query_templates.query_2_success_rate_by_group(data, group_by)
-
-            if not df_out.empty:
-                st.toast("✅ Đã xử lý xong truy vấn!", icon="🎉")
-                st.subheader(title)
-                st.dataframe(df_out)
-                export_excel_button(df_out, filename="ti_le_sua_chua.xlsx")
-            else:
-                st.warning("⚠️ Không tìm thấy dữ liệu phù hợp.")
-
-    elif selected == options[2]:
-        with st.spinner("🔄 Đang truy vấn dữ liệu..."):
-            time.sleep(1)
-            title, df_out = rma_query_templates.query_3_unrepaired_products(data)
-
-        if not df_out.empty:
-            st.toast("✅ Đã xử lý xong truy vấn!", icon="🎉")
-            st.subheader(title)
-            st.dataframe(df_out)
-            export_excel_button(df_out, filename="chua_sua_xong.xlsx")
+            report_spec = report_spec.with_(groups=selected_nhoms)
+
+    data = report_spec.apply(data, version=dataset.version, colmap=colmap)
+
+    # Cube dựng một lần trên toàn bộ dữ liệu của phiên bản; bộ lọc nhóm hàng/thời gian thu hẹp
+    # cube, chỉ khoảng ngày cắt giữa chừng mới phải tính lại trên dòng đã lọc
+    def report_cube():
+        return cube_for_spec(get_cube(dataset.data, key=dataset.version, colmap=colmap), report_spec, colmap)
+
+    # Danh sách báo cáo lấy từ registry; mọi báo cáo chạy qua cùng một executor (có cache + đo thời gian)
+    executor = get_report_executor()
+    report_ctx = ReportContext(data, colmap, report_cube, dataset.data, (dataset.version, report_spec))
+    reports = {report.label: report for report in REPORTS}
+    report = reports[st.selectbox("Chọn loại thống kê:", list(reports))]
+
+    params = {}
+    for param in report.params:
+        widget_key = f"{report.key}_{param.name}"
+        if param.kind == "number":
+            params[param.name] = st.number_input(param.label, min_value=param.min_value, max_value=param.max_value,
+                                                 value=param.default, key=widget_key)
+            continue
+        choices = param.choices(report_ctx)
+        if param.kind == "values" and not choices:
+            st.error(f"❌ Không tìm thấy cột '{param.column}' trong dữ liệu.")
+            break
+        if param.kind == "radio":
+            params[param.name] = st.radio(param.label, choices, horizontal=True, key=widget_key)
         else:
-            st.warning("⚠️ Không tìm thấy dữ liệu phù hợp.")
+            params[param.name] = st.selectbox(param.label, choices, key=widget_key)
 
-    elif selected == options[3]:
+    if len(params) == len(report.params):
         with st.spinner("🔄 Đang truy vấn dữ liệu..."):
-            time.sleep(1)
-            title, df_out = rma_query_templates.query_4_top_customers(data)
+            result = executor.run(report, report_ctx, **params)
+        df_out = result.df
 
         if not df_out.empty:
-            st.toast("✅ Đã xử lý xong truy vấn!", icon="🎉")
-            st.subheader(title)
-            st.dataframe(df_out)
-            export_excel_button(df_out, filename="top_khach_hang.xlsx")
-        else:
-            st.warning("⚠️ Không tìm thấy dữ liệu phù hợp.")
-
-
-    elif selected == options[4]:
-        with st.spinner("🔄 Đang truy vấn dữ liệu..."):
-            time.sleep(1)
-            title, df_out = rma_query_templates.query_7_top_products(data)
-
-        if not df_out.empty:
-            st.toast("✅ Đã xử lý xong truy vấn!", icon="🎉")
-            st.subheader(title)
-            st.dataframe(df_out)
-            export_excel_button(df_out, filename="top_san_pham.xlsx")
-        else:
-            st.warning("⚠️ Không tìm thấy dữ liệu phù hợp.")
-
-    elif selected == options[5]:
-        with st.spinner("🔄 Đang truy vấn dữ liệu..."):
-            time.sleep(1)
-            title, df_out = rma_query_templates.query_top_errors(data)
-
-        if not df_out.empty:
-            st.toast("✅ Đã xử lý xong truy vấn!", icon="🎉")
-            st.subheader(title)
-            fig = px.bar(df_out, x="Lỗi", y="Số lần gặp", title="Biểu đồ lỗi kỹ thuật phổ biến",
-                         text_auto=True, template="plotly_dark")
-            fig.update_layout(xaxis_tickangle=-45, height=500, margin=dict(l=30, r=30, t=60, b=150))
-            st.plotly_chart(fig, use_container_width=True)
-            st.dataframe(df_out)
-            export_excel_button(df_out, filename="top_loi_pop.xlsx")
-        else:
-            st.warning("⚠️ Không tìm thấy dữ liệu phù hợp.")
-
-    elif selected == options[6]:
-        with st.spinner("🔄 Đang truy vấn dữ liệu..."):
-            time.sleep(1)
-            title, df_out = rma_query_templates.query_avg_processing_time(data)
-
-        if not df_out.empty:
-            st.toast("✅ Đã xử lý xong truy vấn!", icon="🎉")
-            st.subheader(title)
-            st.dataframe(df_out)
-            export_excel_button(df_out, filename="thoi_gian_xu_ly_tb.xlsx")
-        else:
-            st.warning("⚠️ Không tìm thấy dữ liệu phù hợp.")
-
-
-    elif selected == options[7]:
-        with st.spinner("🔄 Đang truy vấn dữ liệu..."):
-            time.sleep(1)
-            title, df_out = rma_query_templates.query_top_products_in_group(data)
-
-        if not df_out.empty:
-            st.toast("✅ Đã xử lý xong truy vấn!", icon="🎉")
-            st.subheader(title)
-            st.dataframe(df_out)
-            export_excel_button(df_out, filename="top_san_pham_nhom.xlsx")
-        else:
-            st.warning("⚠️ Không tìm thấy dữ liệu phù hợp.")
-
-
-    elif selected == options[8]:
-        col_khach = find_col(data.columns, "tên khách hàng")
-        if col_khach:
-            unique_khach = data[col_khach].dropna().unique().tolist()
-            selected_khach = st.selectbox("🔍 Chọn khách hàng cần xem:", unique_khach)
-        else:
-            selected_khach = None
-
-        if selected_khach:
-            with st.spinner("🔄 Đang truy vấn dữ liệu..."):
-                time.sleep(1)
-                title, df_out = rma_query_templates.query_avg_time_by_customer(data, selected_khach)
-
-            if not df_out.empty:
-                st.toast("✅ Đã xử lý xong truy vấn!", icon="🎉")
-                st.subheader(title)
-                st.dataframe(df_out)
-                export_excel_button(df_out, filename="tg_xu_ly_theo_khach.xlsx")
+            st.subheader(result.title)
+            st.caption(f"⏱️ {result.elapsed_ms:.0f} ms" + (" (kết quả đã lưu)" if result.cached else ""))
+            if report.chart is not None:
+                fig = report.chart(df_out, report_ctx, params)
+                if fig is not None:
+                    st.plotly_chart(fig, use_container_width=True)
+            if report.paged:
+                render_table(df_out, key=f"{report.key}_table", cache_key=(report.key, *params.values(), *report_ctx.key))
             else:
-                st.warning("⚠️ Không tìm thấy dữ liệu phù hợp.")
-
-    elif selected == options[9]:
-        with st.spinner("🔄 Đang truy vấn dữ liệu..."):
-            time.sleep(1)
-            title, df_out = rma_query_templates.query_serial_lap_lai(data)
-
-        if not df_out.empty:
-            st.toast("✅ Đã xử lý xong truy vấn!", icon="🎉")
-            st.subheader(title)
-            st.dataframe(df_out)
-            export_excel_button(df_out, filename="serial_lap_lai.xlsx")
-        else:
-            st.warning("⚠️ Không tìm thấy dữ liệu phù hợp.")
-
-    elif selected == options[10]:
-        with st.spinner("🔄 Đang truy vấn dữ liệu..."):
-            time.sleep(1)
-            title, df_out = rma_query_templates.query_21_technician_status_summary(data)
-
-        if not df_out.empty:
-            st.toast("✅ Đã xử lý xong truy vấn!", icon="🎉")
-            st.subheader(title)
-            st.dataframe(df_out)
-            export_excel_button(df_out, filename="hieu_suat_ktv.xlsx")
-        else:
-            st.warning("⚠️ Không tìm thấy dữ liệu phù hợp.")
-
-    elif selected == options[11]:
-        col_san_pham = find_col(data.columns, "sản phẩm")
-        if col_san_pham:
-            unique_products = data[col_san_pham].dropna().unique().tolist()
-            selected_product = st.selectbox("📦 Chọn sản phẩm", sorted(unique_products))
-
-            if selected_product:
-                # 🌟 Hiệu ứng loading
-                with st.spinner("🔍 Đang truy vấn dữ liệu, vui lòng chờ..."):
-                    time.sleep(1)  # giả lập độ trễ
-                    title, df_out = rma_query_templates.query_16_top_customers_by_product(data, selected_product)
-
-                # ✅ Thông báo hoàn tất (hiện tạm)
-                st.toast("✅ Đã xử lý xong truy vấn.", icon="🎉")
-
-                # 📊 Hiển thị kết quả
-                st.subheader(title)
                 st.dataframe(df_out)
-                export_excel_button(df_out, filename=f"top_khach_{selected_product}.xlsx")
+            export_excel_button(df_out, filename=report.filename.format(**params),
+                                scope=(report.key, *params.values(), *report_ctx.key))
         else:
-            st.error("❌ Không tìm thấy cột tên sản phẩm trong dữ liệu.")
-
-    elif selected == options[12]:
-        col_khach = find_col(data.columns, "tên khách hàng")
-        col_san_pham = find_col(data.columns, "sản phẩm")
-
-        if col_khach and col_san_pham:
-            unique_khach = data[col_khach].dropna().unique().tolist()
-            selected_khach = st.selectbox("👤 Chọn khách hàng", sorted(unique_khach))
-
-            if selected_khach:
-                with st.spinner("🔄 Đang truy vấn dữ liệu, vui lòng chờ..."):
-                    time.sleep(1)
-                    title, df_out = rma_query_templates.query_5_top_products_by_customer(
-                        data, selected_khach, top_n=30
-                    )
+            st.warning("⚠️ Không tìm thấy dữ liệu phù hợp.")
 
-                st.toast("✅ Đã xử lý xong truy vấn.", icon="📊")
-                st.subheader(title)
-                st.dataframe(df_out)
-                export_excel_button(df_out, filename=f"top_san_pham_{selected_khach}.xlsx")
-        else:
-            st.error("❌ Không tìm thấy cột 'tên khách hàng' hoặc 'sản phẩm' trong dữ liệu.")
+    with st.expander("⏱️ Thời gian chạy báo cáo", expanded=False):
+        st.json(executor.stats())
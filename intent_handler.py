@@ -1,87 +1,175 @@
 import re
+from dataclasses import dataclass
+from functools import lru_cache
 import pandas as pd
-from rma_utils import render_result_table
+from rma_utils import render_result_table, count_values, extract_time_slots, TIME_SLOT_PATTERN
+from rma_filters import FilterSpec
+from rma_entity import get_resolver, isin_mask
 
-def normalize_text(text):
-    text = text.lower()
-    text = text.replace("gởi", "gửi")
-    text = text.replace("bảo hành", "gửi")
-    text = text.replace("nhận", "gửi")
-    return text
+# Các cách nói khác nhau của "gửi", thay trong một lượt re.sub
+_SYNONYMS = {"gởi": "gửi", "bảo hành": "gửi", "nhận": "gửi"}
+_SYNONYM_PATTERN = re.compile("|".join(map(re.escape, _SYNONYMS)))
 
-def extract_time_from_question(question):
-    month_match = re.search(r"tháng\s*(\d{1,2})", question, re.IGNORECASE)
-    quarter_match = re.search(r"quý\s*(\d)", question, re.IGNORECASE)
-    year_match = re.search(r"năm\s*(\d{4})", question, re.IGNORECASE)
+_CUSTOMER_PATTERNS = (
+    re.compile(r"khách hàng ([\w\s\-\.]+?)(?: đã)? gửi"),
+    re.compile(r"([\w\s\-\.]+?)(?: đã)? gửi"),
+)
+_NOT_CUSTOMER_PATTERN = re.compile(r"bao nhiêu|sản phẩm")
+_PRODUCT_PATTERN = re.compile(r"gửi (?:sản phẩm\s)?(.+?) (?:nhiều|trong|ở|vào|\?|$)", re.IGNORECASE)
+_KTV_PATTERN = re.compile(r"ktv|kỹ thuật viên")
+
+# Bảng luật nhận dạng (theo thứ tự ưu tiên): (intent, regex trên câu đã chuẩn hoá,
+# khe cần tách). Luật có khe bắt buộc mà không tách được thì nhường luật kế tiếp.
+INTENT_RULES = [
+    ("top_product", r"sản phẩm (?:gì|nào)? ?nhiều nhất", ()),
+    ("top_products", r"sản phẩm (?:gì|nào).*nhiều", ()),
+    ("top_customers", r"^(?=.*khách)(?=.*gửi nhiều)", ()),
+    ("top_products", r"(?:cái gì|loại gì|mặt hàng gì|loại nào|cái nào).*?(?:hư|lỗi|gửi)", ()),
+    ("top_products", r"^(?=.*sản phẩm)(?=.*(?:lỗi nhiều|gửi nhiều|nhiều nhất))", ()),
+    ("top_products_by_customer", r"gửi gì nhiều", ("customer",)),
+    ("top_customers_by_product", r"^(?=.*(?:ai|khách|khách hàng).*gửi.*sản phẩm)(?=.*(?:nhiều|top))", ("product!",)),
+    ("top_ktv", r"ktv|kỹ thuật viên", ()),
+    ("count_product_by_customer", r"^(?=.*gửi)(?=.*sản phẩm)(?=.*(?:tháng|quý|năm))(?=.*khách hàng|\s*\w+.*gửi)", ("customer!",)),
+    ("count_product", r"^(?=.*gửi)(?=.*sản phẩm)(?=.*(?:tháng|quý|năm))", ()),
+]
+
+
+@dataclass(frozen=True)
+class Intent:
+    """
+    Kết quả nhận dạng một câu hỏi: tên intent và các khe thời gian/khách hàng/sản phẩm
+    """
+    name: str
+    question: str = ""
+    years: tuple = ()
+    months: tuple = ()
+    quarters: tuple = ()
+    customer: str = None
+    product: str = None
+
+    @property
+    def year(self):
+        return self.years[0] if self.years else None
+
+    @property
+    def month(self):
+        return self.months[0] if self.months else None
+
+    @property
+    def quarter(self):
+        return self.quarters[0] if self.quarters else None
+
+    @property
+    def known(self):
+        return self.name != "unknown"
+
+    @property
+    def params(self):
+        if not self.known:
+            return {}
+        params = {"question": self.question}
+        if self.customer is not None or self.name.endswith("by_customer"):
+            params["customer"] = self.customer
+        if self.product is not None:
+            params["product"] = self.product
+        return params
+
+
+class IntentMatcher:
+    """
+    Gộp mọi luật thành một regex (mỗi luật là một nhánh lookahead có tên) để tìm luật
+    khớp đầu tiên trong một lần gọi; chỉ quét tiếp từng luật khi thiếu khe bắt buộc.
+    """
+
+    def __init__(self, rules):
+        self.rules = rules
+        branches = [f"(?=.*?(?:{pattern}))" for _, pattern, _ in rules]
+        self.patterns = [re.compile(branch, re.DOTALL) for branch in branches]
+        self.combined = re.compile("|".join(f"(?P<r{i}>{branch})" for i, branch in enumerate(branches)), re.DOTALL)
 
-    month = int(month_match.group(1)) if month_match else None
-    quarter = int(quarter_match.group(1)) if quarter_match else None
-    year = int(year_match.group(1)) if year_match else None
+    def candidates(self, text):
+        match = self.combined.match(text)
+        if match is None:
+            return
+        first = int(match.lastgroup[1:])
+        yield self.rules[first]
+        for i in range(first + 1, len(self.rules)):
+            if self.patterns[i].match(text):
+                yield self.rules[i]
 
+
+_MATCHER = IntentMatcher(INTENT_RULES)
+
+
+def normalize_text(text):
+    return _SYNONYM_PATTERN.sub(lambda m: _SYNONYMS[m.group(0)], text.lower())
+
+def extract_time_from_question(question):
+    years, months, quarters = extract_time_slots(question)
+    year = years[0] if years else None
+    month = months[0] if months else None
+    quarter = quarters[0] if quarters else None
     return year, month, quarter
 
-def extract_customer_from_question(question):
-    q = normalize_text(question)
-    if "ktv" in q or "kỹ thuật viên" in q:
+def _customer_slot(q):
+    if _KTV_PATTERN.search(q):
         return None
-    match = re.search(r"khách hàng ([\w\s\-\.]+?) gửi", q)
-    if not match:
-        match = re.search(r"([\w\s\-\.]+?) gửi", q)
-    return match.group(1).strip() if match else None
+    for pattern in _CUSTOMER_PATTERNS:
+        match = pattern.search(q)
+        if match:
+            # "tháng 3 năm 2024 đã gửi ..." không có tên khách hàng
+            customer = TIME_SLOT_PATTERN.sub(" ", match.group(1)).strip(" ,")
+            if _NOT_CUSTOMER_PATTERN.search(customer):
+                return None
+            return customer or None
+    return None
+
+def extract_customer_from_question(question):
+    return _customer_slot(normalize_text(question))
 
 def extract_product_from_question(question):
-    match = re.search(r"gửi (?:sản phẩm\s)?(.+?) (?:nhiều|trong|ở|vào|\?|$)", question, re.IGNORECASE)
+    match = _PRODUCT_PATTERN.search(question)
     if match:
         return match.group(1).strip()
     return None
 
-def recognize_intent(question):
+@lru_cache(maxsize=4096)
+def parse_intent(question):
+    """
+    Chuẩn hoá câu hỏi một lần, chọn luật qua IntentMatcher và tách các khe cần thiết.
+    Kết quả (Intent bất biến) được nhớ lại cho các câu hỏi lặp lại.
+    """
     q = normalize_text(question)
-    if re.search(r"sản phẩm (gì|nào)? ?nhiều nhất", q):
-        return {"intent": "top_product", "params": {"question": question}}
-    if re.search(r"sản phẩm (gì|nào).*nhiều", q):
-        return {"intent": "top_products", "params": {"question": question}}
-    if "khách" in q and "gửi nhiều" in q:
-        return {"intent": "top_customers", "params": {"question": question}}
-    if re.search(r"sản phẩm gì nhiều", q):
-        return {"intent": "top_products", "params": {"question": question}}
-    if re.search(r"(cái gì|loại gì|mặt hàng gì|loại nào|cái nào).*?(hư|lỗi|gửi).*?(nhiều|nhất)?", q):
-        return {"intent": "top_products", "params": {"question": question}}
-    if "sản phẩm" in q and ("lỗi nhiều" in q or "gửi nhiều" in q or "nhiều nhất" in q):
-        return {"intent": "top_products", "params": {"question": question}}
-    if re.search(r"gửi gì nhiều", q):
-        customer = extract_customer_from_question(question)
-        return {"intent": "top_products_by_customer", "params": {"question": question, "customer": customer}}
-    if re.search(r"(ai|khách|khách hàng).*gửi.*sản phẩm", q) and ("nhiều" in q or "top" in q):
-        product = extract_product_from_question(question)
-        if product:
-            return {"intent": "top_customers_by_product", "params": {"question": question, "product": product}}
-    if "ktv" in q or "kỹ thuật viên" in q:
-        return {"intent": "top_ktv", "params": {}}
-    if ("gửi" in q or "đã gửi" in q) and "sản phẩm" in q and ("tháng" in q or "quý" in q or "năm" in q):
-        if "khách hàng" in q or re.search(r"^\s*\w+.*gửi", q):
-            customer = extract_customer_from_question(question)
-            return {"intent": "count_product_by_customer", "params": {"question": question, "customer": customer}}
-        return {"intent": "count_product", "params": {"question": question}}
-    return {"intent": "unknown", "params": {}}
+    years, months, quarters = extract_time_slots(question)
+    slot_values = {}
+    for name, _, slots in _MATCHER.candidates(q):
+        found = {}
+        for slot in slots:
+            key = slot.rstrip("!")
+            if key not in slot_values:
+                slot_values[key] = _customer_slot(q) if key == "customer" else extract_product_from_question(question)
+            found[key] = slot_values[key]
+            if slot.endswith("!") and not found[key]:
+                break
+        else:
+            return Intent(name, question, years, months, quarters, **found)
+    return Intent("unknown", question, years, months, quarters)
+
+def recognize_intent(question):
+    intent = parse_intent(question)
+    return {"intent": intent.name, "params": intent.params}
 
 def filter_by_time(df, question):
     year, month, quarter = extract_time_from_question(question)
-    df_filtered = df.copy()
-    if year and "nam" in df_filtered.columns:
-        df_filtered = df_filtered[df_filtered["nam"] == year]
-    if month and "thang" in df_filtered.columns:
-        df_filtered = df_filtered[df_filtered["thang"] == month]
-    if quarter and "quy" in df_filtered.columns:
-        df_filtered = df_filtered[df_filtered["quy"] == quarter]
-    return df_filtered
+    spec = FilterSpec.build(years=year, months=month, quarters=quarter)
+    return spec.apply(df, version=df.attrs.get("version"), time_cols=("nam", "thang", "quy"))
 
 def handle_top_products(df, params):
     question = params.get("question", "")
     df_filtered = filter_by_time(df, question)
     for col in ["san_pham", "model", "ten_san_pham"]:
         if col in df_filtered.columns:
-            top_df = df_filtered[col].value_counts().head(10).reset_index()
+            top_df = count_values(df_filtered[col]).head(10).reset_index()
             top_df.columns = ["san_pham", "so_luong"]
     result_list = list(top_df.itertuples(index=False, name=None))
     return df_filtered, render_result_table(result_list)
@@ -90,8 +178,8 @@ def handle_top_ktv(df, question):
     df_filtered = filter_by_time(df, question)
     for col in ["ktv", "ten_ky_thuat_vien"]:
         if col in df_filtered.columns:
-            top = df_filtered[col].value_counts().idxmax()
-            count = df_filtered[col].value_counts().max()
+            top = count_values(df_filtered[col]).idxmax()
+            count = count_values(df_filtered[col]).max()
             return df_filtered[df_filtered[col] == top], f"Kỹ thuật viên xử lý nhiều nhất là **{top}** với tổng cộng {count} lượt xử lý."
     return df_filtered, "Không tìm thấy dữ liệu kỹ thuật viên trong bảng."
 
@@ -110,14 +198,34 @@ def handle_count_product(df, params):
 
     return result
 
+def _filter_by_names(df, df_filtered, text, cols):
+    """
+    Lọc theo mọi tên trong từ điển giá trị phân biệt khớp với `text` (so khớp mã trên
+    cột category); không dò được thì quay về tìm chuỗi con như trước.
+    Trả về (df, tên hiển thị).
+    """
+    if not text:
+        return df_filtered, text
+    for col in cols:
+        if col in df_filtered.columns:
+            match = get_resolver(df, col).resolve_all(text)
+            if match is not None:
+                names = match[0]
+                return df_filtered[isin_mask(df_filtered[col], names)], names[0] if len(names) == 1 else text
+            return df_filtered[df_filtered[col].str.contains(text, case=False, na=False, regex=False)], text
+    return df_filtered, text
+
+def filter_by_customer(df, df_filtered, customer):
+    return _filter_by_names(df, df_filtered, customer, ["ten_khach_hang", "khach_hang"])
+
+def filter_by_product(df, df_filtered, product):
+    return _filter_by_names(df, df_filtered, product, ["san_pham", "model", "ten_san_pham"])
+
 def handle_count_product_by_customer(df, params):
     customer = params.get("customer")
     question = params.get("question", "")
     df_filtered = filter_by_time(df, question)
-    for col in ["ten_khach_hang", "khach_hang"]:
-        if col in df_filtered.columns:
-            df_filtered = df_filtered[df_filtered[col].str.contains(customer, case=False, na=False)]
-            break
+    df_filtered, customer = filter_by_customer(df, df_filtered, customer)
     total = len(df_filtered)
     return df_filtered, f"Khách hàng **{customer}** đã gửi tổng cộng {total} sản phẩm theo yêu cầu lọc thời gian."
 
@@ -126,7 +234,7 @@ def handle_top_customers(df, params):
     df_filtered = filter_by_time(df, question)
     for col in ["ten_khach_hang", "khach_hang"]:
         if col in df_filtered.columns:
-            top_df = df_filtered[col].value_counts().head(10).reset_index()
+            top_df = count_values(df_filtered[col]).head(10).reset_index()
             top_df.columns = ["khach_hang", "so_luong"]
     result_list = list(top_df.itertuples(index=False, name=None))
     return df_filtered, render_result_table(result_list)
@@ -135,46 +243,55 @@ def handle_top_products_by_customer(df, params):
     customer = params.get("customer")
     question = params.get("question", "")
     df_filtered = filter_by_time(df, question)
-
-    for col in ["ten_khach_hang", "khach_hang"]:
-        if col in df_filtered.columns:
-            df_filtered = df_filtered[df_filtered[col].str.contains(customer, case=False, na=False)]
-            break
+    df_filtered, customer = filter_by_customer(df, df_filtered, customer)
 
     for col in ["san_pham", "model", "ten_san_pham"]:
         if col in df_filtered.columns:
-            top_df = df_filtered[col].value_counts().head(10).reset_index()
+            top_df = count_values(df_filtered[col]).head(10).reset_index()
             top_df.columns = ["san_pham", "so_luong"]
     result_list = list(top_df.itertuples(index=False, name=None))
     return df_filtered, render_result_table(result_list)
  
-def handle_intent(question, df):
-    intent_info = recognize_intent(question)
-    intent = intent_info["intent"]
-    params = intent_info.get("params", {})
-
-    if intent == "top_customers":
-        return handle_top_customers(df, params)
-    elif intent in ["top_product", "top_products"]:
-        return handle_top_products(df, params)
-    elif intent == "top_products_by_customer":
-        return handle_top_products_by_customer(df, params)
-    elif intent == "top_customers_by_product":
-        return handle_top_customers_by_product(df, params)
-    elif intent == "top_ktv":
-        return handle_top_ktv(df, question)
-    elif intent == "count_product":
-        result = handle_count_product(df, params)
-        month = result.get("month")
-        year = result.get("year")
-        total = result.get("total")
-        if month and year and total is not None:
-            return df[df["thang"] == month], f"Trong tháng {month} năm {year}, đã có tổng cộng {total} sản phẩm được nhận bảo hành."
-        elif year and total is not None:
-            return df[df["nam"] == year], f"Trong năm {year}, đã có tổng cộng {total} sản phẩm được nhận bảo hành."
-        else:
-            return df, f"Đã có tổng cộng {total} sản phẩm được nhận bảo hành."
-    elif intent == "count_product_by_customer":
-        return handle_count_product_by_customer(df, params)
+def handle_top_customers_by_product(df, params):
+    product = params.get("product")
+    question = params.get("question", "")
+    df_filtered = filter_by_time(df, question)
+    df_filtered, _ = filter_by_product(df, df_filtered, product)
+
+    result_list = []
+    for col in ["ten_khach_hang", "khach_hang"]:
+        if col in df_filtered.columns:
+            top_df = count_values(df_filtered[col]).head(10).reset_index()
+            result_list = list(top_df.itertuples(index=False, name=None))
+            break
+    return df_filtered, render_result_table(result_list)
+
+def handle_count_product_answer(df, params):
+    result = handle_count_product(df, params)
+    month = result.get("month")
+    year = result.get("year")
+    total = result.get("total")
+    if month and year and total is not None:
+        return df[df["thang"] == month], f"Trong tháng {month} năm {year}, đã có tổng cộng {total} sản phẩm được nhận bảo hành."
+    elif year and total is not None:
+        return df[df["nam"] == year], f"Trong năm {year}, đã có tổng cộng {total} sản phẩm được nhận bảo hành."
     else:
+        return df, f"Đã có tổng cộng {total} sản phẩm được nhận bảo hành."
+
+INTENT_HANDLERS = {
+    "top_customers": handle_top_customers,
+    "top_product": handle_top_products,
+    "top_products": handle_top_products,
+    "top_products_by_customer": handle_top_products_by_customer,
+    "top_customers_by_product": handle_top_customers_by_product,
+    "top_ktv": lambda df, params: handle_top_ktv(df, params.get("question", "")),
+    "count_product": handle_count_product_answer,
+    "count_product_by_customer": handle_count_product_by_customer,
+}
+
+def handle_intent(question, df):
+    intent = parse_intent(question)
+    handler = INTENT_HANDLERS.get(intent.name)
+    if handler is None:
         return df, "Không xác định được ý định từ câu hỏi."
+    return handler(df, intent.params)
@@ -1,6 +1,7 @@
 
+import time
 import pandas as pd
-from openai import OpenAI
+from rma_openai_client import get_client_manager
 
 def chuan_hoa_ten_cot(df):
     import unicodedata, re
@@ -12,51 +13,239 @@ def chuan_hoa_ten_cot(df):
         return text
     return df.rename(columns={col: normalize(col) for col in df.columns})
 
-def prepare_prompt(user_question, df_summary, matched_names=None):
-    if len(df_summary) > 100:
-        df_summary = df_summary.head(100)
-    df_summary = chuan_hoa_ten_cot(df_summary.copy())
-    if "ngay_nhan" in df_summary.columns:
-        df_summary["ngay_nhan"] = pd.to_datetime(df_summary["ngay_nhan"], errors="coerce")
-        df_summary["nam"] = df_summary["ngay_nhan"].dt.year
-        df_summary["thang"] = df_summary["ngay_nhan"].dt.month
-        df_summary["quy"] = df_summary["ngay_nhan"].dt.quarter
-
-    csv_data = df_summary.to_csv(index=False)
+def build_prompt(user_question, df_summary, matched_names=None, token_budget=None, model="gpt-3.5-turbo"):
+    """
+    Prompt gồm số liệu tổng hợp trên toàn bộ df_summary (đã lọc) trong giới hạn token.
+    Trả về (prompt, report) với report cho biết số token và các phần đã đưa vào.
+    """
+    from intent_handler import parse_intent
+    from rma_prompt import PromptContextBuilder, PROMPT_TOKEN_BUDGET, count_tokens
+
     extra_info = ""
+    if isinstance(matched_names, str):
+        matched_names = [matched_names]
     if matched_names:
-        extra_info = f"(Đã dò gần đúng tên khách hàng: {matched_names})\n"
-    prompt = f"""{extra_info}
-Dưới đây là bảng dữ liệu bảo hành (dưới dạng csv). Hãy phân tích và trả lời câu hỏi bên dưới, có số liệu cụ thể, ngắn gọn và dễ hiểu.
+        shown = ", ".join(matched_names[:5]) + (f" và {len(matched_names) - 5} tên khác" if len(matched_names) > 5 else "")
+        extra_info = f"(Đã dò gần đúng tên khách hàng: {shown})\n"
+    template = f"""{extra_info}
+Dưới đây là số liệu bảo hành đã tổng hợp trên toàn bộ dữ liệu đang lọc (các bảng dạng csv) và một số dòng mẫu. Hãy phân tích và trả lời câu hỏi bên dưới, có số liệu cụ thể, ngắn gọn và dễ hiểu.
 Dữ liệu:
-{csv_data}
+<<DATA>>
 
 Câu hỏi: {user_question}
 """
-    return prompt
+    builder = PromptContextBuilder(df_summary, budget=token_budget or PROMPT_TOKEN_BUDGET, model=model)
+    customer = list(matched_names) if matched_names else None
+    context, report = builder.build(user_question, parse_intent(user_question), customer=customer,
+                                    reserved=count_tokens(template, model))
+    return template.replace("<<DATA>>", context), report
+
+def prepare_prompt(user_question, df_summary, matched_names=None, token_budget=None, model="gpt-3.5-turbo"):
+    return build_prompt(user_question, df_summary, matched_names, token_budget, model)[0]
+
+def resolve_customer_names(user_question, df_raw):
+    """
+    Dò tên khách hàng trong câu hỏi về mọi tên chuẩn khớp trong dữ liệu (None nếu không có)
+    """
+    from intent_handler import extract_customer_from_question
+    from rma_entity import get_resolver
+    customer = extract_customer_from_question(user_question)
+    if not customer:
+        return None
+    for col in ["ten_khach_hang", "khach_hang"]:
+        if col in df_raw.columns:
+            match = get_resolver(df_raw, col).resolve_all(customer)
+            return list(match[0]) if match else None
+    return None
+
+SYSTEM_PROMPT = "Bạn là một trợ lý dữ liệu chuyên về phân tích bảo hành RMA. Trả lời ngắn gọn, dễ hiểu, bằng tiếng Việt, có số liệu cụ thể."
+
+
+class AnswerStream:
+    """
+    Câu trả lời dạng luồng: lặp để nhận từng đoạn text ngay khi OpenAI trả về.
+    Lặp xong thì có .text (toàn văn), .ttft_ms (thời gian tới token đầu tiên, tính
+    từ lúc nhận câu hỏi), .total_ms và .ok (False nếu lỗi giữa chừng).
+    `source`: "llm", "intent", "cache" hoặc "empty".
+    """
+
+    def __init__(self, chunks, source="llm", started=None, on_complete=None):
+        self._chunks = chunks
+        self.source = source
+        self.started = started if started is not None else time.perf_counter()
+        self.on_complete = on_complete
+        self.text = ""
+        self.ttft_ms = None
+        self.total_ms = None
+        self.ok = True
+
+    @classmethod
+    def from_text(cls, text, source, started=None):
+        stream = cls(iter([text]), source, started)
+        stream.text = text
+        return stream
+
+    @property
+    def streamed(self):
+        return self.source == "llm"
+
+    def __iter__(self):
+        parts = []
+        for chunk in self._chunks:
+            if self.ttft_ms is None:
+                self.ttft_ms = (time.perf_counter() - self.started) * 1000
+            parts.append(chunk)
+            yield chunk
+        self.text = "".join(parts)
+        self.total_ms = (time.perf_counter() - self.started) * 1000
+        if self.on_complete is not None:
+            self.on_complete(self)
+
+    def stats(self):
+        return {
+            "source": self.source,
+            "ttft_ms": round(self.ttft_ms, 1) if self.ttft_ms is not None else None,
+            "total_ms": round(self.total_ms, 1) if self.total_ms is not None else None,
+            "chars": len(self.text),
+            "ok": self.ok,
+        }
+
+
+class AIQuery:
+    """
+    Một lượt hỏi, tách bước: tra cache → intent nội bộ ngay khi tạo; chỉ khi
+    needs_llm mới cần ask() gọi OpenAI. Chạy hàng loạt (rma_batch) dùng bước tách
+    này để chỉ đưa các câu cần LLM vào hàng đợi có giới hạn.
+    """
+
+    def __init__(self, user_question, df_summary, df_raw, model="gpt-3.5-turbo", matched_names=None,
+                 use_cache=True, token_budget=None):
+        self.question = user_question
+        self.df_summary = df_summary
+        self.df_raw = df_raw
+        self.model = model
+        self.matched_names = matched_names
+        self.token_budget = token_budget
+        self.started = time.perf_counter()
+        self.answer = None
+        self.prompt = None
+        self.source = None
+        self.cache = None
+        self.key = None
+        self.error = None
+        self.version = df_raw.attrs.get("version")
+        self._answer_locally(use_cache)
+
+    def _answer_locally(self, use_cache):
+        if self.df_summary.empty:
+            self.answer, self.source = "Không có dữ liệu phù hợp để trả lời.", "empty"
+            return
+
+        from intent_handler import parse_intent
+        from rma_answer_cache import get_answer_cache, data_fingerprint
+
+        # Câu hỏi lặp lại trên cùng phiên bản dữ liệu → trả lời từ cache, không gọi lại OpenAI
+        if use_cache:
+            self.cache = get_answer_cache()
+            self.cache.ensure_version(self.version)
+            fingerprint = [data_fingerprint(self.df_summary), self.version, self.token_budget]
+            self.key = self.cache.make_key(self.question, self.model, fingerprint, parse_intent(self.question))
+            entry = self.cache.get(self.key)
+            if entry is not None:
+                self.answer, self.prompt, self.source = entry["answer"], entry["prompt"], "cache"
+                return
+
+        local_answer = _intent_answer(self.question, self.df_raw)
+        if local_answer is not None:
+            self.answer, self.source = local_answer, "intent"
+            self.remember(local_answer, None)
+
+    @property
+    def needs_llm(self):
+        return self.source is None
+
+    def remember(self, answer, prompt):
+        if self.key is not None:
+            latency_ms = (time.perf_counter() - self.started) * 1000
+            self.cache.put(self.key, answer, prompt, latency_ms=latency_ms, version=self.version)
+
+    def local_result(self, stream=False):
+        answer = AnswerStream.from_text(self.answer, self.source, self.started) if stream else self.answer
+        return answer, self.prompt
+
+    def ask(self, api_key, stream=False):
+        """
+        Gọi OpenAI (qua client dùng chung). Trả về (answer, prompt) như query_openai
+        """
+        if not self.needs_llm:
+            return self.local_result(stream)
+        matched_names = self.matched_names
+        if matched_names is None:
+            matched_names = resolve_customer_names(self.question, self.df_raw)
+        prompt = prepare_prompt(self.question, self.df_summary, matched_names, self.token_budget, self.model)
+        self.source = "llm"
+
+        if stream:
+            def on_complete(answer_stream):
+                if answer_stream.ok:
+                    self.remember(answer_stream.text, prompt)
+
+            answer_stream = AnswerStream(None, "llm", self.started, on_complete)
+            answer_stream._chunks = _stream_completion(answer_stream, api_key, self.model, prompt)
+            return answer_stream, prompt
+
+        try:
+            response = get_client_manager().chat(
+                api_key=api_key,
+                model=self.model,
+                messages=_chat_messages(prompt),
+                temperature=0.2,
+                max_tokens=500,
+            )
+        except Exception as e:
+            self.error = f"{type(e).__name__}: {e}"
+            return f"Lỗi khi gọi OpenAI: {e}", None
+        self.answer = response.choices[0].message.content.strip()
+        self.prompt = prompt
+        self.remember(self.answer, prompt)
+        return self.answer, prompt
+
 
-def query_openai(user_question, df_summary, df_raw, api_key, model="gpt-3.5-turbo", matched_names=None):
-    if df_summary.empty:
-        return "Không có dữ liệu phù hợp để trả lời.", None
+def query_openai(user_question, df_summary, df_raw, api_key, model="gpt-3.5-turbo", matched_names=None, use_cache=True, token_budget=None, stream=False):
+    """
+    Trả lời câu hỏi: intent nội bộ trước, không khớp thì hỏi OpenAI. Trả về (answer, prompt);
+    với stream=True thì answer là AnswerStream để hiển thị dần từng đoạn.
+    """
+    query = AIQuery(user_question, df_summary, df_raw, model, matched_names, use_cache, token_budget)
+    if not query.needs_llm:
+        return query.local_result(stream)
+    return query.ask(api_key, stream)
 
+def _intent_answer(user_question, df_raw):
     from intent_handler import handle_intent
     df_result, intent_response = handle_intent(user_question, df_raw)
     if 'Không xác định' not in intent_response:
-        return intent_response, None
+        return intent_response
+    return None
 
-    prompt = prepare_prompt(user_question, df_summary, matched_names)
+def _chat_messages(prompt):
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": prompt}
+    ]
 
+def _stream_completion(answer_stream, api_key, model, prompt):
     try:
-        client = OpenAI(api_key=api_key)
-        response = client.chat.completions.create(
+        response = get_client_manager().chat_stream(
+            api_key=api_key,
             model=model,
-            messages=[
-                {"role": "system", "content": "Bạn là một trợ lý dữ liệu chuyên về phân tích bảo hành RMA. Trả lời ngắn gọn, dễ hiểu, bằng tiếng Việt, có số liệu cụ thể."},
-                {"role": "user", "content": prompt}
-            ],
+            messages=_chat_messages(prompt),
             temperature=0.2,
             max_tokens=500,
         )
-        return response.choices[0].message.content.strip(), prompt
+        for chunk in response:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
     except Exception as e:
-        return f"Lỗi khi gọi OpenAI: {e}", None
+        answer_stream.ok = False
+        yield f"\n\nLỗi khi gọi OpenAI: {e}"
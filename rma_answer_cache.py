@@ -0,0 +1,175 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+import pandas as pd
+
+ANSWER_CACHE_SIZE = int(os.getenv("RMA_ANSWER_CACHE_SIZE", "256"))
+ANSWER_CACHE_TTL = int(os.getenv("RMA_ANSWER_CACHE_TTL", "3600"))
+# Đặt đường dẫn file (vd .rma_cache/answers.json) để giữ câu trả lời qua các lần khởi động
+ANSWER_CACHE_PATH = os.getenv("RMA_ANSWER_CACHE_PATH", "")
+
+
+def normalize_question(question):
+    """
+    Dạng chuẩn của câu hỏi để so cache: thường hoá, gộp từ đồng nghĩa, gộp khoảng
+    trắng và bỏ dấu câu ở cuối ("Phong Vũ gởi gì nhiều nhất ?" = "phong vũ gửi gì nhiều nhất")
+    """
+    from intent_handler import normalize_text
+    return " ".join(normalize_text(question or "").split()).rstrip(" ?.!")
+
+
+def data_fingerprint(df):
+    """
+    Dấu vân tay của phần dữ liệu gửi đi: phiên bản dữ liệu + số dòng + băm index + bộ cột
+    """
+    if df is None:
+        return None
+    index_hash = int(pd.util.hash_array(df.index.to_numpy()).sum()) if len(df) else 0
+    columns = hashlib.sha1("\x1f".join(map(str, df.columns)).encode("utf-8")).hexdigest()[:8]
+    return f"{df.attrs.get('version')}:{len(df)}:{index_hash:x}:{columns}"
+
+
+class AnswerCache:
+    """
+    Cache câu trả lời của trợ lý AI (LRU + TTL, tuỳ chọn lưu ra đĩa). Khoá gồm câu hỏi
+    đã chuẩn hoá, intent/khe đã nhận dạng, model và dấu vân tay dữ liệu; mọi entry
+    của phiên bản dữ liệu cũ bị xoá khi phiên bản đổi.
+    """
+
+    def __init__(self, maxsize=ANSWER_CACHE_SIZE, ttl=ANSWER_CACHE_TTL, path=ANSWER_CACHE_PATH):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.path = path or None
+        self.version = None
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.saved_ms = 0.0
+        self._load()
+
+    @staticmethod
+    def make_key(question, model, fingerprint, intent=None):
+        if intent is None:
+            from intent_handler import parse_intent
+            intent = parse_intent(question)
+        slots = [intent.name, intent.years, intent.months, intent.quarters, intent.customer, intent.product]
+        raw = json.dumps([normalize_question(question), slots, model, fingerprint], ensure_ascii=False, default=str)
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    def ensure_version(self, version):
+        """
+        Gọi mỗi lần với phiên bản dữ liệu hiện tại; đổi phiên bản thì bỏ các entry cũ
+        """
+        with self._lock:
+            if version == self.version:
+                return
+            self.version = version
+            stale = [key for key, entry in self._entries.items() if entry["version"] != version]
+            for key in stale:
+                del self._entries[key]
+            if stale:
+                self.invalidations += len(stale)
+                self._persist()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.time() - entry["created"] > self.ttl:
+                del self._entries[key]
+                self.expired += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            self.saved_ms += entry["latency_ms"]
+            return entry
+
+    def put(self, key, answer, prompt=None, latency_ms=0.0, version=None):
+        with self._lock:
+            self._entries[key] = {
+                "answer": answer,
+                "prompt": prompt,
+                "latency_ms": latency_ms,
+                "version": version if version is not None else self.version,
+                "created": time.time(),
+            }
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+            self._persist()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._persist()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+                "saved_ms": round(self.saved_ms, 1),
+                "expired": self.expired,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "version": self.version,
+                "persistent": self.path is not None,
+            }
+
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            return
+        now = time.time()
+        for key, entry in saved.get("entries", []):
+            if now - entry.get("created", 0) <= self.ttl:
+                self._entries[key] = entry
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def _persist(self):
+        # Gọi khi đang giữ lock; ghi file tạm rồi os.replace như SnapshotStore
+        if not self.path:
+            return
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"entries": list(self._entries.items())}, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        except OSError:
+            pass
+
+
+_answer_cache = None
+_answer_cache_lock = threading.Lock()
+
+
+def get_answer_cache():
+    """
+    AnswerCache dùng chung cho cả tiến trình (mọi phiên Streamlit)
+    """
+    global _answer_cache
+    with _answer_cache_lock:
+        if _answer_cache is None:
+            _answer_cache = AnswerCache()
+        return _answer_cache
@@ -0,0 +1,548 @@
+"""
+API HTTP/JSON (không giao diện) cho các báo cáo mẫu, câu trả lời intent và xuất dòng đã lọc.
+
+    python rma_api.py [--host 127.0.0.1] [--port 8000] [--workers 2] [--dir branches/ | --url SHEET_CSV_URL]
+
+Mỗi worker giữ một bản dữ liệu trong bộ nhớ (và histogram riêng), làm mới ở luồng nền (BackgroundRefresher);
+báo cáo chạy qua cùng ReportExecutor với app Streamlit. Kết quả trả về dạng
+`format=json` (mặc định), `ndjson`, `arrow` (Arrow IPC stream) hoặc `csv`; client gửi
+`Accept-Encoding: gzip` thì được nén. Đặt RMA_API_TOKEN để bắt buộc `Authorization: Bearer <token>`.
+
+    GET  /health                    phiên bản + tuổi dữ liệu
+    GET  /metrics                   histogram độ trễ theo endpoint, thống kê báo cáo/dữ liệu
+    GET  /reports                   danh sách báo cáo và tham số
+    GET  /reports/{key}?...         chạy một báo cáo (tham số + bộ lọc qua query string)
+    GET  /intent?q=...              câu trả lời intent nội bộ (POST: {"question": ...})
+    GET  /rows?...                  các dòng đã lọc (offset/limit/sort/columns)
+"""
+import os
+import sys
+import json
+import time
+import hmac
+import bisect
+import logging
+import argparse
+import threading
+from collections import deque
+from contextlib import asynccontextmanager
+import pandas as pd
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.middleware import Middleware
+from starlette.middleware.gzip import GZipMiddleware
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+from rma_filters import FilterSpec
+from rma_refresh import BackgroundRefresher
+from rma_utils import percentile
+
+try:
+    import pyarrow as pa
+except ImportError:  # pyarrow không có → không trả được format=arrow
+    pa = None
+
+logger = logging.getLogger(__name__)
+
+API_TOKEN = os.getenv("RMA_API_TOKEN", "")
+# Chỉ nén phản hồi lớn hơn ngưỡng này (byte)
+GZIP_MIN_BYTES = int(os.getenv("RMA_API_GZIP_MIN_BYTES", "1024"))
+# Số dòng mỗi khúc khi stream NDJSON/CSV
+STREAM_CHUNK_ROWS = 10_000
+INTENT_ROW_LIMIT = 100
+# Mốc (ms) của histogram độ trễ; mốc cuối là +Inf
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+LATENCY_WINDOW = 1000
+
+MEDIA_TYPES = {
+    "json": "application/json",
+    "ndjson": "application/x-ndjson",
+    "arrow": "application/vnd.apache.arrow.stream",
+    "csv": "text/csv; charset=utf-8",
+}
+
+# Tham số lọc qua query string (lặp lại tham số để chọn nhiều giá trị: ?years=2023&years=2024)
+FILTER_FIELDS = {
+    "years": int,
+    "months": int,
+    "quarters": int,
+    "customers": str,
+    "products": str,
+    "ktvs": str,
+    "service_types": str,
+    "groups": str,
+}
+FILTER_SCALARS = ("date_from", "date_to", "keyword", "keyword_field")
+
+
+class ApiError(Exception):
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class LatencyHistogram:
+    """
+    Histogram độ trễ (ms) theo các mốc cố định, kèm cửa sổ các lần gần nhất để tính phân vị
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS_MS, window=LATENCY_WINDOW):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.total = 0
+        self.sum_ms = 0.0
+        self.errors = 0
+        self._recent = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def observe(self, elapsed_ms, error=False):
+        with self._lock:
+            self.counts[bisect.bisect_left(self.buckets, elapsed_ms)] += 1
+            self.total += 1
+            self.sum_ms += elapsed_ms
+            self.errors += error
+            self._recent.append(elapsed_ms)
+
+    def stats(self):
+        with self._lock:
+            recent = list(self._recent)
+            counts = list(self.counts)
+            total, sum_ms, errors = self.total, self.sum_ms, self.errors
+
+        labels = [f"le_{bound}" for bound in self.buckets] + ["le_inf"]
+        cumulative, running = {}, 0
+        for label, count in zip(labels, counts):
+            running += count
+            cumulative[label] = running
+        return {
+            "count": total,
+            "errors": errors,
+            "mean_ms": round(sum_ms / total, 1) if total else None,
+            "p50_ms": percentile(recent, 0.5),
+            "p95_ms": percentile(recent, 0.95),
+            "p99_ms": percentile(recent, 0.99),
+            "buckets": cumulative,
+        }
+
+
+class LatencyMiddleware:
+    """
+    Đo độ trễ của từng endpoint tới khi gửi xong byte cuối (kể cả phản hồi stream)
+    """
+
+    def __init__(self, app, histograms):
+        self.app = app
+        self.histograms = histograms
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        status = {"code": 500}
+
+        async def timed_send(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                self._observe(scope, started, status["code"])
+
+        try:
+            await self.app(scope, receive, timed_send)
+        except Exception:
+            self._observe(scope, started, 500)
+            raise
+
+    def _observe(self, scope, started, code):
+        # Router ghi endpoint vào scope; đường dẫn không khớp route nào gom vào "unmatched"
+        endpoint = scope.get("endpoint")
+        name = getattr(endpoint, "__name__", "unmatched")
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms.setdefault(name, LatencyHistogram())
+        histogram.observe((time.perf_counter() - started) * 1000, error=code >= 500)
+
+
+def parse_filters(params):
+    """
+    FilterSpec từ query string; giá trị không hợp lệ → ApiError 400
+    """
+    kwargs = {}
+    for field, cast in FILTER_FIELDS.items():
+        values = params.getlist(field)
+        if values:
+            try:
+                kwargs[field] = [cast(value) for value in values]
+            except ValueError:
+                raise ApiError(f"Giá trị không hợp lệ cho {field}: {values}")
+    for field in FILTER_SCALARS:
+        if params.get(field):
+            kwargs[field] = params[field]
+    for field in ("date_from", "date_to"):
+        if field in kwargs and pd.isna(pd.to_datetime(kwargs[field], errors="coerce")):
+            raise ApiError(f"Ngày không hợp lệ cho {field}: {kwargs[field]}")
+    return FilterSpec.build(**kwargs)
+
+
+def _int_param(params, name, default=None, minimum=0):
+    value = params.get(name)
+    if value in (None, ""):
+        return default
+    try:
+        value = int(value)
+    except ValueError:
+        raise ApiError(f"{name} phải là số nguyên")
+    if value < minimum:
+        raise ApiError(f"{name} phải >= {minimum}")
+    return value
+
+
+def _output_format(params):
+    fmt = params.get("format", "json")
+    if fmt not in MEDIA_TYPES:
+        raise ApiError(f"format phải là một trong: {', '.join(MEDIA_TYPES)}")
+    if fmt == "arrow" and pa is None:
+        raise ApiError("Cần cài pyarrow để trả về Arrow", 501)
+    return fmt
+
+
+def _arrow_table(df):
+    df = df.rename(columns=str)
+    try:
+        return pa.Table.from_pandas(df, preserve_index=False)
+    except (pa.ArrowException, TypeError, ValueError):
+        # Cột object lẫn kiểu (số và chữ) thì chuyển sang chuỗi
+        mixed = [col for col in df.columns if df[col].dtype == object]
+        df = df.astype({col: "string" for col in mixed})
+        return pa.Table.from_pandas(df, preserve_index=False)
+
+
+def _ndjson_chunks(df):
+    for start in range(0, len(df), STREAM_CHUNK_ROWS):
+        chunk = df.iloc[start:start + STREAM_CHUNK_ROWS]
+        yield chunk.to_json(orient="records", lines=True, date_format="iso", force_ascii=False).rstrip("\n") + "\n"
+
+
+def _csv_chunks(df):
+    for i, start in enumerate(range(0, max(len(df), 1), STREAM_CHUNK_ROWS)):
+        yield df.iloc[start:start + STREAM_CHUNK_ROWS].to_csv(index=False, header=i == 0)
+
+
+def frame_response(df, fmt, meta, headers=None):
+    """
+    Phản hồi cho một bảng kết quả. json: {..meta, "data": [...]}; các định dạng khác
+    chỉ có dữ liệu, meta đi trong header X-*
+    """
+    headers = dict(headers or {})
+    if fmt == "json":
+        body = json.dumps(meta, ensure_ascii=False, default=str)[:-1]
+        records = df.to_json(orient="records", date_format="iso", force_ascii=False)
+        body = f'{body}, "data": {records}}}' if meta else f'{{"data": {records}}}'
+        return Response(body.encode("utf-8"), media_type=MEDIA_TYPES[fmt], headers=headers)
+    if fmt == "arrow":
+        sink = pa.BufferOutputStream()
+        table = _arrow_table(df)
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        return Response(sink.getvalue().to_pybytes(), media_type=MEDIA_TYPES[fmt], headers=headers)
+    chunks = _ndjson_chunks(df) if fmt == "ndjson" else _csv_chunks(df)
+    return StreamingResponse(chunks, media_type=MEDIA_TYPES[fmt], headers=headers)
+
+
+class RMAApi:
+    """
+    Các endpoint đọc từ bản dữ liệu hiện tại của refresher; việc pandas (chặn) chạy
+    trong threadpool để vòng lặp sự kiện vẫn nhận request khác
+    """
+
+    def __init__(self, refresher, token=API_TOKEN):
+        self.refresher = refresher
+        self.token = token
+        self.histograms = {}
+
+    def _check_token(self, request):
+        if not self.token:
+            return
+        header = request.headers.get("authorization", "")
+        if not hmac.compare_digest(header, f"Bearer {self.token}"):
+            raise ApiError("Sai hoặc thiếu token", 401)
+
+    async def _call(self, request, handler, public=False):
+        try:
+            if not public:
+                self._check_token(request)
+            return await run_in_threadpool(handler, request)
+        except ApiError as e:
+            return JSONResponse({"error": str(e)}, status_code=e.status_code)
+        except Exception as e:
+            # Lỗi ngoài dự kiến (vd một báo cáo hỏng) vẫn trả JSON như mọi lỗi khác, traceback ghi vào log
+            logger.exception("Lỗi khi xử lý %s", request.url.path)
+            return JSONResponse({"error": f"{type(e).__name__}: {e}"}, status_code=500)
+
+    def _data_headers(self, handle, **extra):
+        headers = {"X-Data-Version": str(handle.dataset.version)}
+        headers.update({f"X-{key.replace('_', '-').title()}": str(value) for key, value in extra.items()})
+        return headers
+
+    def _filtered(self, handle, spec):
+        from rma_search import get_search_index
+        dataset, colmap = handle.dataset, handle.colmap
+        search = get_search_index(dataset.data, dataset.version, colmap=colmap) if spec.keyword else None
+        return spec.apply(dataset.data, version=dataset.version, colmap=colmap, search=search)
+
+    # --- endpoints ---
+
+    async def health(self, request):
+        return await self._call(request, self._health, public=True)
+
+    def _health(self, request):
+        try:
+            handle = self.refresher.current(timeout=0)
+        except Exception as e:
+            return JSONResponse({"status": "loading", "error": str(e)}, status_code=503)
+        return JSONResponse({
+            "status": "ok",
+            "version": handle.dataset.version,
+            "age_s": round(handle.dataset.age, 1),
+            "rows": len(handle.dataset.data),
+        })
+
+    async def metrics(self, request):
+        return await self._call(request, self._metrics)
+
+    def _metrics(self, request):
+        from rma_reports import get_report_executor
+        body = {
+            "endpoints": {name: histogram.stats() for name, histogram in sorted(self.histograms.items())},
+            "reports": get_report_executor().stats(),
+            "data": self.refresher.stats(),
+        }
+        return Response(json.dumps(body, ensure_ascii=False, default=str), media_type=MEDIA_TYPES["json"])
+
+    async def list_reports(self, request):
+        return await self._call(request, self._list_reports)
+
+    def _list_reports(self, request):
+        from rma_reports import REPORTS_BY_KEY
+        return JSONResponse([{
+            "key": report.key,
+            "label": report.label,
+            "paged": report.paged,
+            "params": [{
+                "name": param.name,
+                "label": param.label,
+                "kind": param.kind,
+                "options": list(param.options),
+                "column": param.column,
+                "default": param.default,
+                "min_value": param.min_value,
+                "max_value": param.max_value,
+            } for param in report.params],
+        } for report in REPORTS_BY_KEY.values()])
+
+    async def run_report(self, request):
+        return await self._call(request, self._run_report)
+
+    def _run_report(self, request):
+        from rma_cube import cube_for_spec, get_cube
+        from rma_reports import REPORTS_BY_KEY, ReportContext, get_report_executor
+        report = REPORTS_BY_KEY.get(request.path_params["key"])
+        if report is None:
+            raise ApiError(f"Không có báo cáo {request.path_params['key']}", 404)
+        params = request.query_params
+        fmt = _output_format(params)
+        spec = parse_filters(params)
+        handle = self.refresher.current()
+        dataset, colmap = handle.dataset, handle.colmap
+        data = self._filtered(handle, spec)
+        # Cube của cả phiên bản chỉ dựng khi báo cáo dùng cube chạy thật (trượt cache)
+        def cube():
+            return cube_for_spec(get_cube(dataset.data, key=dataset.version, colmap=colmap), spec, colmap)
+
+        ctx = ReportContext(data, colmap, cube, dataset.data, (dataset.version, spec))
+        values = {param.name: self._report_param(param, params, ctx) for param in report.params}
+
+        result = get_report_executor().run(report, ctx, **values)
+        df = result.df
+        total = len(df)
+        offset, limit = _int_param(params, "offset", 0), _int_param(params, "limit")
+        if offset or limit is not None:
+            df = df.iloc[offset:offset + limit if limit is not None else None]
+        meta = {
+            "report": report.key,
+            "title": result.title,
+            "params": values,
+            "version": dataset.version,
+            "total_rows": total,
+            "offset": offset,
+            "elapsed_ms": round(result.elapsed_ms, 1),
+            "cached": result.cached,
+        }
+        headers = self._data_headers(handle, total_rows=total, elapsed_ms=round(result.elapsed_ms, 1),
+                                     cached=result.cached)
+        return frame_response(df, fmt, meta, headers)
+
+    def _report_param(self, param, params, ctx):
+        value = params.get(param.name)
+        if param.kind == "number":
+            if value in (None, ""):
+                return param.default
+            try:
+                value = int(value)
+            except ValueError:
+                raise ApiError(f"{param.name} phải là số nguyên")
+            if not param.min_value <= value <= param.max_value:
+                raise ApiError(f"{param.name} phải trong khoảng {param.min_value}–{param.max_value}")
+            return value
+        choices = param.choices(ctx)
+        if value in (None, ""):
+            if param.kind == "values" or not choices:
+                raise ApiError(f"Thiếu tham số {param.name}")
+            return choices[0]
+        # Query string luôn là chuỗi, so với lựa chọn theo dạng chuỗi
+        by_text = {str(choice): choice for choice in choices}
+        if value not in by_text:
+            if param.kind == "values":
+                raise ApiError(f"Không có giá trị {value!r} cho {param.name}", 404)
+            raise ApiError(f"{param.name} phải là một trong: {', '.join(by_text)}")
+        return by_text[value]
+
+    async def intent(self, request):
+        question = request.query_params.get("q") or request.query_params.get("question")
+        if request.method == "POST":
+            try:
+                body = await request.json()
+            except ValueError:
+                return JSONResponse({"error": "Body phải là JSON"}, status_code=400)
+            question = body.get("question") if isinstance(body, dict) else None
+        request.state.question = question
+        return await self._call(request, self._intent)
+
+    def _intent(self, request):
+        from intent_handler import handle_intent, parse_intent
+        question = request.state.question
+        if not question or not str(question).strip():
+            raise ApiError("Thiếu câu hỏi (q)")
+        params = request.query_params
+        fmt = _output_format(params)
+        handle = self.refresher.current()
+        started = time.perf_counter()
+        parsed = parse_intent(question)
+        df, answer = handle_intent(question, handle.dataset.raw)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        matched = parsed.name != "unknown"
+        df = df if matched and isinstance(df, pd.DataFrame) else pd.DataFrame()
+        limit = _int_param(params, "limit", INTENT_ROW_LIMIT if fmt == "json" else None)
+        meta = {
+            "question": question,
+            "intent": parsed.name,
+            "params": {key: value for key, value in parsed.params.items() if key != "question"},
+            "matched": matched,
+            "answer": answer,
+            "version": handle.dataset.version,
+            "total_rows": len(df),
+            "elapsed_ms": round(elapsed_ms, 1),
+        }
+        headers = self._data_headers(handle, intent=parsed.name, total_rows=len(df), elapsed_ms=round(elapsed_ms, 1))
+        return frame_response(df.head(limit) if limit is not None else df, fmt, meta, headers)
+
+    async def rows(self, request):
+        return await self._call(request, self._rows)
+
+    def _rows(self, request):
+        from rma_view import get_result_view
+        params = request.query_params
+        fmt = _output_format(params)
+        spec = parse_filters(params)
+        handle = self.refresher.current()
+        data = self._filtered(handle, spec)
+
+        columns = [col for col in params.get("columns", "").split(",") if col]
+        unknown = [col for col in columns if col not in data.columns]
+        if unknown:
+            raise ApiError(f"Không có cột: {', '.join(unknown)}")
+        sort_by = params.get("sort") or None
+        if sort_by and sort_by not in data.columns:
+            raise ApiError(f"Không có cột để sắp xếp: {sort_by}")
+        ascending = params.get("desc", "").lower() not in ("1", "true", "yes")
+
+        # Vị trí dòng (lọc chuỗi + sắp xếp) nhớ theo (phiên bản, bộ lọc) như bảng ở tab 1
+        view = get_result_view(data, key=("api_rows", handle.dataset.version, spec))
+        positions = view.positions(params.get("q"), sort_by, ascending)
+        offset, limit = _int_param(params, "offset", 0), _int_param(params, "limit")
+        page = positions[offset:offset + limit if limit is not None else None]
+        df = data.iloc[page]
+        if columns:
+            df = df[columns]
+        meta = {"version": handle.dataset.version, "total_rows": len(positions), "offset": offset}
+        headers = self._data_headers(handle, total_rows=len(positions))
+        return frame_response(df, fmt, meta, headers)
+
+    def routes(self):
+        return [
+            Route("/health", self.health),
+            Route("/metrics", self.metrics),
+            Route("/reports", self.list_reports),
+            Route("/reports/{key}", self.run_report),
+            Route("/intent", self.intent, methods=["GET", "POST"]),
+            Route("/rows", self.rows),
+        ]
+
+
+def _default_loader():
+    from rma_data import SheetLoader, GOOGLE_SHEET_URL
+    from rma_ingest import IngestLoader
+    from rma_snapshot import SnapshotStore
+    data_dir = os.getenv("RMA_DATA_DIR", "")
+    if data_dir:
+        return IngestLoader(data_dir)
+    return SheetLoader(os.getenv("RMA_SHEET_URL", GOOGLE_SHEET_URL), snapshot=SnapshotStore())
+
+
+def create_app(loader=None, token=API_TOKEN):
+    """
+    Ứng dụng ASGI; loader mặc định theo RMA_DATA_DIR / RMA_SHEET_URL như app Streamlit
+    """
+    refresher = BackgroundRefresher(loader or _default_loader())
+    api = RMAApi(refresher, token)
+
+    @asynccontextmanager
+    async def lifespan(app):
+        refresher.start()
+        yield
+        refresher.stop(timeout=5)
+
+    app = Starlette(
+        routes=api.routes(),
+        middleware=[
+            Middleware(LatencyMiddleware, histograms=api.histograms),
+            Middleware(GZipMiddleware, minimum_size=GZIP_MIN_BYTES),
+        ],
+        lifespan=lifespan,
+    )
+    app.state.api = api
+    return app
+
+
+def main(argv=None):
+    import uvicorn
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=1, help="Số tiến trình worker (mỗi worker một bản dữ liệu)")
+    parser.add_argument("--dir", help="Gộp các file .xlsx/.csv trong thư mục hoặc manifest thay vì Google Sheet")
+    parser.add_argument("--url", help="URL CSV của Google Sheet")
+    args = parser.parse_args(argv)
+    # Worker là tiến trình riêng, nhận cấu hình qua biến môi trường
+    if args.dir:
+        os.environ["RMA_DATA_DIR"] = args.dir
+    if args.url:
+        os.environ["RMA_SHEET_URL"] = args.url
+    uvicorn.run("rma_api:create_app", factory=True, host=args.host, port=args.port, workers=args.workers)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,254 @@
+"""
+Trả lời hàng loạt câu hỏi từ file JSONL (mỗi dòng một object có "question").
+
+    python rma_batch.py questions.jsonl -o answers.jsonl [--csv data.csv | --dir branches/] [--no-llm]
+
+Câu trả lời được bằng intent nội bộ hoặc cache thì xử lý ngay; các câu còn lại gửi
+OpenAI đồng thời (asyncio, giới hạn --concurrency và --rpm). Mỗi dòng kết quả có
+đường đi (intent/cache/llm), độ trễ và lỗi nếu có. Dòng đầu vào có "expected_intent"
+thì được so với intent nhận dạng được (dùng để kiểm tra hồi quy). Dòng hỏng (JSON sai,
+thiếu trường câu hỏi) được báo kèm số dòng và ghi ra với path "invalid".
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+from collections import Counter
+from dotenv import load_dotenv
+
+from intent_handler import parse_intent
+from rma_ai import AIQuery
+from rma_utils import percentile
+
+DEFAULT_CONCURRENCY = 4
+DEFAULT_RPM = 60
+
+
+class RateLimiter:
+    """
+    Giới hạn số request mỗi phút: các lần gọi wait() cách nhau ít nhất 60/rpm giây
+    """
+
+    def __init__(self, rpm):
+        self.interval = 60.0 / rpm if rpm else 0.0
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self):
+        if not self.interval:
+            return
+        async with self._lock:
+            now = time.monotonic()
+            delay = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+def _parse_line(line, field):
+    """
+    (item, lỗi) cho một dòng JSONL; lỗi là None nếu dòng hợp lệ
+    """
+    try:
+        item = json.loads(line)
+    except json.JSONDecodeError as e:
+        return {}, f"JSON không hợp lệ: {e.msg} (cột {e.colno})"
+    if isinstance(item, str):
+        item = {field: item}
+    if not isinstance(item, dict):
+        return {}, f"Mỗi dòng phải là object hoặc chuỗi, không phải {type(item).__name__}"
+    question = item.get(field)
+    if not isinstance(question, str) or not question.strip():
+        return item, f'Thiếu trường "{field}" (chọn trường khác bằng --field)'
+    return item, None
+
+
+def read_questions(path, field="question"):
+    """
+    Đọc file câu hỏi. Dòng hỏng (JSON sai, thiếu trường `field`) không làm dừng cả lô:
+    item có thêm "error" và được ghi ra thành bản ghi lỗi, kèm "line" là số dòng
+    """
+    items = []
+    with open(path, encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            item, error = _parse_line(line, field)
+            item.setdefault("id", item.get("request_id", line_no))
+            item["line"] = line_no
+            if error is not None:
+                item["error"] = error
+            items.append(item)
+    return items
+
+
+def _invalid_record(item, field):
+    return {
+        "id": item["id"],
+        "line": item["line"],
+        "question": item.get(field),
+        "path": "invalid",
+        "intent": None,
+        "answer": None,
+        "ok": False,
+        "error": item["error"],
+        "latency_ms": 0.0,
+        "queue_ms": 0.0,
+    }
+
+
+def _record(item, query, field, latency_ms, queue_ms=0.0, answer=None):
+    intent = parse_intent(item[field]).name
+    answer = query.answer if answer is None else answer
+    record = {
+        "id": item["id"],
+        "line": item.get("line"),
+        "question": item[field],
+        "path": query.source or "unanswered",
+        "intent": intent,
+        "answer": answer,
+        "ok": query.error is None and query.source is not None,
+        "error": query.error,
+        "latency_ms": round(latency_ms, 1),
+        "queue_ms": round(queue_ms, 1),
+    }
+    if "expected_intent" in item:
+        record["intent_ok"] = intent == item["expected_intent"]
+    return record
+
+
+async def run_batch(items, dataset, api_key=None, model="gpt-3.5-turbo", field="question",
+                    concurrency=DEFAULT_CONCURRENCY, rpm=DEFAULT_RPM, use_llm=True, use_cache=True,
+                    token_budget=None):
+    """
+    Trả về danh sách kết quả theo đúng thứ tự đầu vào
+    """
+    results = [None] * len(items)
+    pending = {}
+    # Bước 1: cache + intent nội bộ (nhanh, không cần mạng). Các câu trùng khoá cache
+    # trong cùng lô chỉ gửi OpenAI một lần, các câu sau dùng lại kết quả như cache.
+    for index, item in enumerate(items):
+        if "error" in item:
+            results[index] = _invalid_record(item, field)
+            continue
+        started = time.perf_counter()
+        query = AIQuery(item[field], dataset.data, dataset.raw, model, use_cache=use_cache, token_budget=token_budget)
+        if query.needs_llm and use_llm:
+            pending.setdefault(query.key or index, []).append((index, item, query))
+        else:
+            results[index] = _record(item, query, field, (time.perf_counter() - started) * 1000)
+
+    # Bước 2: các câu cần LLM chạy đồng thời có giới hạn
+    semaphore = asyncio.Semaphore(concurrency)
+    limiter = RateLimiter(rpm)
+
+    async def ask(group):
+        (index, item, query), duplicates = group[0], group[1:]
+        queued = time.perf_counter()
+        async with semaphore:
+            await limiter.wait()
+            started = time.perf_counter()
+            answer, _ = await asyncio.to_thread(query.ask, api_key)
+        finished = time.perf_counter()
+        results[index] = _record(item, query, field, (finished - started) * 1000, (started - queued) * 1000, answer)
+        for index, item, duplicate in duplicates:
+            if query.error is None:
+                duplicate.source = "cache"
+            else:
+                duplicate.source, duplicate.error = query.source, query.error
+            results[index] = _record(item, duplicate, field, 0.0, (finished - queued) * 1000, answer)
+
+    await asyncio.gather(*(ask(group) for group in pending.values()))
+    return results
+
+
+def summarize(results, wall_s):
+    valid = [r for r in results if r["path"] != "invalid"]
+    latencies = [r["latency_ms"] for r in valid]
+    llm = [r["latency_ms"] for r in valid if r["path"] == "llm"]
+    summary = {
+        "items": len(results),
+        "paths": dict(Counter(r["path"] for r in results)),
+        "intents": dict(Counter(r["intent"] for r in valid)),
+        "intent_coverage": round(sum(r["intent"] != "unknown" for r in valid) / len(valid), 3) if valid else None,
+        "errors": sum(not r["ok"] and r["path"] != "unanswered" for r in results),
+        "latency_ms_p50": percentile(latencies, 0.5),
+        "latency_ms_p95": percentile(latencies, 0.95),
+        "llm_latency_ms_p50": percentile(llm, 0.5),
+        "llm_latency_ms_p95": percentile(llm, 0.95),
+        "wall_s": round(wall_s, 2),
+    }
+    invalid = [r["line"] for r in results if r["path"] == "invalid"]
+    if invalid:
+        summary["invalid_lines"] = invalid
+    checked = [r for r in results if "intent_ok" in r]
+    if checked:
+        summary["intent_mismatches"] = [r["id"] for r in checked if not r["intent_ok"]]
+    return summary
+
+
+def load_dataset(csv_path=None, data_dir=None):
+    if data_dir:
+        from rma_ingest import IngestLoader
+        return IngestLoader(data_dir).get()
+    if csv_path:
+        from rma_data import load_csv_dataset
+        return load_csv_dataset(csv_path)
+    from rma_data import SheetLoader, GOOGLE_SHEET_URL
+    from rma_snapshot import SnapshotStore
+    return SheetLoader(GOOGLE_SHEET_URL, snapshot=SnapshotStore()).get()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Trả lời hàng loạt câu hỏi RMA từ file JSONL")
+    parser.add_argument("input", help="File JSONL câu hỏi")
+    parser.add_argument("-o", "--output", help="File JSONL kết quả (mặc định: stdout)")
+    parser.add_argument("--csv", help="Đọc dữ liệu từ file CSV thay vì Google Sheet")
+    parser.add_argument("--dir", help="Gộp các file .xlsx/.csv trong thư mục hoặc manifest thay vì Google Sheet")
+    parser.add_argument("--field", default="question", help="Tên trường chứa câu hỏi")
+    parser.add_argument("--model", default="gpt-3.5-turbo")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY)
+    parser.add_argument("--rpm", type=int, default=DEFAULT_RPM, help="Số request OpenAI tối đa mỗi phút (0 = không giới hạn)")
+    parser.add_argument("--budget", type=int, help="Ngân sách token dữ liệu trong prompt")
+    parser.add_argument("--no-llm", action="store_true", help="Chỉ trả lời bằng intent/cache, không gọi OpenAI")
+    parser.add_argument("--no-cache", action="store_true")
+    args = parser.parse_args(argv)
+
+    load_dotenv()
+    items = read_questions(args.input, args.field)
+    for item in items:
+        if "error" in item:
+            print(f"{args.input}:{item['line']}: {item['error']}", file=sys.stderr)
+    # Không còn câu hợp lệ nào thì không cần tải dữ liệu
+    dataset = load_dataset(args.csv, args.dir) if any("error" not in item for item in items) else None
+
+    started = time.perf_counter()
+    results = asyncio.run(run_batch(
+        items, dataset,
+        api_key=os.getenv("OPENAI_API_KEY"),
+        model=args.model,
+        field=args.field,
+        concurrency=args.concurrency,
+        rpm=args.rpm,
+        use_llm=not args.no_llm,
+        use_cache=not args.no_cache,
+        token_budget=args.budget,
+    ))
+    summary = summarize(results, time.perf_counter() - started)
+
+    out = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    try:
+        for record in results:
+            out.write(json.dumps(record, ensure_ascii=False) + "\n")
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    print(json.dumps(summary, ensure_ascii=False, indent=2), file=sys.stderr)
+    return 1 if summary.get("intent_mismatches") or summary.get("invalid_lines") else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
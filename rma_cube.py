@@ -0,0 +1,150 @@
+import copy
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+from rma_utils import column_index
+from rma_filters import TIME_COLS, VALUE_FILTERS
+
+# Các chiều của cube (key COLUMN_MAPPING hoặc cột thời gian) và từ khoá cột trạng thái
+CUBE_DIMENSIONS = ["Năm", "Quý", "Tháng", "Nhóm hàng", "Tên khách hàng", "Sản phẩm", "Kỹ thuật viên", "Tên lỗi"]
+STATUS_MEASURES = {
+    "ok": "đã sửa xong",
+    "fail": "không sửa được",
+    "tcbh": "từ chối bảo hành",
+}
+MEASURES = ["ok", "fail", "tcbh", "total"]
+
+CUBE_CACHE_SIZE = 8
+_cube_cache = OrderedDict()
+_cube_lock = threading.Lock()
+
+
+class RMACube:
+    """
+    Bảng tổng hợp sẵn số lượt ok/fail/tcbh/total theo (Năm, Quý, Tháng, Nhóm hàng,
+    khách hàng, sản phẩm, KTV, lỗi). Các báo cáo tab 3 chỉ cần cộng dồn (roll-up)
+    trên bảng này thay vì groupby/value_counts lại trên toàn bộ dòng dữ liệu.
+    """
+
+    def __init__(self, df, colmap=None):
+        colmap = colmap or column_index(df.columns)
+        self.dims = []
+        for key in CUBE_DIMENSIONS:
+            col = key if key in df.columns else colmap.canonical.get(key)
+            if col and col not in self.dims:
+                self.dims.append(col)
+        self.status_cols = {m: colmap.get(kw) for m, kw in STATUS_MEASURES.items()}
+        self.colmap = colmap
+        self.rows = len(df)
+        col_date = colmap.get("ngày tiếp nhận")
+        dates = df[col_date] if col_date and pd.api.types.is_datetime64_any_dtype(df[col_date]) else None
+        self.date_span = (dates.min(), dates.max()) if dates is not None and dates.notna().any() else (None, None)
+
+        facts = pd.DataFrame({col: df[col] for col in self.dims})
+        for measure, col in self.status_cols.items():
+            if col:
+                facts[measure] = (df[col] == 1).to_numpy(dtype=np.int64, na_value=0)
+            else:
+                facts[measure] = 0
+        facts["total"] = 1
+        if self.dims:
+            self.table = facts.groupby(self.dims, observed=True, dropna=False, sort=False)[MEASURES].sum().reset_index()
+        else:
+            self.table = facts[MEASURES].sum().to_frame().T
+
+    def has(self, *cols):
+        return all(col is not None and col in self.dims for col in cols)
+
+    @property
+    def has_status(self):
+        return all(self.status_cols.values())
+
+    def _slice(self, where):
+        table = self.table
+        if where:
+            mask = np.ones(len(table), dtype=bool)
+            for col, value in where.items():
+                if isinstance(value, (list, tuple, set, frozenset)):
+                    mask &= table[col].isin(value).to_numpy(dtype=bool, na_value=False)
+                else:
+                    mask &= (table[col] == value).to_numpy(dtype=bool, na_value=False)
+            table = table[mask]
+        return table
+
+    def restrict(self, where):
+        """
+        Cube con chỉ gồm các ô thoả `where` ({cột: giá trị hoặc list giá trị}), trả lời
+        như một cube dựng trên các dòng đã lọc tương ứng
+        """
+        cube = copy.copy(self)
+        cube.table = self._slice(where)
+        cube.rows = int(cube.table["total"].sum())
+        return cube
+
+    def rollup(self, by, where=None):
+        """
+        Cộng dồn các measure theo danh sách cột `by` (đã lọc bằng `where` = {cột: giá trị})
+        """
+        table = self._slice(where)
+        if not by:
+            return table[MEASURES].sum()
+        return table.groupby(list(by), observed=True)[MEASURES].sum()
+
+    def top(self, col, measure="total", where=None, top_n=None):
+        """
+        Tương đương value_counts().head(top_n) trên dữ liệu gốc
+        """
+        counts = self.rollup([col], where)[measure]
+        counts = counts[counts > 0].sort_values(ascending=False, kind="stable")
+        return counts.head(top_n) if top_n else counts
+
+
+def get_cube(df, key=None, colmap=None):
+    """
+    Cube cho df, nhớ lại theo `key` (phiên bản dữ liệu của frame gốc) để chỉ build một lần
+    """
+    if key is None:
+        return RMACube(df, colmap)
+    with _cube_lock:
+        if key in _cube_cache:
+            _cube_cache.move_to_end(key)
+            return _cube_cache[key]
+    cube = RMACube(df, colmap)
+    with _cube_lock:
+        _cube_cache[key] = cube
+        while len(_cube_cache) > CUBE_CACHE_SIZE:
+            _cube_cache.popitem(last=False)
+    return cube
+
+
+def cube_for_spec(cube, spec, colmap=None):
+    """
+    Cube của frame gốc thu hẹp theo `spec` (năm/quý/tháng và các bộ lọc theo giá trị đều
+    là chiều của cube). None khi spec có điều kiện cube không trả lời được — khoảng ngày
+    không phủ hết dữ liệu, từ khoá, cột không có trong cube — báo cáo khi đó tính trên dòng.
+    """
+    if spec.keyword and spec.keyword_field:
+        return None
+    where = {}
+    for values, col in zip((spec.years, spec.months, spec.quarters), TIME_COLS):
+        if values:
+            if col not in cube.dims:
+                return None
+            where[col] = tuple(values)
+    for field, keyword in VALUE_FILTERS.items():
+        values = getattr(spec, field)
+        if values:
+            col = (colmap or cube.colmap).get(keyword)
+            if not cube.has(col):
+                return None
+            where[col] = tuple(values)
+    if spec.date_from is not None or spec.date_to is not None:
+        # Khoảng ngày phủ hết dữ liệu chỉ loại các dòng không có ngày (Năm trống)
+        low, high = cube.date_span
+        covered = low is not None and (spec.date_from is None or pd.to_datetime(spec.date_from) <= low) \
+            and (spec.date_to is None or pd.to_datetime(spec.date_to) >= high)
+        if not covered or TIME_COLS[0] not in cube.dims:
+            return None
+        where.setdefault(TIME_COLS[0], tuple(cube.table[TIME_COLS[0]].dropna().unique()))
+    return cube.restrict(where) if where else cube
@@ -0,0 +1,329 @@
+import io
+import os
+import csv
+import time
+import hashlib
+import threading
+import pandas as pd
+import requests
+from rma_utils import ensure_time_columns, apply_schema
+from rma_ai import chuan_hoa_ten_cot
+from rma_turnaround import add_turnaround_column
+
+GOOGLE_SHEET_URL = "https://docs.google.com/spreadsheets/d/1fWFLZWyCAXn_B8jcZ0oY4KhJ8krbLPsH/export?format=csv"
+
+# Thời gian (giây) dùng lại bản dữ liệu đã tải trước khi hỏi lại Google Sheet
+DEFAULT_TTL = int(os.getenv("RMA_DATA_TTL", "300"))
+FETCH_TIMEOUT = int(os.getenv("RMA_FETCH_TIMEOUT", "30"))
+# Chỉ parse các dòng mới/đã sửa thay vì parse lại toàn bộ lịch sử
+INCREMENTAL_SYNC = os.getenv("RMA_INCREMENTAL_SYNC", "1") == "1"
+
+
+def parse_sheet_csv(content, date_formats=None):
+    """
+    Parse nội dung CSV (bytes) của Google Sheet thành DataFrame đã có cột Năm/Tháng/Quý,
+    cột số ngày xử lý và đã ép kiểu gọn theo COLUMN_DTYPES. Trả về (df, báo cáo schema).
+    `date_formats` ({cột: định dạng}) ép định dạng ngày thay vì đoán trên chính nội dung;
+    định dạng đã dùng nằm ở df.attrs["date_formats"].
+    """
+    df = pd.read_csv(io.StringIO(content.decode("utf-8")))
+    df.columns = [col.strip() for col in df.columns]
+    df.attrs["date_formats"] = dict(date_formats or {})
+    df, report = apply_schema(ensure_time_columns(df))
+    return add_turnaround_column(df), report
+
+
+def split_sheet_records(content):
+    """
+    Tách CSV thành header + danh sách dòng (bỏ dòng trống giống pd.read_csv)
+    """
+    reader = csv.reader(io.StringIO(content.decode("utf-8")))
+    header = next(reader, [])
+    records = [rec for rec in reader if rec]
+    return [col.strip() for col in header], records
+
+
+def hash_records(records):
+    """
+    Hash ổn định (uint64) cho từng dòng, dùng để nhận ra dòng đã có trong bản trước
+    """
+    lines = pd.Series(["\x1f".join(rec) for rec in records], dtype=object)
+    return pd.util.hash_pandas_object(lines, index=False).to_numpy()
+
+
+def _records_to_csv(header, records):
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(header)
+    writer.writerows(records)
+    return buf.getvalue().encode("utf-8")
+
+
+def _concat_delta(base, delta):
+    # Phần delta nhỏ có thể bị pandas đoán kiểu khác (vd cột toàn trống → float),
+    # cột category phải gộp danh mục trước khi nối để không rơi về object
+    for col in delta.columns:
+        if col not in base.columns:
+            continue
+        base_dtype = base[col].dtype
+        if isinstance(base_dtype, pd.CategoricalDtype):
+            new_values = pd.Index(delta[col].dropna().unique()).difference(base_dtype.categories)
+            if len(new_values):
+                base = base.assign(**{col: base[col].cat.add_categories(new_values)})
+            delta[col] = pd.Categorical(delta[col], categories=base[col].cat.categories)
+        elif delta[col].dtype != base_dtype:
+            try:
+                delta[col] = delta[col].astype(base_dtype)
+            except (TypeError, ValueError):
+                pass
+    return pd.concat([base, delta], ignore_index=True)
+
+
+def merge_sheet_delta(prev_data, prev_header, prev_hashes, header, records, hashes):
+    """
+    Ghép bản mới từ các dòng đã parse của bản trước + các dòng mới/đã sửa.
+    Trả về (frame, số dòng parse mới) hoặc None nếu phải parse lại toàn bộ.
+    """
+    # Bản trước không ghi định dạng ngày thì không parse được dòng mới giống hệt cả sheet
+    date_formats = prev_data.attrs.get("date_formats")
+    if prev_header != header or len(prev_hashes) != len(prev_data) or date_formats is None:
+        return None
+
+    # Dòng trùng nội dung được ghép theo thứ tự xuất hiện (hash, lần thứ k)
+    positions = {}
+    for pos, h in enumerate(prev_hashes.tolist()):
+        positions.setdefault(h, []).append(pos)
+    taken = {}
+    order = []
+    delta_records = []
+    n_prev = len(prev_data)
+    for rec, h in zip(records, hashes.tolist()):
+        k = taken.get(h, 0)
+        pos_list = positions.get(h)
+        if pos_list is not None and k < len(pos_list):
+            order.append(pos_list[k])
+            taken[h] = k + 1
+        else:
+            order.append(n_prev + len(delta_records))
+            delta_records.append(rec)
+
+    if not delta_records and order == list(range(n_prev)):
+        return prev_data, 0
+
+    merged = prev_data
+    if delta_records:
+        # Vài dòng mới tự đoán định dạng ngày có thể ra khác cả sheet (05/02 → mm/dd)
+        delta, _ = parse_sheet_csv(_records_to_csv(header, delta_records), date_formats)
+        merged = _concat_delta(prev_data, delta)
+        merged.attrs["date_formats"] = delta.attrs["date_formats"]
+    # Trường hợp phổ biến: chỉ thêm dòng ở cuối sheet → không cần sắp lại
+    if order != list(range(len(merged))):
+        merged = merged.take(order).reset_index(drop=True)
+    return merged, len(delta_records)
+
+
+def read_google_sheet(url):
+    response = requests.get(url, timeout=FETCH_TIMEOUT)
+    response.raise_for_status()
+    df, _ = parse_sheet_csv(response.content)
+    return df
+
+
+def load_csv_dataset(path):
+    """
+    RMADataset từ file CSV xuất từ sheet (chạy offline: batch, benchmark, API)
+    """
+    with open(path, "rb") as f:
+        content = f.read()
+    data, report = parse_sheet_csv(content)
+    return RMADataset(data, hashlib.sha1(content).hexdigest()[:12], schema_report=report)
+
+
+class RMADataset:
+    """
+    Một phiên bản dữ liệu đã parse, dùng chung cho mọi phiên Streamlit.
+    `data` giữ tên cột gốc, `raw` là bản chuan_hoa_ten_cot tạo từ cùng một frame.
+    """
+
+    def __init__(self, data, version, etag=None, last_modified=None, header=None, row_hashes=None,
+                 schema_report=None):
+        self.data = data
+        self.version = version
+        # Các frame con (lọc, đổi tên cột) mang theo version để cache theo phiên bản dữ liệu
+        self.data.attrs["version"] = version
+        self.header = header
+        self.row_hashes = row_hashes
+        self.schema_report = schema_report
+        self.etag = etag
+        self.last_modified = last_modified
+        self.loaded_at = time.time()
+        self._raw = None
+        self._lock = threading.Lock()
+
+    @property
+    def raw(self):
+        if self._raw is None:
+            with self._lock:
+                if self._raw is None:
+                    self._raw = chuan_hoa_ten_cot(self.data)
+        return self._raw
+
+    @property
+    def age(self):
+        return time.time() - self.loaded_at
+
+
+class SheetLoader:
+    """
+    Tải Google Sheet một lần, dùng lại trong `ttl` giây, sau đó hỏi lại bằng
+    ETag/Last-Modified. Nếu sheet không đổi (304 hoặc cùng nội dung) thì giữ nguyên frame cũ.
+    """
+
+    def __init__(self, url=GOOGLE_SHEET_URL, ttl=DEFAULT_TTL, timeout=FETCH_TIMEOUT, incremental=INCREMENTAL_SYNC,
+                 snapshot=None):
+        self.url = url
+        self.ttl = ttl
+        self.timeout = timeout
+        self.incremental = incremental
+        self.snapshot = snapshot
+        self.dataset = None
+        self.last_error = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self._session = requests.Session()
+        self._stats = {
+            "hits": 0,
+            "misses": 0,
+            "revalidated": 0,
+            "fetches": 0,
+            "errors": 0,
+            "fetch_ms_last": 0.0,
+            "fetch_ms_total": 0.0,
+            "full_parses": 0,
+            "incremental_syncs": 0,
+            "rows_parsed_last": 0,
+            "snapshot_loads": 0,
+            "snapshot_saves": 0,
+            "snapshot_errors": 0,
+        }
+
+    def get(self, force=False):
+        if not force and self._fresh():
+            self._stats["hits"] += 1
+            return self.dataset
+        with self._lock:
+            if self.dataset is None and self.snapshot is not None:
+                self._restore_snapshot()
+            # Một phiên khác có thể vừa tải xong trong lúc chờ lock
+            if not force and self._fresh():
+                self._stats["hits"] += 1
+                return self.dataset
+            self._stats["misses"] += 1
+            try:
+                self._refresh()
+                self.last_error = None
+            except Exception as e:
+                self._stats["errors"] += 1
+                self.last_error = e
+                if self.dataset is None:
+                    raise
+            finally:
+                self._checked_at = time.time()
+        return self.dataset
+
+    def _restore_snapshot(self):
+        loaded = self.snapshot.load()
+        if loaded is None:
+            return
+        data, meta, row_hashes = loaded
+        data.attrs["date_formats"] = meta.get("date_formats", {})
+        self.dataset = RMADataset(data, meta["version"], meta.get("etag"), meta.get("last_modified"),
+                                  meta.get("header"), row_hashes, meta.get("schema_report"))
+        self.dataset.loaded_at = meta["saved_at"]
+        # Snapshot còn trong TTL thì phục vụ luôn, không cần hỏi lại sheet
+        self._checked_at = meta["saved_at"]
+        self._stats["snapshot_loads"] += 1
+
+    def _save_snapshot(self):
+        try:
+            self.snapshot.save(self.dataset)
+            self._stats["snapshot_saves"] += 1
+        except OSError:
+            # Không ghi được snapshot thì vẫn phục vụ bản trong bộ nhớ
+            self._stats["snapshot_errors"] += 1
+
+    def _fresh(self):
+        return self.dataset is not None and time.time() - self._checked_at < self.ttl
+
+    def _refresh(self):
+        headers = {}
+        if self.dataset is not None:
+            if self.dataset.etag:
+                headers["If-None-Match"] = self.dataset.etag
+            if self.dataset.last_modified:
+                headers["If-Modified-Since"] = self.dataset.last_modified
+
+        start = time.perf_counter()
+        response = self._session.get(self.url, headers=headers, timeout=self.timeout)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        self._stats["fetches"] += 1
+        self._stats["fetch_ms_last"] = elapsed_ms
+        self._stats["fetch_ms_total"] += elapsed_ms
+
+        if response.status_code == 304 and self.dataset is not None:
+            self._stats["revalidated"] += 1
+            return
+        response.raise_for_status()
+
+        content = response.content
+        version = hashlib.sha1(content).hexdigest()[:12]
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+        if self.dataset is not None and self.dataset.version == version:
+            self._stats["revalidated"] += 1
+            self.dataset.etag = etag
+            self.dataset.last_modified = last_modified
+            return
+
+        self.dataset = self._build(content, version, etag, last_modified)
+        if self.snapshot is not None:
+            self._save_snapshot()
+
+    def _build(self, content, version, etag, last_modified):
+        if not self.incremental:
+            self._stats["full_parses"] += 1
+            data, report = parse_sheet_csv(content)
+            self._stats["rows_parsed_last"] = len(data)
+            return RMADataset(data, version, etag, last_modified, schema_report=report)
+
+        header, records = split_sheet_records(content)
+        hashes = hash_records(records)
+        prev = self.dataset
+        if prev is not None and prev.row_hashes is not None:
+            merged = merge_sheet_delta(prev.data, prev.header, prev.row_hashes, header, records, hashes)
+            if merged is not None:
+                data, n_parsed = merged
+                self._stats["incremental_syncs"] += 1
+                self._stats["rows_parsed_last"] = n_parsed
+                return RMADataset(data, version, etag, last_modified, header, hashes, prev.schema_report)
+
+        self._stats["full_parses"] += 1
+        data, report = parse_sheet_csv(content)
+        self._stats["rows_parsed_last"] = len(data)
+        # Số dòng csv.reader và pd.read_csv phải khớp thì mới theo dõi được từng dòng
+        row_hashes = hashes if len(hashes) == len(data) else None
+        return RMADataset(data, version, etag, last_modified, header, row_hashes, report)
+
+    def stats(self):
+        s = dict(self._stats)
+        lookups = s["hits"] + s["misses"]
+        s["hit_rate"] = round(s["hits"] / lookups, 3) if lookups else 0.0
+        s["fetch_ms_avg"] = round(s["fetch_ms_total"] / s["fetches"], 1) if s["fetches"] else 0.0
+        if self.dataset is not None:
+            s["version"] = self.dataset.version
+            s["age_s"] = round(self.dataset.age, 1)
+            s["rows"] = len(self.dataset.data)
+            if self.dataset.schema_report:
+                s["memory_mb_before"] = round(self.dataset.schema_report["memory_before"] / 2**20, 2)
+                s["memory_mb_after"] = round(self.dataset.schema_report["memory_after"] / 2**20, 2)
+        return s
@@ -0,0 +1,184 @@
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+from rma_utils import fold_for_match
+
+RESOLVER_CACHE_SIZE = 8
+# Ngưỡng điểm (0–1) để chấp nhận một kết quả dò gần đúng
+MIN_SCORE = 0.6
+
+_resolver_cache = OrderedDict()
+_resolver_lock = threading.Lock()
+
+
+def _grams(text):
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def edit_distance(a, b, limit=None):
+    """
+    Khoảng cách Levenshtein; dừng sớm khi chắc chắn vượt `limit`
+    """
+    if len(a) < len(b):
+        a, b = b, a
+    if limit is not None and len(a) - len(b) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        if limit is not None and min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+
+class EntityResolver:
+    """
+    Dò tên khách hàng/sản phẩm gần đúng trên từ điển giá trị phân biệt: khớp khoá
+    đã bỏ dấu → khớp cụm từ → trigram + edit distance. Kết quả được nhớ lại.
+    """
+
+    def __init__(self, values, counts=None):
+        self.values = [str(v) for v in values]
+        self.counts = list(counts) if counts is not None else [0] * len(self.values)
+        self.keys = [fold_for_match(v) for v in self.values]
+        self.exact = {}
+        self.words = {}
+        self.grams = {}
+        for value_id, key in enumerate(self.keys):
+            self.exact.setdefault(key, value_id)
+            for word in set(key.split()):
+                self.words.setdefault(word, set()).add(value_id)
+            for gram in _grams(key):
+                self.grams.setdefault(gram, []).append(value_id)
+        self._cache = {}
+
+    @classmethod
+    def from_series(cls, series):
+        counts = series.value_counts()
+        counts = counts[counts > 0]
+        return cls(counts.index, counts.values)
+
+    def resolve(self, text):
+        """
+        Trả về (giá trị chuẩn, điểm) hoặc None nếu không tìm được tên đủ giống
+        """
+        match = self.resolve_all(text)
+        return (match[0][0], match[1]) if match else None
+
+    def resolve_all(self, text):
+        """
+        Mọi giá trị cùng trỏ tới tên trong câu hỏi (các cách viết, chi nhánh: "phong vu"
+        → "Phong Vũ", "Công ty TNHH Phong Vũ Hà Nội"…), gửi nhiều nhất trước.
+        Trả về (tuple giá trị, điểm) hoặc None nếu không tìm được tên đủ giống.
+        """
+        if not text:
+            return None
+        key = fold_for_match(text)
+        if key not in self._cache:
+            self._cache[key] = self._resolve(key)
+        return self._cache[key]
+
+    def _block(self, words):
+        # Giá trị chứa trọn cụm từ liền kề `words` ("phong vu" trong "cong ty phong vu")
+        word_sets = sorted((self.words.get(w, set()) for w in words), key=len)
+        candidates = set.intersection(*word_sets) if word_sets else set()
+        block = []
+        for value_id in candidates:
+            value_words = self.keys[value_id].split()
+            for i in range(len(value_words) - len(words) + 1):
+                if value_words[i:i + len(words)] == words:
+                    block.append(value_id)
+                    break
+        return block
+
+    def _values(self, value_ids, key):
+        # Tên viết đúng như câu hỏi đứng đầu, sau đó theo số lượt gửi
+        ranked = sorted(value_ids, key=lambda i: (self.keys[i] != key, -self.counts[i], len(self.keys[i])))
+        return tuple(self.values[i] for i in ranked)
+
+    def _resolve(self, key):
+        if not key:
+            return None
+        words = key.split()
+        block = self._block(words)
+        if block:
+            return self._values(block, key), 1.0 if key in self.exact else 0.9
+
+        # Dò lỗi chính tả: ứng viên chung nhiều trigram, chấm lại bằng edit distance
+        query_grams = _grams(key)
+        shared = {}
+        for gram in query_grams:
+            for value_id in self.grams.get(gram, ()):
+                shared[value_id] = shared.get(value_id, 0) + 1
+        candidates = sorted(shared, key=lambda i: shared[i], reverse=True)[:20]
+        best = None
+        for value_id in candidates:
+            # So với cả tên lẫn từng cụm liền kề cùng số từ ("phog vuu" ~ "phong vu")
+            value_words = self.keys[value_id].split()
+            windows = {self.keys[value_id]}
+            windows.update(" ".join(value_words[i:i + len(words)])
+                           for i in range(len(value_words) - len(words) + 1))
+            for window in windows:
+                limit = max(len(key), len(window)) // 3
+                distance = edit_distance(key, window, limit)
+                if distance > limit:
+                    continue
+                score = 1 - distance / max(len(key), len(window))
+                if best is None or score > best[1]:
+                    best = (window, score)
+        if best is None or best[1] < MIN_SCORE:
+            return None
+        # Cụm đã sửa chính tả lại gom mọi tên chứa nó, như khi gõ đúng
+        window, score = best
+        return self._values(self._block(window.split()), window), score
+
+    def resolve_name(self, text):
+        match = self.resolve(text)
+        return match[0] if match else None
+
+
+def get_resolver(df, col):
+    """
+    EntityResolver cho cột `col`, nhớ lại theo phiên bản dữ liệu (df.attrs["version"])
+    """
+    version = df.attrs.get("version")
+    if version is None:
+        return EntityResolver.from_series(df[col])
+    key = (version, col, len(df))
+    with _resolver_lock:
+        if key in _resolver_cache:
+            _resolver_cache.move_to_end(key)
+            return _resolver_cache[key]
+    resolver = EntityResolver.from_series(df[col])
+    with _resolver_lock:
+        _resolver_cache[key] = resolver
+        while len(_resolver_cache) > RESOLVER_CACHE_SIZE:
+            _resolver_cache.popitem(last=False)
+    return resolver
+
+
+def equals_mask(series, value):
+    """
+    Mask bằng nhau; với cột category chỉ so sánh mã số nguyên
+    """
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        categories = series.cat.categories
+        if value not in categories:
+            return pd.Series(False, index=series.index)
+        return series.cat.codes == categories.get_loc(value)
+    return series == value
+
+
+def isin_mask(series, values):
+    """
+    Mask thuộc tập `values`; với cột category chỉ so sánh mã số nguyên
+    """
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        codes = series.cat.categories.get_indexer(list(values))
+        return pd.Series(np.isin(series.cat.codes.to_numpy(), codes[codes >= 0]), index=series.index)
+    return series.isin(values)
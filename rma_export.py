@@ -0,0 +1,203 @@
+import os
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+import pandas as pd
+import xlsxwriter
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow không có → không xuất Parquet
+    pa = None
+    pq = None
+
+EXPORT_DIR = os.getenv("RMA_EXPORT_DIR", os.path.join(".rma_cache", "exports"))
+EXPORT_CACHE_SIZE = int(os.getenv("RMA_EXPORT_CACHE_SIZE", "32"))
+# Số dòng mỗi lượt ghi: chỉ một khúc được chuyển sang đối tượng Python cùng lúc
+CHUNK_ROWS = 50_000
+# Giới hạn dòng của một sheet Excel (trừ dòng tiêu đề)
+XLSX_MAX_ROWS = 1_048_575
+
+# Định dạng xuất: tên → (nhãn nút, đuôi file, MIME)
+FORMATS = {
+    "xlsx": ("📥 Excel", "xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+    "csv": ("📄 CSV", "csv", "text/csv"),
+    "parquet": ("🗂️ Parquet", "parquet", "application/vnd.apache.parquet"),
+}
+
+
+def available_formats():
+    return [fmt for fmt in FORMATS if fmt != "parquet" or pq is not None]
+
+
+def _chunks(df, size=CHUNK_ROWS):
+    for start in range(0, len(df), size):
+        yield df.iloc[start:start + size]
+
+
+def _cells(series):
+    """
+    Giá trị của một cột dạng đối tượng Python cho xlsxwriter; ô trống/NaN/NaT → None
+    """
+    values = series.astype(object).to_numpy(copy=True)
+    values[series.isna().to_numpy()] = None
+    return values
+
+
+def write_xlsx(df, path, sheet_name="RMA_Report"):
+    """
+    Ghi xlsx ở chế độ constant_memory: từng dòng được xả ra file tạm của xlsxwriter
+    ngay khi ghi, bộ nhớ không tăng theo số dòng. Quá giới hạn dòng thì sang sheet mới.
+    """
+    workbook = xlsxwriter.Workbook(path, {
+        "constant_memory": True,
+        "default_date_format": "dd/mm/yyyy",
+        "strings_to_urls": False,
+    })
+    header_format = workbook.add_format({"bold": True})
+    columns = [str(c) for c in df.columns]
+    try:
+        n_sheets = max(1, -(-len(df) // XLSX_MAX_ROWS))
+        for sheet_no in range(n_sheets):
+            name = sheet_name if n_sheets == 1 else f"{sheet_name}_{sheet_no + 1}"
+            worksheet = workbook.add_worksheet(name[:31])
+            worksheet.write_row(0, 0, columns, header_format)
+            part = df.iloc[sheet_no * XLSX_MAX_ROWS:(sheet_no + 1) * XLSX_MAX_ROWS]
+            row = 1
+            for chunk in _chunks(part):
+                for values in zip(*(_cells(chunk[col]) for col in chunk.columns)):
+                    worksheet.write_row(row, 0, values)
+                    row += 1
+    finally:
+        workbook.close()
+
+
+def write_csv(df, path):
+    # utf-8-sig để Excel mở đúng tiếng Việt
+    with open(path, "w", encoding="utf-8-sig", newline="") as f:
+        for i, chunk in enumerate(_chunks(df)):
+            chunk.to_csv(f, index=False, header=i == 0)
+
+
+def write_parquet(df, path):
+    if pq is None:
+        raise RuntimeError("Cần cài pyarrow để xuất Parquet")
+    df = df.rename(columns=str)
+    schema = pa.Schema.from_pandas(df, preserve_index=False)
+    with pq.ParquetWriter(path, schema) as writer:
+        for chunk in _chunks(df):
+            writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+
+
+WRITERS = {"xlsx": write_xlsx, "csv": write_csv, "parquet": write_parquet}
+
+
+def content_digest(df):
+    """
+    Băm nội dung frame (giá trị + bộ cột), dùng làm một phần khoá artifact
+    """
+    digest = hashlib.sha1("\x1f".join(map(str, df.columns)).encode("utf-8"))
+    if len(df):
+        digest.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+class ExportCache:
+    """
+    File xuất đã dựng, lưu trên đĩa theo (phạm vi, định dạng, nội dung). Phạm vi là
+    (truy vấn, bộ lọc, phiên bản dữ liệu) do nơi gọi đưa vào; băm nội dung bảo đảm
+    cùng phạm vi nhưng tham số khác không dùng nhầm file. Tải lại cùng file không
+    phải dựng lại.
+    """
+
+    def __init__(self, directory=EXPORT_DIR, maxsize=EXPORT_CACHE_SIZE):
+        self.directory = directory
+        self.maxsize = maxsize
+        self._paths = OrderedDict()
+        self._building = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.builds = 0
+        self.build_ms = 0.0
+
+    def _key(self, df, fmt, scope):
+        raw = f"{scope!r}|{fmt}|{content_digest(df)}"
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:20]
+
+    def path(self, df, fmt="xlsx", scope=None):
+        """
+        Đường dẫn file `fmt` của `df`, dựng nếu chưa có (mỗi khoá chỉ dựng một lần)
+        """
+        if fmt not in WRITERS:
+            raise ValueError(f"Định dạng không hỗ trợ: {fmt}")
+        key = self._key(df, fmt, scope)
+        path = os.path.join(self.directory, f"{key}.{FORMATS[fmt][1]}")
+        with self._lock:
+            if os.path.exists(path):
+                self.hits += 1
+                self._paths[key] = path
+                self._paths.move_to_end(key)
+                return path
+            building = self._building.setdefault(key, threading.Lock())
+        with building:
+            if not os.path.exists(path):
+                os.makedirs(self.directory, exist_ok=True)
+                started = time.perf_counter()
+                # Ghi file tạm rồi os.replace để không ai đọc phải file ghi dở
+                tmp_path = f"{path}.tmp.{FORMATS[fmt][1]}"
+                WRITERS[fmt](df, tmp_path)
+                os.replace(tmp_path, path)
+                with self._lock:
+                    self.builds += 1
+                    self.build_ms += (time.perf_counter() - started) * 1000
+        with self._lock:
+            self._building.pop(key, None)
+            self._paths[key] = path
+            self._paths.move_to_end(key)
+            evicted = []
+            while len(self._paths) > self.maxsize:
+                evicted.append(self._paths.popitem(last=False)[1])
+        for old in evicted:
+            try:
+                os.remove(old)
+            except OSError:
+                pass
+        return path
+
+    def read(self, df, fmt="xlsx", scope=None):
+        with open(self.path(df, fmt, scope), "rb") as f:
+            return f.read()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "files": len(self._paths),
+                "hits": self.hits,
+                "builds": self.builds,
+                "build_ms": round(self.build_ms, 1),
+            }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_export_cache():
+    """
+    ExportCache dùng chung cho cả tiến trình
+    """
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ExportCache()
+        return _cache
+
+
+def lazy_export(df, fmt="xlsx", scope=None):
+    """
+    Hàm không tham số trả về bytes của file xuất, dùng làm `data` cho st.download_button:
+    file chỉ được dựng khi người dùng bấm tải
+    """
+    return lambda: get_export_cache().read(df, fmt, scope)
@@ -0,0 +1,144 @@
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, replace
+import numpy as np
+import pandas as pd
+from rma_utils import column_index
+
+# Tên cột thời gian do ensure_time_columns tạo (df_raw dùng "nam", "thang", "quy")
+TIME_COLS = ("Năm", "Tháng", "Quý")
+
+# Từ khoá tra cột (qua ColumnMap) cho từng loại bộ lọc theo danh sách giá trị
+VALUE_FILTERS = {
+    "customers": "khách hàng",
+    "products": "sản phẩm",
+    "ktvs": "KTV",
+    "service_types": "loại dịch vụ",
+    "groups": "nhóm hàng",
+}
+
+MASK_CACHE_SIZE = 32
+_mask_cache = OrderedDict()
+_mask_lock = threading.Lock()
+
+
+def _as_tuple(values):
+    if values is None:
+        return ()
+    if isinstance(values, (str, int)):
+        return (values,)
+    return tuple(values)
+
+
+def _contains_mask(series, keyword):
+    keyword = keyword.lower()
+    # Cột category: chỉ so khớp trên danh mục rồi ánh xạ ngược qua codes
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        hits = series.cat.categories.astype(str).str.lower().str.contains(keyword, regex=False)
+        hits = np.append(np.asarray(hits, dtype=bool), False)
+        return hits[series.cat.codes.to_numpy()]
+    return series.astype(str).str.lower().str.contains(keyword, regex=False, na=False).to_numpy(dtype=bool)
+
+
+@dataclass(frozen=True)
+class FilterSpec:
+    """
+    Toàn bộ điều kiện lọc của một lần chạy. Các điều kiện được gộp thành một mask
+    duy nhất rồi áp một lần lên frame gốc, thay vì copy + lọc nối tiếp nhiều lần.
+    """
+    years: tuple = ()
+    months: tuple = ()
+    quarters: tuple = ()
+    date_from: object = None
+    date_to: object = None
+    customers: tuple = ()
+    products: tuple = ()
+    ktvs: tuple = ()
+    service_types: tuple = ()
+    groups: tuple = ()
+    keyword: str = ""
+    keyword_field: str = ""
+
+    @classmethod
+    def build(cls, **kwargs):
+        for key, value in kwargs.items():
+            if key not in ("date_from", "date_to", "keyword", "keyword_field"):
+                kwargs[key] = _as_tuple(value)
+        return cls(**kwargs)
+
+    def with_(self, **kwargs):
+        spec = FilterSpec.build(**kwargs)
+        return replace(self, **{key: getattr(spec, key) for key in kwargs})
+
+    @property
+    def is_empty(self):
+        return self == FilterSpec()
+
+    def mask(self, df, version=None, time_cols=TIME_COLS, colmap=None, search=None):
+        """
+        Mask bool (numpy) cho df. Khi có `version` (phiên bản dữ liệu) thì mask
+        được nhớ lại theo (version, spec) để các lần rerun sau không phải tính lại.
+        `search` là SearchIndex của chính df, dùng cho từ khoá tìm nhanh.
+        """
+        key = None
+        if version is not None:
+            # Giữ tham chiếu tới index để id() không bị tái sử dụng khi entry còn trong cache
+            key = (version, id(df.index), time_cols, search is not None, self)
+            with _mask_lock:
+                entry = _mask_cache.get(key)
+                if entry is not None and entry[0] is df.index:
+                    _mask_cache.move_to_end(key)
+                    return entry[1]
+
+        mask = self._compute(df, time_cols, colmap or column_index(df.columns), search)
+
+        if key is not None:
+            mask.flags.writeable = False
+            with _mask_lock:
+                _mask_cache[key] = (df.index, mask)
+                while len(_mask_cache) > MASK_CACHE_SIZE:
+                    _mask_cache.popitem(last=False)
+        return mask
+
+    def _compute(self, df, time_cols, colmap, search=None):
+        mask = np.ones(len(df), dtype=bool)
+        for values, col in zip((self.years, self.months, self.quarters), time_cols):
+            if values and col in df.columns:
+                mask &= df[col].isin(values).to_numpy(dtype=bool, na_value=False)
+        if self.date_from is not None or self.date_to is not None:
+            col_date = colmap.get("ngày tiếp nhận")
+            if col_date:
+                dates = df[col_date]
+                if self.date_from is not None:
+                    mask &= (dates >= pd.to_datetime(self.date_from)).to_numpy(dtype=bool, na_value=False)
+                if self.date_to is not None:
+                    mask &= (dates <= pd.to_datetime(self.date_to)).to_numpy(dtype=bool, na_value=False)
+        for field, keyword in VALUE_FILTERS.items():
+            values = getattr(self, field)
+            if values:
+                col = colmap.get(keyword)
+                if col:
+                    mask &= df[col].isin(values).to_numpy(dtype=bool, na_value=False)
+        if self.keyword and self.keyword_field:
+            field = search.field_for(self.keyword_field) if search is not None else None
+            if field:
+                mask &= search.mask(field, self.keyword)
+            else:
+                col = colmap.get(self.keyword_field)
+                if col:
+                    mask &= _contains_mask(df[col], self.keyword)
+        return mask
+
+    def indices(self, df, **kwargs):
+        return np.flatnonzero(self.mask(df, **kwargs))
+
+    def apply(self, df, **kwargs):
+        """
+        Trả về các dòng thoả điều kiện; spec rỗng thì trả lại chính df (không copy)
+        """
+        if self.is_empty:
+            return df
+        mask = self.mask(df, **kwargs)
+        if mask.all():
+            return df
+        return df[mask]
@@ -0,0 +1,315 @@
+"""
+Gộp nhiều file RMA (.xlsx/.csv, vd mỗi chi nhánh một file) thành một bộ dữ liệu.
+
+    python rma_ingest.py <thư mục | manifest.txt | manifest.json> [--workers N]
+
+Mỗi file được parse trong một tiến trình riêng (ProcessPoolExecutor): tiêu đề cột được
+map về tên chuẩn theo COLUMN_MAPPING, dòng được gắn tên file nguồn. Kết quả từng file
+được nhớ theo (mtime, size) và SHA1 nội dung, lần nạp sau chỉ parse lại file đã đổi;
+các file được nối một lần rồi mới định kiểu (apply_schema) cho cả bộ.
+"""
+import io
+import os
+import sys
+import json
+import time
+import hashlib
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import pandas as pd
+from rma_utils import COLUMN_MAPPING, ColumnMap, clean_text, ensure_time_columns, apply_schema, parse_date_column
+from rma_turnaround import add_turnaround_column
+
+SOURCE_COLUMN = "Nguồn file"
+FILE_EXTENSIONS = (".xlsx", ".xlsm", ".csv")
+INGEST_WORKERS = int(os.getenv("RMA_INGEST_WORKERS", "0")) or os.cpu_count() or 1
+# Dưới ngưỡng này (tổng dung lượng file cần parse) parse tại chỗ: khởi động tiến trình
+# con (nạp pandas/openpyxl) tốn vài giây, đắt hơn chính việc parse vài file nhỏ
+POOL_MIN_BYTES = int(float(os.getenv("RMA_INGEST_POOL_MIN_MB", "20")) * 2**20)
+DATA_DIR = os.getenv("RMA_DATA_DIR", "")
+# Các cột thời gian được tính lại từ ngày tiếp nhận, không map từ file
+_DERIVED_COLUMNS = {"Năm", "Tháng", "Quý"}
+
+
+def discover_files(source):
+    """
+    Danh sách file cần nạp: mọi file .xlsx/.csv trong thư mục (kể cả thư mục con),
+    hoặc các đường dẫn liệt kê trong manifest (.txt mỗi dòng một file, .json là list
+    hoặc {"files": [...]}); đường dẫn tương đối tính từ thư mục chứa manifest
+    """
+    if os.path.isdir(source):
+        paths = []
+        for root, _, names in os.walk(source):
+            for name in names:
+                if name.lower().endswith(FILE_EXTENSIONS) and not name.startswith(("~$", ".")):
+                    paths.append(os.path.join(root, name))
+        return sorted(paths)
+    base = os.path.dirname(os.path.abspath(source))
+    with open(source, encoding="utf-8") as f:
+        if source.lower().endswith(".json"):
+            entries = json.load(f)
+            entries = entries.get("files", []) if isinstance(entries, dict) else entries
+        else:
+            entries = [line.strip() for line in f if line.strip() and not line.lstrip().startswith("#")]
+    return [os.path.normpath(os.path.join(base, entry)) for entry in entries]
+
+
+def canonical_columns(columns):
+    """
+    {tên cột trong file: tên chuẩn} cho các cột tìm được qua COLUMN_MAPPING; mỗi cột
+    chỉ được map cho một tên chuẩn và không đè lên cột đã mang đúng tên chuẩn
+    """
+    rename = {}
+    claimed = set(columns)
+    for key, col in ColumnMap(columns).canonical.items():
+        if col is None or col == key or key in _DERIVED_COLUMNS:
+            continue
+        if col in rename or key in claimed:
+            continue
+        rename[col] = key
+        claimed.add(key)
+    return rename
+
+
+def _read_frame(content, path):
+    if path.lower().endswith(".csv"):
+        try:
+            text = content.decode("utf-8-sig")
+        except UnicodeDecodeError:
+            text = content.decode("cp1258")
+        return pd.read_csv(io.StringIO(text))
+    return pd.read_excel(io.BytesIO(content), sheet_name=0)
+
+
+def parse_rma_file(content, path):
+    """
+    (frame, {tên chuẩn: tên cột gốc}) của một file: cột đã map về tên chuẩn, cột ngày
+    đã parse (một định dạng cho cả cột, đoán trên chính file đó như parse_sheet_csv),
+    cột SOURCE_COLUMN = tên file.
+    Chưa ép kiểu, chưa thêm cột thời gian.
+    """
+    df = _read_frame(content, path)
+    df.columns = [str(col).strip() for col in df.columns]
+    df = df.dropna(how="all")
+    rename = canonical_columns(df.columns)
+    headers = {key: col for col, key in rename.items()}
+    headers.update({col: col for col in df.columns if col in COLUMN_MAPPING})
+    df = df.rename(columns=rename)
+    for col in df.columns:
+        if clean_text(col).startswith("ngay"):
+            df[col] = parse_date_column(df, col)
+    name = os.path.basename(path)
+    if SOURCE_COLUMN in df.columns:
+        df[SOURCE_COLUMN] = df[SOURCE_COLUMN].fillna(name)
+    else:
+        df[SOURCE_COLUMN] = name
+    return df.reset_index(drop=True), headers
+
+
+def _file_digest(path):
+    with open(path, "rb") as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+def _parse_path(path):
+    # Chạy trong tiến trình con: đọc, băm và parse một file
+    with open(path, "rb") as f:
+        content = f.read()
+    return (hashlib.sha1(content).hexdigest(), *parse_rma_file(content, path))
+
+
+def build_dataset(frames, headers=()):
+    """
+    Nối các frame theo thứ tự file rồi định kiểu một lần. Cột chuẩn lấy lại tên gốc
+    của file đầu tiên có cột đó (`headers`: {tên chuẩn: tên gốc} của từng file) để các
+    chỗ tra cột bằng từ khoá (vd "KTV") vẫn khớp như với sheet. Trả về (df, báo cáo schema).
+    """
+    df = pd.concat(frames, ignore_index=True, sort=False) if frames else pd.DataFrame()
+    preferred = {}
+    for original in headers:
+        for key, col in original.items():
+            preferred.setdefault(key, col)
+    df = df.rename(columns={key: col for key, col in preferred.items() if col not in df.columns})
+    if SOURCE_COLUMN in df.columns:
+        df[SOURCE_COLUMN] = df.pop(SOURCE_COLUMN).astype("category")
+    df, report = apply_schema(ensure_time_columns(df))
+    return add_turnaround_column(df), report
+
+
+class IngestLoader:
+    """
+    Nạp thư mục/manifest nhiều file RMA, cùng giao diện với SheetLoader (get, stats,
+    last_error). Mỗi lần quét lại (sau `ttl` giây) chỉ parse các file mới hoặc đã đổi
+    nội dung; file chỉ đổi mtime mà cùng SHA1 thì dùng lại kết quả cũ.
+    """
+
+    def __init__(self, source=DATA_DIR, ttl=None, workers=INGEST_WORKERS, pool_min_bytes=POOL_MIN_BYTES):
+        # rma_data nạp muộn: tiến trình con chỉ cần phần parse, không cần kéo theo openai
+        from rma_data import DEFAULT_TTL
+        self.source = source
+        self.ttl = DEFAULT_TTL if ttl is None else ttl
+        self.workers = workers
+        self.pool_min_bytes = pool_min_bytes
+        self.dataset = None
+        self.last_error = None
+        self.errors = {}
+        self._files = {}
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self._stats = {
+            "hits": 0,
+            "misses": 0,
+            "ingests": 0,
+            "files": 0,
+            "files_parsed_last": 0,
+            "files_reused_last": 0,
+            "files_parsed_total": 0,
+            "ingest_ms_last": 0.0,
+            "pool_failures": 0,
+        }
+
+    def get(self, force=False):
+        if not force and self._fresh():
+            self._stats["hits"] += 1
+            return self.dataset
+        with self._lock:
+            if not force and self._fresh():
+                self._stats["hits"] += 1
+                return self.dataset
+            self._stats["misses"] += 1
+            try:
+                self._refresh()
+                self.last_error = None
+            except Exception as e:
+                self.last_error = e
+                if self.dataset is None:
+                    raise
+            finally:
+                self._checked_at = time.time()
+        return self.dataset
+
+    def _fresh(self):
+        return self.dataset is not None and time.time() - self._checked_at < self.ttl
+
+    def _changed(self, paths):
+        """
+        Các file phải parse lại; file đổi mtime/size nhưng cùng SHA1 chỉ cập nhật chữ ký.
+        File không đọc được (mất, không có quyền) ghi vào self.errors và bỏ khỏi bộ dữ liệu.
+        """
+        todo = []
+        for path in paths:
+            cached = self._files.get(path)
+            try:
+                stat = os.stat(path)
+                signature = (stat.st_mtime_ns, stat.st_size)
+                if cached is not None and cached["signature"] == signature:
+                    continue
+                if cached is not None and _file_digest(path) == cached["digest"]:
+                    cached["signature"] = signature
+                    continue
+            except OSError as e:
+                self.errors[path] = f"{type(e).__name__}: {e}"
+                self._files.pop(path, None)
+                continue
+            todo.append((path, signature))
+        return todo
+
+    def _parse(self, todo):
+        results = {}
+        total_bytes = sum(signature[1] for _, signature in todo)
+        if len(todo) > 1 and self.workers > 1 and total_bytes >= self.pool_min_bytes:
+            # spawn: an toàn khi tiến trình cha có nhiều thread (Streamlit, API server)
+            context = multiprocessing.get_context("spawn")
+            try:
+                with ProcessPoolExecutor(min(self.workers, len(todo)), mp_context=context) as pool:
+                    futures = {path: pool.submit(_parse_path, path) for path, _ in todo}
+                    for path, future in futures.items():
+                        try:
+                            results[path] = future.result()
+                        except BrokenProcessPool:
+                            raise
+                        except Exception as e:
+                            results[path] = e
+            except BrokenProcessPool:
+                # Không tạo được tiến trình con (vd script gọi thiếu `if __name__ == "__main__"`) → parse tại chỗ
+                self._stats["pool_failures"] += 1
+        for path, _ in todo:
+            if path in results:
+                continue
+            try:
+                results[path] = _parse_path(path)
+            except Exception as e:
+                results[path] = e
+        return results
+
+    def _refresh(self):
+        started = time.perf_counter()
+        paths = discover_files(self.source)
+        if not paths:
+            raise FileNotFoundError(f"Không có file .xlsx/.csv nào trong {self.source}")
+        for path in set(self._files) - set(paths):
+            del self._files[path]
+
+        todo = self._changed(paths)
+        results = self._parse(todo)
+        for path, signature in todo:
+            result = results[path]
+            if isinstance(result, Exception):
+                self.errors[path] = f"{type(result).__name__}: {result}"
+                self._files.pop(path, None)
+                continue
+            self.errors.pop(path, None)
+            digest, frame, headers = result
+            self._files[path] = {"signature": signature, "digest": digest, "frame": frame, "headers": headers}
+        self.errors = {path: error for path, error in self.errors.items() if path in paths}
+
+        loaded = [path for path in paths if path in self._files]
+        if not loaded:
+            raise ValueError("Không đọc được file nào: " + "; ".join(self.errors.values()))
+        version = hashlib.sha1("\n".join(
+            f"{os.path.basename(path)}:{self._files[path]['digest']}" for path in loaded
+        ).encode("utf-8")).hexdigest()[:12]
+
+        n_parsed = sum(1 for path, _ in todo if path in self._files)
+        self._stats["ingests"] += 1
+        self._stats["files"] = len(loaded)
+        self._stats["files_parsed_last"] = n_parsed
+        self._stats["files_reused_last"] = len(loaded) - n_parsed
+        self._stats["files_parsed_total"] += n_parsed
+        if self.dataset is None or self.dataset.version != version:
+            from rma_data import RMADataset
+            files = [self._files[path] for path in loaded]
+            data, report = build_dataset([f["frame"] for f in files], [f["headers"] for f in files])
+            self.dataset = RMADataset(data, version, schema_report=report)
+        self._stats["ingest_ms_last"] = round((time.perf_counter() - started) * 1000, 1)
+
+    def stats(self):
+        s = dict(self._stats)
+        s["source"] = self.source
+        lookups = s["hits"] + s["misses"]
+        s["hit_rate"] = round(s["hits"] / lookups, 3) if lookups else 0.0
+        if self.errors:
+            s["file_errors"] = dict(self.errors)
+        if self.dataset is not None:
+            s["version"] = self.dataset.version
+            s["age_s"] = round(self.dataset.age, 1)
+            s["rows"] = len(self.dataset.data)
+        return s
+
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description="Gộp các file RMA (.xlsx/.csv) trong thư mục hoặc manifest")
+    parser.add_argument("source", help="Thư mục hoặc file manifest (.txt/.json)")
+    parser.add_argument("--workers", type=int, default=INGEST_WORKERS)
+    args = parser.parse_args(argv)
+    loader = IngestLoader(args.source, ttl=0, workers=args.workers)
+    loader.get()
+    print(json.dumps(loader.stats(), ensure_ascii=False, indent=2))
+    return 1 if loader.errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,216 @@
+import os
+import time
+import random
+import threading
+from collections import deque
+import openai
+from openai import OpenAI
+from rma_utils import percentile
+
+OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", "60"))
+OPENAI_CONNECT_TIMEOUT = float(os.getenv("OPENAI_CONNECT_TIMEOUT", "5"))
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "3"))
+# Số request đồng thời tối đa mỗi tiến trình (worker); request thứ N+1 phải chờ
+OPENAI_MAX_CONCURRENCY = int(os.getenv("OPENAI_MAX_CONCURRENCY", "4"))
+OPENAI_QUEUE_TIMEOUT = float(os.getenv("OPENAI_QUEUE_TIMEOUT", "30"))
+BACKOFF_BASE = 0.5
+BACKOFF_CAP = 8.0
+LATENCY_WINDOW = 1000
+
+
+class OpenAIBusyError(RuntimeError):
+    """
+    Hết chỗ: đã có OPENAI_MAX_CONCURRENCY request đang chạy quá OPENAI_QUEUE_TIMEOUT giây
+    """
+
+
+def _retryable(error):
+    if isinstance(error, (openai.APIConnectionError, openai.RateLimitError)):
+        return True
+    return isinstance(error, openai.APIStatusError) and error.status_code >= 500
+
+
+def _retry_after(error):
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    try:
+        return float(response.headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class OpenAIClientManager:
+    """
+    Client OpenAI dùng chung cho cả tiến trình: giữ kết nối keep-alive theo từng
+    (api_key, base_url), timeout cấu hình được, tự retry 429/5xx/lỗi kết nối với
+    exponential backoff có jitter, giới hạn số request đồng thời bằng semaphore và
+    ghi lại số liệu độ trễ/lỗi.
+    """
+
+    def __init__(self, timeout=OPENAI_TIMEOUT, connect_timeout=OPENAI_CONNECT_TIMEOUT,
+                 max_retries=OPENAI_MAX_RETRIES, max_concurrency=OPENAI_MAX_CONCURRENCY,
+                 queue_timeout=OPENAI_QUEUE_TIMEOUT, backoff_base=BACKOFF_BASE, backoff_cap=BACKOFF_CAP):
+        self.timeout = openai.Timeout(timeout, connect=connect_timeout)
+        self.max_retries = max_retries
+        self.max_concurrency = max_concurrency
+        self.queue_timeout = queue_timeout
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._clients = {}
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=LATENCY_WINDOW)
+        self._ttfts = deque(maxlen=LATENCY_WINDOW)
+        self.requests = 0
+        self.successes = 0
+        self.retries = 0
+        self.errors = {}
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.queue_wait_ms = 0.0
+
+    def client(self, api_key=None):
+        """
+        Client (và connection pool) dùng lại cho cùng api_key + OPENAI_BASE_URL
+        """
+        base_url = os.getenv("OPENAI_BASE_URL") or None
+        key = (api_key, base_url)
+        with self._lock:
+            client = self._clients.get(key)
+            if client is None:
+                # Tắt retry của SDK, retry do manager tự làm để đếm được và có jitter
+                client = OpenAI(api_key=api_key, base_url=base_url, timeout=self.timeout, max_retries=0)
+                self._clients[key] = client
+            return client
+
+    def backoff(self, attempt, error=None):
+        """
+        Thời gian chờ trước lần thử `attempt` (full jitter, tôn trọng Retry-After)
+        """
+        retry_after = _retry_after(error) if error is not None else None
+        if retry_after is not None:
+            return min(retry_after, self.backoff_cap)
+        return random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** attempt))
+
+    def _acquire(self):
+        started = time.perf_counter()
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            self._record_error("busy")
+            raise OpenAIBusyError(f"Đang có {self.max_concurrency} yêu cầu AI chạy, vui lòng thử lại sau.")
+        with self._lock:
+            self.queue_wait_ms += (time.perf_counter() - started) * 1000
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+
+    def _release(self):
+        with self._lock:
+            self.in_flight -= 1
+        self._slots.release()
+
+    def _record_error(self, name):
+        with self._lock:
+            self.errors[name] = self.errors.get(name, 0) + 1
+
+    def _create(self, api_key, kwargs):
+        client = self.client(api_key)
+        attempt = 0
+        while True:
+            try:
+                return client.chat.completions.create(**kwargs)
+            except Exception as e:
+                if not _retryable(e) or attempt >= self.max_retries:
+                    self._record_error(type(e).__name__)
+                    raise
+                with self._lock:
+                    self.retries += 1
+                time.sleep(self.backoff(attempt, e))
+                attempt += 1
+
+    def chat(self, api_key=None, **kwargs):
+        """
+        chat.completions.create có retry + giới hạn đồng thời; lỗi cuối cùng được ném ra
+        """
+        self._acquire()
+        started = time.perf_counter()
+        with self._lock:
+            self.requests += 1
+        try:
+            response = self._create(api_key, kwargs)
+        finally:
+            self._release()
+        with self._lock:
+            self.successes += 1
+            self._latencies.append((time.perf_counter() - started) * 1000)
+        return response
+
+    def chat_stream(self, api_key=None, **kwargs):
+        """
+        Như chat() nhưng stream: yield từng chunk, giữ chỗ semaphore tới khi stream xong.
+        Chỉ retry trước khi nhận được chunk đầu tiên.
+        """
+        self._acquire()
+        started = time.perf_counter()
+        with self._lock:
+            self.requests += 1
+        try:
+            response = self._create(api_key, dict(kwargs, stream=True))
+            first = True
+            try:
+                for chunk in response:
+                    if first:
+                        first = False
+                        with self._lock:
+                            self._ttfts.append((time.perf_counter() - started) * 1000)
+                    yield chunk
+            except Exception as e:
+                self._record_error(type(e).__name__)
+                raise
+            finally:
+                response.close()
+        finally:
+            self._release()
+        with self._lock:
+            self.successes += 1
+            self._latencies.append((time.perf_counter() - started) * 1000)
+
+    def stats(self):
+        with self._lock:
+            latencies = list(self._latencies)
+            ttfts = list(self._ttfts)
+            return {
+                "requests": self.requests,
+                "successes": self.successes,
+                "retries": self.retries,
+                "errors": dict(self.errors),
+                "in_flight": self.in_flight,
+                "max_in_flight": self.max_in_flight,
+                "max_concurrency": self.max_concurrency,
+                "queue_wait_ms": round(self.queue_wait_ms, 1),
+                "clients": len(self._clients),
+                "latency_ms_p50": percentile(latencies, 0.5),
+                "latency_ms_p95": percentile(latencies, 0.95),
+                "ttft_ms_p50": percentile(ttfts, 0.5),
+                "ttft_ms_p95": percentile(ttfts, 0.95),
+            }
+
+    def close(self):
+        with self._lock:
+            clients, self._clients = list(self._clients.values()), {}
+        for client in clients:
+            client.close()
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def get_client_manager():
+    """
+    OpenAIClientManager dùng chung cho cả tiến trình
+    """
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = OpenAIClientManager()
+        return _manager
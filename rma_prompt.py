@@ -0,0 +1,230 @@
+import os
+import math
+import threading
+from rma_utils import column_index, count_values
+from rma_entity import isin_mask
+
+try:
+    import tiktoken
+except ImportError:  # không có tiktoken → ước lượng token theo số byte
+    tiktoken = None
+
+PROMPT_TOKEN_BUDGET = int(os.getenv("RMA_PROMPT_TOKENS", "2500"))
+TOP_N = 10
+# Ước lượng khi không có tokenizer: tiếng Việt có dấu ~2.5 byte UTF-8 mỗi token
+BYTES_PER_TOKEN = 2.5
+
+# Các bảng tổng hợp có thể đưa vào ngữ cảnh: tên → (tiêu đề, từ khoá tra cột)
+TOP_SECTIONS = {
+    "customers": ("Top khách hàng gửi nhiều nhất", "khách hàng"),
+    "products": ("Top sản phẩm gửi nhiều nhất", "sản phẩm"),
+    "errors": ("Top lỗi thường gặp", "tên lỗi"),
+    "ktv": ("Top kỹ thuật viên xử lý nhiều nhất", "KTV"),
+    "groups": ("Số lượt theo nhóm hàng", "nhóm hàng"),
+    "service_types": ("Số lượt theo loại dịch vụ", "loại dịch vụ"),
+}
+STATUS_COLUMNS = {
+    "Đã sửa xong": "đã sửa xong",
+    "Không sửa được": "không sửa được",
+    "Từ chối bảo hành": "từ chối bảo hành",
+}
+
+# Thứ tự ưu tiên các phần theo intent (phần đứng trước được giữ khi thiếu ngân sách)
+INTENT_SECTIONS = {
+    "top_customers": ["customers", "periods"],
+    "top_product": ["products", "groups", "periods"],
+    "top_products": ["products", "groups", "errors", "periods"],
+    "top_products_by_customer": ["customer_products", "products", "periods"],
+    "top_customers_by_product": ["customers", "products", "periods"],
+    "top_ktv": ["ktv", "periods"],
+    "count_product": ["periods", "groups"],
+    "count_product_by_customer": ["customer_products", "periods", "customers"],
+}
+# Câu hỏi không khớp intent: chọn phần theo từ khoá trong câu
+KEYWORD_SECTIONS = [
+    ("lỗi", "errors"),
+    ("ktv", "ktv"),
+    ("kỹ thuật", "ktv"),
+    ("khách", "customers"),
+    ("sản phẩm", "products"),
+    ("nhóm", "groups"),
+    ("dịch vụ", "service_types"),
+    ("tháng", "periods"),
+    ("quý", "periods"),
+    ("năm", "periods"),
+]
+DEFAULT_SECTIONS = ["periods", "customers", "products", "errors", "groups", "ktv", "service_types"]
+
+_encoders = {}
+_encoder_lock = threading.Lock()
+
+
+def _encoder(model):
+    with _encoder_lock:
+        if model not in _encoders:
+            encoder = None
+            if tiktoken is not None:
+                try:
+                    encoder = tiktoken.encoding_for_model(model)
+                except KeyError:
+                    encoder = tiktoken.get_encoding("cl100k_base")
+                except Exception:
+                    # Chưa có file BPE và không tải được (chạy offline) → ước lượng
+                    encoder = None
+            _encoders[model] = encoder
+        return _encoders[model]
+
+
+def count_tokens(text, model="gpt-3.5-turbo"):
+    """
+    Số token của `text` (tiktoken nếu có, ngược lại ước lượng theo số byte)
+    """
+    encoder = _encoder(model)
+    if encoder is not None:
+        return len(encoder.encode(text))
+    return math.ceil(len(text.encode("utf-8")) / BYTES_PER_TOKEN)
+
+
+def _table(title, frame):
+    return f"### {title}\n{frame.to_csv(index=False).strip()}"
+
+
+class PromptContextBuilder:
+    """
+    Dựng phần dữ liệu của prompt trong giới hạn token: số liệu tổng hợp (tổng quan,
+    tỉ lệ trạng thái, số lượt theo kỳ, các bảng top-N) tính trên toàn bộ dữ liệu đã
+    lọc, chọn theo intent của câu hỏi; phần ngân sách còn lại dành cho dòng mẫu.
+    """
+
+    def __init__(self, df, colmap=None, budget=PROMPT_TOKEN_BUDGET, model="gpt-3.5-turbo", top_n=TOP_N):
+        self.df = df
+        self.colmap = colmap or column_index(df.columns)
+        self.budget = budget
+        self.model = model
+        self.top_n = top_n
+
+    def sections_for(self, intent, question=""):
+        if intent is not None and intent.name in INTENT_SECTIONS:
+            return INTENT_SECTIONS[intent.name]
+        q = (question or "").lower()
+        picked = []
+        for keyword, section in KEYWORD_SECTIONS:
+            if keyword in q and section not in picked:
+                picked.append(section)
+        return picked + [s for s in DEFAULT_SECTIONS if s not in picked]
+
+    def overview(self):
+        df = self.df
+        lines = [f"Tổng số lượt bảo hành (toàn bộ dữ liệu đã lọc): {len(df)}"]
+        col_date = self.colmap.get("ngày tiếp nhận")
+        if col_date and len(df):
+            dates = df[col_date].dropna()
+            if len(dates):
+                lines.append(f"Ngày tiếp nhận: từ {dates.min():%d/%m/%Y} đến {dates.max():%d/%m/%Y}")
+        for label, keyword in STATUS_COLUMNS.items():
+            col = self.colmap.get(keyword)
+            if col and len(df):
+                count = int((df[col] == 1).sum())
+                lines.append(f"{label}: {count} ({count / len(df):.1%})")
+        return "### Tổng quan\n" + "\n".join(lines)
+
+    def render(self, section, top_n, customer=None):
+        df = self.df
+        if section == "periods":
+            cols = [c for c in ("Năm", "Tháng") if c in df.columns]
+            if not cols:
+                return None
+            counts = df.groupby(cols, observed=True).size().reset_index(name="Số lượt")
+            return _table("Số lượt theo " + "/".join(cols).lower(), counts.tail(top_n * 3))
+        if section == "customer_products":
+            col_kh = self.colmap.get("khách hàng")
+            col_sp = self.colmap.get("sản phẩm")
+            if not (customer and col_kh and col_sp):
+                return None
+            names = [customer] if isinstance(customer, str) else list(customer)
+            subset = df[isin_mask(df[col_kh], names)]
+            counts = count_values(subset[col_sp]).head(top_n).reset_index()
+            counts.columns = [col_sp, "Số lượt"]
+            label = ", ".join(names[:3]) + (f" và {len(names) - 3} tên khác" if len(names) > 3 else "")
+            return _table(f"Sản phẩm của khách hàng {label} ({len(subset)} lượt)", counts)
+        title, keyword = TOP_SECTIONS[section]
+        col = self.colmap.get(keyword)
+        if not col:
+            return None
+        counts = count_values(df[col]).head(top_n).reset_index()
+        counts.columns = [col, "Số lượt"]
+        return _table(title, counts)
+
+    def sample_rows(self, columns, budget):
+        """
+        Nhiều dòng mẫu (mới nhất) nhất vừa `budget` token, chỉ gồm các cột liên quan
+        """
+        if budget <= 0 or not columns or not len(self.df):
+            return None
+        rows = self.df[columns]
+        # Mỗi dòng tốn ít nhất một token nên không cần thử quá `budget` dòng
+        low, high, best = 1, min(len(rows), budget), None
+        while low <= high:
+            n = (low + high) // 2
+            text = _table(f"{n} dòng dữ liệu mới nhất", rows.tail(n))
+            if count_tokens(text, self.model) <= budget:
+                best, low = text, n + 1
+            else:
+                high = n - 1
+        return best
+
+    def relevant_columns(self, sections):
+        keywords = ["ngày tiếp nhận"]
+        for section in sections:
+            if section in TOP_SECTIONS:
+                keywords.append(TOP_SECTIONS[section][1])
+            elif section in ("customer_products",):
+                keywords += ["khách hàng", "sản phẩm"]
+        keywords += list(STATUS_COLUMNS.values())
+        columns = []
+        for keyword in keywords:
+            col = self.colmap.get(keyword)
+            if col and col not in columns:
+                columns.append(col)
+        return columns
+
+    def build(self, question="", intent=None, customer=None, reserved=0):
+        """
+        Trả về (văn bản ngữ cảnh, report) với report gồm số token và các phần đã đưa vào
+        """
+        budget = self.budget - reserved
+        parts = [self.overview()]
+        used = count_tokens(parts[0], self.model)
+        included, skipped = ["overview"], []
+        sections = self.sections_for(intent, question)
+        for section in sections:
+            top_n = self.top_n
+            while top_n >= 3:
+                text = self.render(section, top_n, customer)
+                if text is None:
+                    break
+                tokens = count_tokens(text, self.model)
+                if used + tokens <= budget:
+                    parts.append(text)
+                    used += tokens
+                    included.append(section)
+                    break
+                top_n //= 2
+            else:
+                skipped.append(section)
+        sample = self.sample_rows(self.relevant_columns(sections), budget - used)
+        sample_rows = 0
+        if sample is not None:
+            parts.append(sample)
+            used += count_tokens(sample, self.model)
+            sample_rows = sample.count("\n") - 1
+        report = {
+            "rows": len(self.df),
+            "tokens": used,
+            "budget": self.budget,
+            "sections": included,
+            "skipped": skipped,
+            "sample_rows": sample_rows,
+            "tokenizer": "tiktoken" if _encoder(self.model) is not None else "heuristic",
+        }
+        return "\n\n".join(parts), report
@@ -0,0 +1,183 @@
+import os
+import time
+import threading
+from collections import namedtuple
+from rma_utils import column_index
+
+# Chu kỳ (giây) hỏi lại nguồn dữ liệu ở luồng nền; mặc định bằng TTL của loader
+REFRESH_INTERVAL = int(os.getenv("RMA_REFRESH_INTERVAL", os.getenv("RMA_DATA_TTL", "300")))
+# 0 = tắt luồng nền, tải dữ liệu ngay trong lượt chạy như trước
+BACKGROUND_REFRESH = os.getenv("RMA_BACKGROUND_REFRESH", "1") == "1"
+# Thời gian tối đa (giây) một phiên chờ bản dữ liệu đầu tiên khi vừa khởi động
+FIRST_LOAD_TIMEOUT = int(os.getenv("RMA_FIRST_LOAD_TIMEOUT", "120"))
+
+# Một bản dữ liệu đã dựng xong: dataset + bảng tra cột + thời điểm dựng và thời gian dựng chỉ mục
+DatasetHandle = namedtuple("DatasetHandle", ["dataset", "colmap", "built_at", "build_ms"])
+
+
+def _warm_raw(dataset, colmap):
+    dataset.raw
+
+
+def _warm_search(dataset, colmap):
+    from rma_search import get_search_index
+    get_search_index(dataset.data, dataset.version, colmap=colmap)
+
+
+def _warm_serial(dataset, colmap):
+    from rma_serial import get_serial_index
+    get_serial_index(dataset.data, colmap)
+
+
+def _warm_resolver(dataset, colmap):
+    from rma_entity import get_resolver
+    for cols in (["ten_khach_hang", "khach_hang"], ["san_pham", "model", "ten_san_pham"]):
+        col = next((c for c in cols if c in dataset.raw.columns), None)
+        if col is not None:
+            get_resolver(dataset.raw, col)
+
+
+def _warm_cube(dataset, colmap):
+    from rma_cube import get_cube
+    get_cube(dataset.data, key=dataset.version, colmap=colmap)
+
+
+# Các chỉ mục dẫn xuất dựng sẵn trước khi đưa bản mới ra; mỗi hàm nhận (dataset, colmap)
+# và chỉ cần gọi các get_*() vốn đã cache theo phiên bản dữ liệu
+DEFAULT_WARMERS = (_warm_raw, _warm_search, _warm_serial, _warm_resolver, _warm_cube)
+
+
+class BackgroundRefresher:
+    """
+    Luồng nền định kỳ hỏi lại loader (SheetLoader/IngestLoader), dựng sẵn các chỉ mục
+    dẫn xuất cho phiên bản mới rồi mới thay handle dùng chung. Lượt chạy của người dùng
+    chỉ đọc `current()` — luôn là một bản đã dựng xong, không bao giờ chờ tải/parse.
+    """
+
+    def __init__(self, loader, interval=REFRESH_INTERVAL, warmers=DEFAULT_WARMERS):
+        self.loader = loader
+        self.interval = interval
+        self.warmers = tuple(warmers)
+        self.last_error = None
+        self._handle = None
+        self._ready = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._swap_lock = threading.Lock()
+        self._stats = {
+            "refreshes": 0,
+            "swaps": 0,
+            "errors": 0,
+            "warm_errors": 0,
+            "refresh_ms_last": 0.0,
+            "build_ms_last": 0.0,
+            "checked_at": None,
+        }
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name="rma-refresh", daemon=True)
+                self._thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self):
+        while True:
+            self.refresh()
+            if self._stop.wait(self.interval):
+                return
+
+    def refresh(self, force=None):
+        """
+        Hỏi lại nguồn một lần; có phiên bản mới thì dựng chỉ mục rồi thay handle.
+        Trả về True nếu handle đã được thay.
+        """
+        started = time.perf_counter()
+        swapped = False
+        try:
+            current = self._handle
+            # Lần đầu dùng được snapshot còn hạn; sau đó force để bỏ qua TTL của loader,
+            # việc hỏi lại (ETag/mtime) vẫn rẻ khi nguồn không đổi
+            if force is None:
+                force = current is not None
+            dataset = self.loader.get(force=force)
+            self.last_error = self.loader.last_error
+            with self._swap_lock:
+                # Chạy tại chỗ thì nhiều phiên có thể cùng thấy bản mới, chỉ một phiên dựng
+                current = self._handle
+                if current is None or current.dataset is not dataset:
+                    self._publish(dataset)
+                    swapped = True
+        except Exception as e:
+            # Giữ bản đang phục vụ; phiên đầu tiên sẽ nhận lỗi này từ current()
+            self.last_error = e
+            self._stats["errors"] += 1
+        finally:
+            self._stats["refreshes"] += 1
+            self._stats["refresh_ms_last"] = round((time.perf_counter() - started) * 1000, 1)
+            self._stats["checked_at"] = time.time()
+            self._ready.set()
+        return swapped
+
+    def _publish(self, dataset):
+        started = time.perf_counter()
+        colmap = column_index(dataset.data.columns)
+        for warm in self.warmers:
+            try:
+                warm(dataset, colmap)
+            except Exception:
+                # Chỉ mục không dựng được thì phiên sẽ tự dựng khi cần, không chặn bản mới
+                self._stats["warm_errors"] += 1
+        build_ms = (time.perf_counter() - started) * 1000
+        # Gán một tham chiếu là nguyên tử: phiên đang chạy giữ handle cũ đến hết lượt
+        self._handle = DatasetHandle(dataset, colmap, time.time(), build_ms)
+        self._stats["swaps"] += 1
+        self._stats["build_ms_last"] = round(build_ms, 1)
+
+    def current(self, timeout=FIRST_LOAD_TIMEOUT):
+        """
+        Handle đang phục vụ; chỉ chờ khi tiến trình vừa khởi động và chưa có bản nào.
+        Không chạy luồng nền (chưa start) thì hỏi loader ngay tại chỗ theo TTL của loader.
+        """
+        if self._thread is None:
+            self.refresh(force=False)
+        handle = self._handle
+        if handle is not None:
+            return handle
+        self._ready.wait(timeout)
+        handle = self._handle
+        if handle is None:
+            raise self.last_error or TimeoutError("Chưa tải xong dữ liệu")
+        return handle
+
+    @property
+    def version(self):
+        handle = self._handle
+        return handle.dataset.version if handle is not None else None
+
+    @property
+    def age(self):
+        """
+        Tuổi (giây) của bản dữ liệu đang phục vụ, tính từ lúc tải từ nguồn
+        """
+        handle = self._handle
+        return handle.dataset.age if handle is not None else None
+
+    def stats(self):
+        s = self.loader.stats()
+        s.update(self._stats)
+        s["background"] = self._thread is not None and self._thread.is_alive()
+        s["interval_s"] = self.interval
+        handle = self._handle
+        if handle is not None:
+            s["version"] = handle.dataset.version
+            s["age_s"] = round(handle.dataset.age, 1)
+            s["published_age_s"] = round(time.time() - handle.built_at, 1)
+        return s
@@ -0,0 +1,237 @@
+import os
+import time
+import threading
+from collections import OrderedDict, deque, namedtuple
+from dataclasses import dataclass, field
+import rma_query_templates as q
+from rma_turnaround import TURNAROUND_DIMENSIONS, SLA_DAYS
+from rma_utils import percentile
+
+REPORT_CACHE_SIZE = int(os.getenv("RMA_REPORT_CACHE_SIZE", "64"))
+TIMING_WINDOW = 200
+
+SERIAL_VIEWS = ["Danh sách serial lặp", "Tỉ lệ lặp theo sản phẩm", "Tỉ lệ lặp theo khách hàng", "Quay lại trong N ngày"]
+
+class ReportContext(namedtuple("ReportContext", ["data", "colmap", "cube_source", "source", "key"])):
+    """
+    Dữ liệu mà một báo cáo được chạy trên: tập đã lọc, bảng tra cột, cube tổng hợp (hoặc
+    hàm không tham số trả về cube — chỉ gọi khi báo cáo thật sự cần), frame gốc (cho các
+    chỉ mục dựng trên toàn bộ dữ liệu) và khoá (phiên bản, bộ lọc)
+    """
+    __slots__ = ()
+
+    @property
+    def cube(self):
+        return self.cube_source() if callable(self.cube_source) else self.cube_source
+
+
+ReportResult = namedtuple("ReportResult", ["title", "df", "elapsed_ms", "cached"])
+
+
+@dataclass(frozen=True)
+class Param:
+    """
+    Tham số của báo cáo. kind: "choice" (selectbox), "radio", "values" (các giá trị của
+    cột `column`), "number" (khoảng `min_value`–`max_value`)
+    """
+    name: str
+    label: str
+    kind: str = "choice"
+    options: tuple = ()
+    column: str = None
+    sort: bool = False
+    default: object = None
+    min_value: int = None
+    max_value: int = None
+
+    def choices(self, ctx):
+        if self.kind != "values":
+            return list(self.options)
+        col = ctx.colmap.get(self.column)
+        if not col:
+            return []
+        values = ctx.data[col].dropna().unique().tolist()
+        return sorted(values) if self.sort else values
+
+
+@dataclass(frozen=True)
+class Report:
+    """
+    Một mẫu báo cáo: `run(ctx, **params)` trả về (tiêu đề, DataFrame); `filename` là mẫu
+    tên file xuất (format theo params); `paged` = bảng dài hiển thị theo trang;
+    `chart(df, ctx, params)` trả về biểu đồ plotly (tuỳ chọn)
+    """
+    key: str
+    label: str
+    run: object
+    filename: str
+    params: tuple = ()
+    paged: bool = False
+    chart: object = field(default=None, compare=False)
+
+
+def _serial(ctx, view):
+    from rma_serial import get_serial_index
+    serial_index = get_serial_index(ctx.source)
+    if view == "Danh sách serial lặp":
+        return q.query_serial_lap_lai(ctx.data, colmap=ctx.colmap, serial_index=serial_index)
+    if view == "Quay lại trong N ngày":
+        return q.query_serial_return_cohorts(ctx.data, colmap=ctx.colmap, serial_index=serial_index)
+    by = "Sản phẩm" if view.endswith("sản phẩm") else "Khách hàng"
+    return q.query_serial_repeat_rate(ctx.data, by, colmap=ctx.colmap, serial_index=serial_index)
+
+
+def _errors_chart(df, ctx, params):
+    import plotly.express as px
+    fig = px.bar(df, x="Lỗi", y="Số lần gặp", title="Biểu đồ lỗi kỹ thuật phổ biến",
+                 text_auto=True, template="plotly_dark")
+    fig.update_layout(xaxis_tickangle=-45, height=500, margin=dict(l=30, r=30, t=60, b=150))
+    return fig
+
+
+def _trend_chart(df, ctx, params):
+    import plotly.express as px
+    result = get_report_executor().run(TURNAROUND_TREND, ctx, sla_days=params["sla_days"])
+    if result.df.empty:
+        return None
+    fig = px.line(result.df, x="Tháng", y=["P50 (ngày) – TB 3 tháng", "P90 (ngày) – TB 3 tháng"],
+                  markers=True, template="plotly_dark", title=result.title)
+    return fig
+
+
+GROUP_BY = Param("group_by", "Nhóm theo:", options=("Năm", "Tháng", "Quý"))
+SLA_PARAM = Param("sla_days", "SLA (ngày)", "number", default=SLA_DAYS, min_value=1, max_value=120)
+
+REPORTS = [
+    Report("total_by_group", "Tổng số sản phẩm tiếp nhận theo tháng/năm/quý",
+           lambda ctx, group_by: q.query_1_total_by_group(ctx.data, group_by, cube=ctx.cube),
+           "tong_so_tiep_nhan.xlsx", (GROUP_BY,)),
+    Report("success_rate_by_group", "Tỷ lệ sửa chữa thành công theo tháng/năm/quý",
+           lambda ctx, group_by: q.query_2_success_rate_by_group(ctx.data, group_by, colmap=ctx.colmap, cube=ctx.cube),
+           "ti_le_sua_chua.xlsx", (GROUP_BY,)),
+    Report("unrepaired_products", "Danh sách sản phẩm chưa sửa xong",
+           lambda ctx: q.query_3_unrepaired_products(ctx.data, colmap=ctx.colmap),
+           "chua_sua_xong.xlsx", paged=True),
+    Report("top_customers", "Top 10 khách hàng gửi nhiều nhất",
+           lambda ctx: q.query_4_top_customers(ctx.data, colmap=ctx.colmap, cube=ctx.cube),
+           "top_khach_hang.xlsx"),
+    Report("top_products", "Top 10 sản phẩm bảo hành nhiều nhất",
+           lambda ctx: q.query_7_top_products(ctx.data, colmap=ctx.colmap, cube=ctx.cube),
+           "top_san_pham.xlsx"),
+    Report("top_errors", "Top lỗi phổ biến theo nhóm hàng",
+           lambda ctx: q.query_top_errors(ctx.data, colmap=ctx.colmap, cube=ctx.cube),
+           "top_loi_pop.xlsx", chart=_errors_chart),
+    Report("avg_processing_time", "Thời gian xử lý trung bình",
+           lambda ctx: q.query_avg_processing_time(ctx.data, colmap=ctx.colmap),
+           "thoi_gian_xu_ly_tb.xlsx"),
+    Report("top_products_in_group", "Top sản phẩm gửi nhiều trong nhóm đã chọn",
+           lambda ctx: q.query_top_products_in_group(ctx.data, colmap=ctx.colmap, cube=ctx.cube),
+           "top_san_pham_nhom.xlsx"),
+    Report("avg_time_by_customer", "Thời gian xử lý trung bình theo khách hàng",
+           lambda ctx, customer: q.query_avg_time_by_customer(ctx.data, customer, colmap=ctx.colmap),
+           "tg_xu_ly_theo_khach.xlsx",
+           (Param("customer", "🔍 Chọn khách hàng cần xem:", "values", column="tên khách hàng"),)),
+    Report("repeat_serials", "Serial bị gửi nhiều lần", _serial, "serial_lap_lai.xlsx",
+           (Param("view", "Xem theo:", "radio", options=tuple(SERIAL_VIEWS)),), paged=True),
+    Report("technician_summary", "Hiệu suất sửa chữa theo kỹ thuật viên",
+           lambda ctx: q.query_21_technician_status_summary(ctx.data, colmap=ctx.colmap, cube=ctx.cube),
+           "hieu_suat_ktv.xlsx"),
+    Report("top_customers_by_product", "Top khách hàng gửi nhiều nhất theo sản phẩm",
+           lambda ctx, product: q.query_16_top_customers_by_product(ctx.data, product, colmap=ctx.colmap, cube=ctx.cube),
+           "top_khach_{product}.xlsx",
+           (Param("product", "📦 Chọn sản phẩm", "values", column="sản phẩm", sort=True),)),
+    Report("top_products_by_customer", "Top sản phẩm gửi nhiều nhất theo khách hàng",
+           lambda ctx, customer: q.query_5_top_products_by_customer(ctx.data, customer, top_n=30, colmap=ctx.colmap, cube=ctx.cube),
+           "top_san_pham_{customer}.xlsx",
+           (Param("customer", "👤 Chọn khách hàng", "values", column="tên khách hàng", sort=True),)),
+    Report("turnaround", "Phân vị thời gian xử lý & SLA",
+           lambda ctx, dimension, sla_days: q.query_turnaround_by(ctx.data, dimension, sla_days=sla_days, colmap=ctx.colmap),
+           "phan_vi_thoi_gian_xu_ly.xlsx",
+           (Param("dimension", "Phân tích theo:", options=tuple(TURNAROUND_DIMENSIONS)),
+            SLA_PARAM),
+           chart=_trend_chart),
+]
+
+# Báo cáo phụ (không có trong danh sách chọn), chạy từ biểu đồ của báo cáo khác
+TURNAROUND_TREND = Report("turnaround_trend", "Xu hướng thời gian xử lý",
+                          lambda ctx, sla_days: q.query_turnaround_trend(ctx.data, sla_days=sla_days, colmap=ctx.colmap),
+                          "xu_huong_thoi_gian_xu_ly.xlsx", (SLA_PARAM,))
+
+REPORTS_BY_KEY = {report.key: report for report in REPORTS + [TURNAROUND_TREND]}
+
+
+class ReportExecutor:
+    """
+    Chạy mọi báo cáo qua một chỗ: kết quả nhớ theo (báo cáo, tham số, bộ lọc, phiên bản
+    dữ liệu) trong LRU, thời gian chạy thật của từng báo cáo được ghi lại.
+    """
+
+    def __init__(self, maxsize=REPORT_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._results = OrderedDict()
+        self._timings = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def run(self, report, ctx, **params):
+        key = (report.key, tuple(sorted(params.items())), ctx.key)
+        started = time.perf_counter()
+        with self._lock:
+            cached = self._results.get(key)
+            if cached is not None:
+                self._results.move_to_end(key)
+                self.hits += 1
+        if cached is not None:
+            title, df = cached
+            return ReportResult(title, df, (time.perf_counter() - started) * 1000, True)
+
+        title, df = report.run(ctx, **params)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        with self._lock:
+            self.misses += 1
+            self._results[key] = (title, df)
+            while len(self._results) > self.maxsize:
+                self._results.popitem(last=False)
+            self._timings.setdefault(report.key, deque(maxlen=TIMING_WINDOW)).append(elapsed_ms)
+        return ReportResult(title, df, elapsed_ms, False)
+
+    def clear(self):
+        with self._lock:
+            self._results.clear()
+
+    def stats(self):
+        """
+        Số lần chạy thật và độ trễ (ms) theo từng báo cáo, cùng tỉ lệ trúng cache
+        """
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 3) if total else None,
+                "reports": {
+                    key: {
+                        "runs": len(values),
+                        "last_ms": round(values[-1], 1),
+                        "p50_ms": percentile(list(values), 0.5),
+                        "p95_ms": percentile(list(values), 0.95),
+                    }
+                    for key, values in self._timings.items()
+                },
+            }
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_report_executor():
+    """
+    ReportExecutor dùng chung cho cả tiến trình
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ReportExecutor()
+        return _executor
@@ -0,0 +1,179 @@
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+from rma_utils import column_index, fold_for_match
+
+# Các trường tìm nhanh ở tab 1 → từ khoá tra cột
+SEARCH_FIELDS = {
+    "customer": "khách hàng",
+    "product": "sản phẩm",
+    "serial": "serial",
+}
+
+INDEX_CACHE_SIZE = 2
+_index_cache = OrderedDict()
+_index_lock = threading.Lock()
+
+
+def _trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class _ValueGroups:
+    """
+    Các giá trị phân biệt của một cột và vị trí dòng (đã sắp xếp) của từng giá trị
+    """
+
+    def __init__(self, series):
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            codes = series.cat.codes.to_numpy()
+            values = series.cat.categories
+        else:
+            codes, values = pd.factorize(series)
+        self.values = [str(v) for v in values]
+        self.order = np.argsort(codes, kind="stable")
+        valid = codes >= 0
+        self.counts = np.bincount(codes[valid], minlength=len(self.values))
+        self.starts = np.concatenate([[0], np.cumsum(self.counts)]) + (~valid).sum()
+
+    def positions(self, value_id):
+        return self.order[self.starts[value_id]:self.starts[value_id + 1]]
+
+    def rows(self, value_ids):
+        if not len(value_ids):
+            return np.empty(0, dtype=np.int64)
+        return np.sort(np.concatenate([self.positions(i) for i in value_ids]))
+
+
+class _TextField:
+    """
+    Chỉ mục trigram (đã bỏ dấu theo fold_for_match) trên các giá trị phân biệt
+    """
+
+    def __init__(self, series):
+        self.groups = _ValueGroups(series)
+        self.normalized = [fold_for_match(v) for v in self.groups.values]
+        self.trigrams = {}
+        for value_id, text in enumerate(self.normalized):
+            for gram in _trigrams(text):
+                self.trigrams.setdefault(gram, set()).add(value_id)
+
+    def match(self, query):
+        """
+        id các giá trị chứa `query` (không phân biệt dấu, hoa thường)
+        """
+        q = fold_for_match(query)
+        if not q:
+            return []
+        if len(q) < 3:
+            candidates = range(len(self.normalized))
+        else:
+            # Giá trị chứa q thì phải chứa mọi trigram của q → giao các tập ứng viên
+            grams = sorted((self.trigrams.get(g, set()) for g in _trigrams(q)), key=len)
+            candidates = set.intersection(*grams)
+        return [i for i in candidates if q in self.normalized[i]]
+
+    def rank(self, query, value_ids):
+        q = fold_for_match(query)
+
+        def score(value_id):
+            text = self.normalized[value_id]
+            if text == q:
+                level = 0
+            elif text.startswith(q):
+                level = 1
+            elif any(token.startswith(q) for token in text.split()):
+                level = 2
+            else:
+                level = 3
+            return level, -self.groups.counts[value_id], text
+
+        return sorted(value_ids, key=score)
+
+
+class SearchIndex:
+    """
+    Chỉ mục tìm nhanh theo khách hàng/sản phẩm/serial, build một lần cho mỗi phiên bản
+    dữ liệu. Gợi ý và danh sách dòng khớp lấy từ chỉ mục thay vì quét lại cả cột.
+    """
+
+    def __init__(self, df, colmap=None):
+        colmap = colmap or column_index(df.columns)
+        self.rows = len(df)
+        self.columns = {}
+        self.fields = {}
+        self.serials = None
+        for field, keyword in SEARCH_FIELDS.items():
+            col = colmap.get(keyword)
+            if not col:
+                continue
+            self.columns[field] = col
+            if field == "serial":
+                groups = _ValueGroups(df[col])
+                lookup = {}
+                for value_id, value in enumerate(groups.values):
+                    lookup.setdefault(fold_for_match(value), []).append(value_id)
+                self.serials = (groups, lookup)
+            else:
+                self.fields[field] = _TextField(df[col])
+
+    def field_for(self, keyword):
+        for field, kw in SEARCH_FIELDS.items():
+            if kw == keyword and field in self.columns:
+                return field
+        return None
+
+    def suggest(self, field, query, limit=3):
+        text_field = self.fields.get(field)
+        if text_field is None:
+            return []
+        ranked = text_field.rank(query, text_field.match(query))
+        return [text_field.groups.values[i] for i in ranked[:limit]]
+
+    def lookup_serial(self, serial):
+        """
+        Vị trí các dòng có đúng số serial (tra bảng băm, O(1))
+        """
+        if self.serials is None:
+            return np.empty(0, dtype=np.int64)
+        groups, lookup = self.serials
+        return groups.rows(lookup.get(fold_for_match(serial), []))
+
+    def find_rows(self, field, query):
+        """
+        Vị trí các dòng chứa `query` ở trường `field`; serial ưu tiên khớp chính xác
+        """
+        if field == "serial":
+            rows = self.lookup_serial(query)
+            if len(rows) or self.serials is None:
+                return rows
+            groups, lookup = self.serials
+            q = fold_for_match(query)
+            value_ids = [i for key, ids in lookup.items() if q in key for i in ids]
+            return groups.rows(value_ids)
+        text_field = self.fields.get(field)
+        if text_field is None:
+            return np.empty(0, dtype=np.int64)
+        return text_field.groups.rows(text_field.match(query))
+
+    def mask(self, field, query):
+        mask = np.zeros(self.rows, dtype=bool)
+        mask[self.find_rows(field, query)] = True
+        return mask
+
+
+def get_search_index(df, version, colmap=None):
+    """
+    SearchIndex của frame gốc theo phiên bản dữ liệu (chỉ dùng với frame gốc, chưa lọc)
+    """
+    with _index_lock:
+        if version in _index_cache:
+            _index_cache.move_to_end(version)
+            return _index_cache[version]
+    index = SearchIndex(df, colmap)
+    with _index_lock:
+        _index_cache[version] = index
+        while len(_index_cache) > INDEX_CACHE_SIZE:
+            _index_cache.popitem(last=False)
+    return index
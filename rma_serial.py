@@ -0,0 +1,243 @@
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+from rma_utils import column_index
+
+# Các mốc "quay lại trong N ngày" mặc định
+RETURN_WINDOWS = (7, 30, 90)
+# Ngày trống được xếp trước mọi ngày thật trong từng serial
+_NO_DATE = np.iinfo(np.int32).min
+
+# Số phiên bản giữ chỉ mục cùng lúc (bản đang phục vụ + bản cũ phiên khác còn dùng)
+INDEX_CACHE_SIZE = 2
+_index_cache = OrderedDict()
+_index_lock = threading.Lock()
+
+
+def _serial_values(series):
+    values = series.astype("string").str.strip()
+    return values.mask(values == "")
+
+
+def _day_numbers(series):
+    dates = pd.to_datetime(series, errors="coerce")
+    days = dates.to_numpy(dtype="datetime64[D]").astype(np.int64)
+    return np.where(dates.isna().to_numpy(), _NO_DATE, days).astype(np.int64)
+
+
+class SerialIndex:
+    """
+    Chỉ mục serial → vị trí các dòng (sắp theo ngày tiếp nhận) trên frame gốc.
+    Bản dữ liệu mới chỉ nối thêm dòng thì chỉ mục được mở rộng từ bản trước
+    (chèn các dòng mới vào đúng chỗ) thay vì sắp xếp lại toàn bộ.
+    """
+
+    def __init__(self, df, colmap=None, _state=None):
+        colmap = colmap or column_index(df.columns)
+        self.col_serial = colmap.get("serial")
+        self.col_date = colmap.get("ngày tiếp nhận")
+        self.col_product = colmap.get("sản phẩm")
+        self.col_customer = colmap.get("tên khách hàng")
+        self.df = df
+        self.n = len(df)
+        if _state is not None:
+            self.lookup, self.serials, self.codes, self.days, self.order = _state
+        else:
+            self._build(df)
+        self._finish()
+
+    def _build(self, df):
+        serials = _serial_values(df[self.col_serial])
+        codes, uniques = pd.factorize(serials)
+        self.serials = list(uniques)
+        self.lookup = {serial: code for code, serial in enumerate(self.serials)}
+        self.codes = codes.astype(np.int64)
+        self.days = _day_numbers(df[self.col_date]) if self.col_date else np.zeros(self.n, dtype=np.int64)
+        self.order = np.argsort(self._keys(self.codes, self.days), kind="stable")
+
+    @staticmethod
+    def _keys(codes, days):
+        # Khoá (serial, ngày) gộp vào một int64; dòng không có serial (-1) bị đẩy lên đầu
+        return (codes << 32) + (days - _NO_DATE)
+
+    def _finish(self):
+        valid = self.codes[self.order] >= 0
+        self.order = self.order[valid] if not valid.all() else self.order
+        self.counts = np.bincount(self.codes[self.order], minlength=len(self.serials))
+        self.starts = np.concatenate([[0], np.cumsum(self.counts)[:-1]])
+
+    def extended(self, df, colmap=None):
+        """
+        Chỉ mục cho `df` = frame cũ + các dòng nối thêm; None nếu phần đầu đã thay đổi
+        """
+        colmap = colmap or column_index(df.columns)
+        if len(df) < self.n or colmap.get("serial") != self.col_serial:
+            return None
+        old_serials = _serial_values(df[self.col_serial].iloc[:self.n])
+        if not old_serials.equals(_serial_values(self.df[self.col_serial])):
+            return None
+        if self.col_date and not np.array_equal(_day_numbers(df[self.col_date].iloc[:self.n]), self.days):
+            return None
+
+        new_serials = _serial_values(df[self.col_serial].iloc[self.n:])
+        lookup, serials = dict(self.lookup), list(self.serials)
+        new_codes = np.empty(len(new_serials), dtype=np.int64)
+        for i, serial in enumerate(new_serials):
+            if pd.isna(serial):
+                new_codes[i] = -1
+                continue
+            code = lookup.get(serial)
+            if code is None:
+                code = lookup[serial] = len(serials)
+                serials.append(serial)
+            new_codes[i] = code
+        new_days = _day_numbers(df[self.col_date].iloc[self.n:]) if self.col_date else np.zeros(len(new_codes), dtype=np.int64)
+
+        # Trộn hai dãy đã sắp theo khoá: vị trí chèn tìm bằng searchsorted
+        old_keys = self._keys(self.codes[self.order], self.days[self.order])
+        new_order = self.n + np.argsort(self._keys(new_codes, new_days), kind="stable")
+        new_keys = self._keys(new_codes, new_days)[new_order - self.n]
+        order = np.insert(self.order, np.searchsorted(old_keys, new_keys, side="right"), new_order)
+        codes = np.concatenate([self.codes, new_codes])
+        days = np.concatenate([self.days, new_days])
+        return SerialIndex(df, colmap, _state=(lookup, serials, codes, days, order))
+
+    def positions(self, serial):
+        code = self.lookup.get(str(serial).strip())
+        if code is None:
+            return np.empty(0, dtype=np.int64)
+        return self.order[self.starts[code]:self.starts[code] + self.counts[code]]
+
+    def _view(self, rows=None):
+        """
+        (order, codes, days) đã sắp theo serial/ngày, chỉ gồm các dòng `rows` (nhãn index = vị trí)
+        """
+        order = self.order
+        if rows is not None:
+            selected = np.zeros(self.n, dtype=bool)
+            selected[np.asarray(rows, dtype=np.int64)] = True
+            order = order[selected[order]]
+        return order, self.codes[order], self.days[order]
+
+    def _returns(self, rows=None):
+        order, codes, days = self._view(rows)
+        counts = np.bincount(codes, minlength=len(self.serials))
+        # Lần gửi thứ 2 trở đi của cùng serial; khoảng cách tính từ lần gửi trước
+        repeat = np.zeros(len(order), dtype=bool)
+        repeat[1:] = codes[1:] == codes[:-1]
+        gaps = np.full(len(order), np.nan)
+        has_dates = repeat.copy()
+        has_dates[1:] &= (days[1:] != _NO_DATE) & (days[:-1] != _NO_DATE)
+        gaps[has_dates] = (days[1:] - days[:-1])[has_dates[1:]]
+        return order, codes, days, counts, repeat, gaps
+
+    def repeat_summary(self, rows=None, min_count=2):
+        """
+        Mỗi serial gửi >= min_count lần một dòng: số lần, lần đầu/gần nhất, khoảng cách
+        giữa các lần gửi, sản phẩm và khách hàng của lần gần nhất
+        """
+        order, codes, days, counts, repeat, gaps = self._returns(rows)
+        if not len(order):
+            return pd.DataFrame()
+        first = ~repeat
+        last = np.append(~repeat[1:], True)
+        gap_sum = np.bincount(codes, weights=np.nan_to_num(gaps), minlength=len(self.serials))
+        gap_n = np.bincount(codes, weights=~np.isnan(gaps), minlength=len(self.serials))
+        gap_min = pd.Series(gaps).groupby(codes).min().reindex(range(len(self.serials))).to_numpy()
+
+        serial_codes = codes[first]
+        keep = counts[serial_codes] >= min_count
+        serial_codes = serial_codes[keep]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean_gap = gap_sum[serial_codes] / gap_n[serial_codes]
+        out = {
+            "Serial": [self.serials[c] for c in serial_codes],
+            "Số lần gặp": counts[serial_codes],
+        }
+        if self.col_date:
+            out["Lần đầu"] = _to_dates(days[first][keep])
+            out["Lần gần nhất"] = _to_dates(days[last][keep])
+            out["Khoảng cách TB (ngày)"] = np.round(mean_gap, 1)
+            out["Ngắn nhất (ngày)"] = gap_min[serial_codes]
+        last_rows = order[last][keep]
+        for label, col in (("Sản phẩm", self.col_product), ("Khách hàng", self.col_customer)):
+            if col:
+                out[label] = self.df[col].to_numpy()[last_rows]
+        result = pd.DataFrame(out)
+        return result.sort_values(["Số lần gặp", "Serial"], ascending=[False, True], ignore_index=True)
+
+    def repeat_rate(self, by="Sản phẩm", rows=None):
+        """
+        Tỉ lệ serial bị gửi lại theo sản phẩm hoặc khách hàng (lấy theo lần gửi đầu tiên)
+        """
+        col = self.col_product if by == "Sản phẩm" else self.col_customer
+        if not col:
+            return pd.DataFrame()
+        order, codes, days, counts, repeat, gaps = self._returns(rows)
+        if not len(order):
+            return pd.DataFrame()
+        first = ~repeat
+        frame = pd.DataFrame({
+            by: self.df[col].to_numpy()[order[first]],
+            "lượt": counts[codes[first]],
+        })
+        frame["lặp"] = frame["lượt"] > 1
+        table = frame.groupby(by, observed=True).agg(
+            **{"Số serial": ("lượt", "size"), "Serial bị gửi lại": ("lặp", "sum"), "Tổng lượt gửi": ("lượt", "sum")}
+        )
+        table["Lượt gửi lại"] = table["Tổng lượt gửi"] - table["Số serial"]
+        table["Tỉ lệ serial lặp (%)"] = (table["Serial bị gửi lại"] / table["Số serial"] * 100).round(1)
+        return table.reset_index().sort_values("Tỉ lệ serial lặp (%)", ascending=False, ignore_index=True)
+
+    def return_cohorts(self, windows=RETURN_WINDOWS, rows=None):
+        """
+        Số lượt và số serial quay lại trong vòng N ngày kể từ lần gửi trước
+        """
+        order, codes, days, counts, repeat, gaps = self._returns(rows)
+        n_serials = int((counts > 0).sum())
+        rows_out = []
+        for window in windows:
+            hit = ~np.isnan(gaps) & (gaps <= window)
+            n_serial_hit = len(np.unique(codes[hit]))
+            rows_out.append({
+                "Quay lại trong (ngày)": window,
+                "Số lượt": int(hit.sum()),
+                "Số serial": n_serial_hit,
+                "Tỉ lệ serial (%)": round(n_serial_hit / n_serials * 100, 1) if n_serials else 0.0,
+            })
+        return pd.DataFrame(rows_out)
+
+
+def _to_dates(days):
+    dates = days.astype("datetime64[D]")
+    return pd.to_datetime(np.where(days == _NO_DATE, np.datetime64("NaT"), dates))
+
+
+def get_serial_index(df, colmap=None):
+    """
+    SerialIndex cho frame gốc theo phiên bản dữ liệu (LRU vài phiên bản: phiên còn dùng
+    bản cũ không đẩy mất chỉ mục đã dựng sẵn cho bản mới); phiên bản mới chỉ nối thêm
+    dòng thì mở rộng từ chỉ mục của phiên bản trước
+    """
+    colmap = colmap or column_index(df.columns)
+    if not colmap.get("serial"):
+        return None
+    version = df.attrs.get("version")
+    key = (version, len(df))
+    with _index_lock:
+        if version is not None and key in _index_cache:
+            _index_cache.move_to_end(key)
+            return _index_cache[key]
+        # Bản gần nhất (nhiều dòng nhất nhưng không hơn df) là ứng viên để mở rộng
+        previous = max((index for index in _index_cache.values() if index.n <= len(df)),
+                       key=lambda index: index.n, default=None)
+    index = previous.extended(df, colmap) if previous is not None else None
+    if index is None:
+        index = SerialIndex(df, colmap)
+    if version is not None:
+        with _index_lock:
+            _index_cache[key] = index
+            while len(_index_cache) > INDEX_CACHE_SIZE:
+                _index_cache.popitem(last=False)
+    return index
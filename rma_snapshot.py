@@ -0,0 +1,84 @@
+import os
+import json
+import time
+import numpy as np
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+except ImportError:  # pyarrow không có → chạy không snapshot
+    pa = None
+    feather = None
+
+# Tăng khi thay đổi cách parse/định kiểu dữ liệu để snapshot cũ tự bị build lại
+SNAPSHOT_SCHEMA_VERSION = 4
+SNAPSHOT_DIR = os.getenv("RMA_SNAPSHOT_DIR", ".rma_cache")
+
+
+class SnapshotStore:
+    """
+    Lưu bản dữ liệu đã parse ra đĩa dạng Feather (Arrow IPC, không nén) để lần
+    khởi động sau đọc bằng memory-map thay vì tải CSV và parse lại ngày tháng.
+    """
+
+    def __init__(self, directory=SNAPSHOT_DIR, name="rma_snapshot"):
+        self.directory = directory
+        self.data_path = os.path.join(directory, f"{name}.feather")
+        self.hash_path = os.path.join(directory, f"{name}_hashes.npy")
+        self.meta_path = os.path.join(directory, f"{name}.json")
+
+    @property
+    def enabled(self):
+        return feather is not None
+
+    def load(self):
+        """
+        Trả về (data, meta, row_hashes) hoặc None nếu chưa có snapshot hợp lệ
+        """
+        if not self.enabled or not os.path.exists(self.meta_path):
+            return None
+        try:
+            with open(self.meta_path, encoding="utf-8") as f:
+                meta = json.load(f)
+            if meta.get("schema_version") != SNAPSHOT_SCHEMA_VERSION:
+                return None
+            table = feather.read_table(self.data_path, memory_map=True)
+            data = table.to_pandas()
+            row_hashes = None
+            if os.path.exists(self.hash_path):
+                row_hashes = np.load(self.hash_path, mmap_mode="r")
+                if len(row_hashes) != len(data):
+                    row_hashes = None
+        except (OSError, ValueError, pa.ArrowException):
+            return None
+        return data, meta, row_hashes
+
+    def save(self, dataset):
+        if not self.enabled:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        meta = {
+            "schema_version": SNAPSHOT_SCHEMA_VERSION,
+            "version": dataset.version,
+            "etag": dataset.etag,
+            "last_modified": dataset.last_modified,
+            "header": dataset.header,
+            "rows": len(dataset.data),
+            "schema_report": dataset.schema_report,
+            "date_formats": dataset.data.attrs.get("date_formats", {}),
+            "saved_at": time.time(),
+        }
+        # Ghi file tạm rồi os.replace để tiến trình khác không đọc phải file ghi dở
+        tmp_data = self.data_path + ".tmp"
+        feather.write_feather(dataset.data.reset_index(drop=True), tmp_data, compression="uncompressed")
+        os.replace(tmp_data, self.data_path)
+        if dataset.row_hashes is not None:
+            tmp_hash = self.hash_path + ".tmp.npy"
+            np.save(tmp_hash, np.asarray(dataset.row_hashes))
+            os.replace(tmp_hash, self.hash_path)
+        elif os.path.exists(self.hash_path):
+            os.remove(self.hash_path)
+        tmp_meta = self.meta_path + ".tmp"
+        with open(tmp_meta, "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False)
+        os.replace(tmp_meta, self.meta_path)
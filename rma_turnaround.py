@@ -0,0 +1,160 @@
+import os
+import numpy as np
+import pandas as pd
+from rma_utils import column_index, parse_date_column
+
+# Cột số ngày từ tiếp nhận tới trả khách, thêm một lần khi parse mỗi phiên bản dữ liệu
+TURNAROUND_COL = "Số ngày xử lý"
+SLA_DAYS = int(os.getenv("RMA_SLA_DAYS", "7"))
+PERCENTILES = (0.5, 0.9, 0.99)
+
+# Các chiều phân tích thời gian xử lý: nhãn hiển thị → từ khoá tra cột
+TURNAROUND_DIMENSIONS = {
+    "Khách hàng": "tên khách hàng",
+    "Sản phẩm": "sản phẩm",
+    "Kỹ thuật viên": "KTV",
+    "Nhóm hàng": "nhóm hàng",
+}
+
+
+def add_turnaround_column(df, colmap=None):
+    """
+    Thêm cột TURNAROUND_COL (float32, NaN khi thiếu ngày) = số ngày trả khách − tiếp nhận
+    """
+    colmap = colmap or column_index(df.columns)
+    col_nhan = colmap.get("ngay tiep nhan")
+    col_tra = colmap.get("ngay tra khach")
+    if not col_nhan or not col_tra or col_tra == TURNAROUND_COL:
+        return df
+    received = parse_date_column(df, col_nhan)
+    returned = parse_date_column(df, col_tra)
+    df[TURNAROUND_COL] = (returned - received).dt.days.astype("float32")
+    return df
+
+
+def turnaround_days(df, colmap=None):
+    """
+    Series số ngày xử lý; frame cũ (chưa có cột) thì tính tại chỗ
+    """
+    if TURNAROUND_COL in df.columns:
+        return df[TURNAROUND_COL]
+    df = add_turnaround_column(df.copy(), colmap)
+    return df[TURNAROUND_COL] if TURNAROUND_COL in df.columns else None
+
+
+def _grouped_stats(codes, n_groups, days, sla_days, percentiles):
+    """
+    Một lượt sắp xếp (nhóm, số ngày) rồi lấy phân vị bằng chỉ số trong từng đoạn:
+    count/mean/max/p50/p90/p99/số lượt quá SLA cho mọi nhóm cùng lúc
+    """
+    valid = (codes >= 0) & ~np.isnan(days)
+    codes, days = codes[valid], days[valid].astype(np.float64)
+    if len(days):
+        # Khoá gộp nhóm * span + số ngày: một argsort thay cho lexsort hai khoá
+        low = days.min()
+        order = np.argsort(codes * (days.max() - low + 1) + (days - low))
+    else:
+        order = np.empty(0, dtype=np.int64)
+    codes, days = codes[order], days[order]
+    counts = np.bincount(codes, minlength=n_groups)
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    has = counts > 0
+    stats = {"count": counts}
+    with np.errstate(invalid="ignore", divide="ignore"):
+        stats["mean"] = np.bincount(codes, weights=days, minlength=n_groups) / counts
+    last = np.where(has, starts + counts - 1, 0)
+    for q in percentiles:
+        # Nội suy tuyến tính giống Series.quantile()
+        position = starts + (counts - 1) * q
+        low = np.floor(position).astype(np.int64)
+        high = np.ceil(position).astype(np.int64)
+        low, high = np.where(has, low, 0), np.where(has, high, 0)
+        value = days[low] + (days[high] - days[low]) * (position - np.floor(position)) if len(days) else np.zeros(n_groups)
+        stats[f"p{round(q * 100)}"] = np.where(has, value, np.nan)
+    stats["max"] = np.where(has, days[last] if len(days) else 0, np.nan)
+    stats["breaches"] = np.bincount(codes, weights=days > sla_days, minlength=n_groups).astype(np.int64)
+    return stats
+
+
+def turnaround_stats(df, by=None, sla_days=SLA_DAYS, percentiles=PERCENTILES, colmap=None):
+    """
+    Thời gian xử lý theo các cột `by` (None = toàn bộ): số lượt, trung bình,
+    các phân vị, lâu nhất, số lượt và tỉ lệ quá SLA
+    """
+    days = turnaround_days(df, colmap)
+    if days is None:
+        return pd.DataFrame()
+    by = [by] if isinstance(by, str) else list(by or [])
+    if len(by) == 1 and isinstance(df[by[0]].dtype, pd.CategoricalDtype):
+        # Cột category: mã nhóm chính là codes, không cần groupby
+        codes = df[by[0]].cat.codes.to_numpy(dtype=np.int64)
+        index = pd.Index(df[by[0]].cat.categories, name=by[0])
+    elif by:
+        grouper = df.groupby(by, observed=True, sort=True)
+        codes = grouper.ngroup().to_numpy(dtype=np.int64)
+        index = grouper.size().index
+    else:
+        codes = np.zeros(len(df), dtype=np.int64)
+        index = pd.RangeIndex(1)
+    stats = _grouped_stats(codes, len(index), days.to_numpy(dtype=np.float64, na_value=np.nan), sla_days, percentiles)
+
+    table = pd.DataFrame({"Số lượt": stats["count"], "Trung bình (ngày)": np.round(stats["mean"], 2)}, index=index)
+    for q in percentiles:
+        table[f"P{round(q * 100)} (ngày)"] = np.round(stats[f"p{round(q * 100)}"], 2)
+    table["Lâu nhất (ngày)"] = stats["max"]
+    table[f"Quá SLA {sla_days} ngày"] = stats["breaches"]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        table["Tỉ lệ quá SLA (%)"] = np.round(stats["breaches"] / stats["count"] * 100, 1)
+    table = table[table["Số lượt"] > 0]
+    return table.reset_index() if by else table.reset_index(drop=True)
+
+
+def _rolling_by_month(codes, months, values, window):
+    """
+    Trung bình trượt `window` tháng lịch của values trong từng nhóm (codes): tháng không có
+    lượt nào không được tính vào cửa sổ, nên cửa sổ không kéo sang tháng xa hơn
+    """
+    span = months.max() - months.min() + window
+    keys = codes * span + (months - months.min())
+    order = np.argsort(keys, kind="stable")
+    keys, values = keys[order], values[order]
+    present = ~np.isnan(values)
+    sums = np.concatenate([[0.0], np.cumsum(np.where(present, values, 0.0))])
+    counts = np.concatenate([[0], np.cumsum(present)])
+    # Đầu cửa sổ: dòng đầu tiên có khoá >= khoá hiện tại − (window − 1) tháng, cùng nhóm
+    start = np.searchsorted(keys, keys - (window - 1), side="left")
+    end = np.arange(1, len(keys) + 1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = (sums[end] - sums[start]) / (counts[end] - counts[start])
+    result = np.empty_like(mean)
+    result[order] = mean
+    return result
+
+
+def turnaround_trend(df, by=None, window=3, sla_days=SLA_DAYS, colmap=None):
+    """
+    Xu hướng theo tháng tiếp nhận: số liệu từng tháng (cùng một lượt nhóm) kèm trung
+    bình trượt `window` tháng của P50/P90 và tỉ lệ quá SLA cho từng giá trị của `by`
+    """
+    colmap = colmap or column_index(df.columns)
+    col_nhan = colmap.get("ngay tiep nhan")
+    if not col_nhan:
+        return pd.DataFrame()
+    months = pd.to_datetime(df[col_nhan], errors="coerce").dt.to_period("M").rename("Tháng")
+    keys = [df[by]] if by else []
+    frame = pd.concat(keys + [months], axis=1)
+    frame[TURNAROUND_COL] = turnaround_days(df, colmap)
+    table = turnaround_stats(frame, [*(k.name for k in keys), "Tháng"], sla_days, (0.5, 0.9), colmap)
+    if table.empty:
+        return table
+    rolling_cols = ["P50 (ngày)", "P90 (ngày)", "Tỉ lệ quá SLA (%)"]
+    if by:
+        codes = table.groupby(by, observed=True, sort=False).ngroup().to_numpy(dtype=np.int64)
+    else:
+        codes = np.zeros(len(table), dtype=np.int64)
+    month_ordinals = pd.PeriodIndex(table["Tháng"]).asi8
+    for col in rolling_cols:
+        rolled = _rolling_by_month(codes, month_ordinals, table[col].to_numpy(dtype=np.float64), window)
+        table[f"{col} – TB {window} tháng"] = np.round(rolled, 2)
+    table["Tháng"] = table["Tháng"].astype(str)
+    return table
@@ -1,3 +1,4 @@
+import numpy as np
 import pandas as pd
 
 COLUMN_MAPPING = {
@@ -84,27 +85,99 @@ COLUMN_MAPPING = {
     ]
 }
 
+# Kiểu dữ liệu gọn cho các cột chuẩn: chuỗi lặp lại → category, cờ trạng thái → int8
+COLUMN_DTYPES = {
+    "Tên khách hàng": "category",
+    "Sản phẩm": "category",
+    "Nhóm hàng": "category",
+    "Kỹ thuật viên": "category",
+    "Tên lỗi": "category",
+    "Đã sửa xong": "int8",
+    "Không sửa được": "int8",
+    "Từ chối bảo hành": "int8",
+    "Năm": "Int16",
+    "Tháng": "Int8",
+    "Quý": "Int8",
+}
+
 import unicodedata
 import re
+import warnings
+from collections import namedtuple
+from functools import lru_cache
+from pandas.tseries.api import guess_datetime_format
+
+VIETNAMESE_LETTERS = "àáạảãâầấậẩẫăằắặẳẵèéẹẻẽêềếệểễìíịỉĩòóọỏõôồốộổỗơờớợởỡùúụủũưừứựửữỳýỵỷỹđ"
+
+class _FoldTable(dict):
+    """
+    Bảng cho str.translate: ký tự → dạng NFKD đã bỏ dấu kết hợp, tính lần đầu gặp rồi
+    nhớ lại. NFKD phân rã từng ký tự độc lập và chỉ sắp lại các dấu kết hợp (đều bị
+    bỏ), nên dịch từng ký tự cho kết quả y hệt chuẩn hoá cả chuỗi rồi lọc dấu.
+    """
+
+    def __init__(self, extra=None):
+        super().__init__()
+        self.extra = extra or {}
+        # Nạp sẵn chữ tiếng Việt có dấu (thường + hoa)
+        for ch in VIETNAMESE_LETTERS + VIETNAMESE_LETTERS.upper():
+            self[ord(ch)]
+
+    def __missing__(self, codepoint):
+        folded = "".join(c for c in unicodedata.normalize("NFKD", chr(codepoint)) if not unicodedata.combining(c))
+        for source, target in self.extra.items():
+            folded = folded.replace(source, target)
+        self[codepoint] = folded
+        return folded
+
+
+_FOLD_TABLE = _FoldTable()
+_CLEAN_TABLE = _FoldTable({"đ": "d", "Đ": "d"})
+_NON_WORD = re.compile(r'[\W_]+')
+_SPACES = re.compile(r'\s+')
+_MATCH_PUNCT = re.compile(r'[\-_\&]')
 
 def clean_text(text):
     if not isinstance(text, str): return ""
-    text = unicodedata.normalize('NFKD', text)
-    text = ''.join([c for c in text if not unicodedata.combining(c)])
-    text = text.replace('đ', 'd').replace('Đ', 'd')
+    if not text.isascii():
+        text = text.translate(_CLEAN_TABLE)
     text = text.lower().strip()
-    text = re.sub(r'[\W_]+', ' ', text)
-    text = re.sub(r'\s+', ' ', text)
+    text = _NON_WORD.sub(' ', text)
+    text = _SPACES.sub(' ', text)
     return text
 
 def normalize_for_match(text):
     text = str(text).lower()
-    text = unicodedata.normalize('NFKD', text)
-    text = ''.join([c for c in text if not unicodedata.combining(c)])
-    text = re.sub(r'[\-_\&]', '', text)
-    text = re.sub(r'\s+', ' ', text)
+    if not text.isascii():
+        text = text.translate(_FOLD_TABLE)
+    text = _MATCH_PUNCT.sub('', text)
+    text = _SPACES.sub(' ', text)
     return text.strip()
 
+def fold_for_match(text):
+    """
+    Khoá so khớp cho tìm kiếm: như normalize_for_match nhưng đ → d (vd "Đức" → "duc")
+    """
+    return normalize_for_match(text).replace("đ", "d")
+
+NORMALIZERS = {"clean": clean_text, "match": normalize_for_match}
+
+def normalize_column(series, how="clean"):
+    """
+    clean_text / normalize_for_match cho cả cột: mỗi giá trị phân biệt chỉ chuẩn hoá
+    một lần (factorize), trả về cột category cùng index; ô trống vẫn là NaN
+    """
+    normalize = NORMALIZERS[how]
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        codes, values = series.cat.codes.to_numpy(), series.cat.categories
+    else:
+        codes, values = pd.factorize(series)
+    # Nhiều giá trị gốc có thể cho cùng một dạng chuẩn ("Phong Vũ", "phong vu") → gộp mã
+    value_codes, categories = pd.factorize(pd.Index([normalize(v) for v in values], dtype=object))
+    value_codes = np.append(value_codes, -1)  # mã -1 (ô trống) trỏ vào phần tử cuối
+    normalized = pd.Categorical.from_codes(value_codes[codes], categories=categories)
+    return pd.Series(normalized, index=series.index, name=series.name)
+
 def match_block(name, keyword):
     n_name = normalize_for_match(name)
     n_key = normalize_for_match(keyword)
@@ -132,60 +205,215 @@ def find_col(cols, keyword, column_mapping={}):
             return col
     return None
 
+class ColumnMap:
+    """
+    Bảng tra cột vật lý, build một lần cho mỗi bộ cột: mỗi key của COLUMN_MAPPING
+    được dò sẵn, từ khoá tự do (vd "khách hàng") được nhớ lại sau lần tra đầu.
+    """
+
+    def __init__(self, cols, column_mapping=COLUMN_MAPPING):
+        self.cols = tuple(cols)
+        self.column_mapping = column_mapping
+        self._cleaned = [(col, clean_text(col)) for col in self.cols]
+        self._memo = {}
+        self.canonical = {key: self.get(key) for key in column_mapping}
+
+    def get(self, keyword):
+        if keyword not in self._memo:
+            self._memo[keyword] = self._resolve(keyword)
+        return self._memo[keyword]
+
+    def _resolve(self, keyword):
+        # Cùng thứ tự ưu tiên với find_col: alias → trùng khớp → chứa từ khoá
+        keyword_clean = clean_text(keyword)
+        for alias in self.column_mapping.get(keyword.strip(), []):
+            alias_clean = clean_text(alias)
+            for col, cleaned in self._cleaned:
+                if cleaned == alias_clean:
+                    return col
+        for col, cleaned in self._cleaned:
+            if keyword_clean == cleaned:
+                return col
+        for col, cleaned in self._cleaned:
+            if keyword_clean in cleaned:
+                return col
+        return None
+
+    def __getitem__(self, keyword):
+        return self.get(keyword)
+
+    @property
+    def missing(self):
+        """
+        Các cột chuẩn trong COLUMN_MAPPING không tìm được cột tương ứng
+        """
+        return [key for key, col in self.canonical.items() if col is None]
+
+    def report(self):
+        return {
+            "resolved": {key: col for key, col in self.canonical.items() if col is not None},
+            "missing": self.missing,
+        }
+
+
+@lru_cache(maxsize=32)
+def _column_map(cols):
+    return ColumnMap(cols)
+
+def column_index(cols):
+    """
+    ColumnMap dùng chung cho mọi frame có cùng bộ cột (chỉ build lại khi bộ cột đổi)
+    """
+    return _column_map(tuple(cols))
+
+def guess_date_format(series, sample=1000):
+    """
+    Định dạng ngày (strftime) cho cả cột, hoặc None nếu không đoán được. Giá trị đầu có
+    thể mơ hồ (05/02/2024 đọc được cả dd/mm lẫn mm/dd) nên thử cả hai cách và chọn định
+    dạng đọc được nhiều giá trị mẫu (rải đều trên cột) nhất; hoà thì giữ cách pandas tự đoán.
+    """
+    values = series.dropna().astype(str).str.strip()
+    values = values[values != ""]
+    if values.empty:
+        return None
+    values = values.iloc[::max(len(values) // sample, 1)]
+    candidates = []
+    for dayfirst in (False, True):
+        with warnings.catch_warnings():
+            # pandas cảnh báo khi đoán ra dd/mm mà dayfirst=False, ở đây thử cả hai là có chủ ý
+            warnings.simplefilter("ignore", UserWarning)
+            fmt = guess_datetime_format(values.iloc[0], dayfirst=dayfirst)
+        if fmt and fmt not in candidates:
+            candidates.append(fmt)
+    if len(candidates) < 2:
+        return candidates[0] if candidates else None
+    return max(candidates, key=lambda fmt: pd.to_datetime(values, format=fmt, errors="coerce").notna().sum())
+
+def parse_date_column(df, col):
+    """
+    Cột ngày → datetime64 với một định dạng cho cả cột. Định dạng lấy từ
+    df.attrs["date_formats"] nếu đã có (dòng mới khi đồng bộ tăng dần dùng định dạng của
+    cả sheet), chưa có thì đoán trên chính cột rồi ghi lại vào đó.
+    """
+    series = df[col]
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return series
+    formats = df.attrs.setdefault("date_formats", {})
+    if formats.get(col) is None:
+        formats[col] = guess_date_format(series)
+    return pd.to_datetime(series, format=formats[col], errors="coerce")
+
 def ensure_time_columns(df):
     date_col = None
     for col in df.columns:
-        cleaned = unicodedata.normalize('NFKD', col).lower().replace('đ','d')
-        cleaned = re.sub(r'[\W_]+', ' ', cleaned)
+        cleaned = clean_text(col)
         if ("ngay" in cleaned) and (("nhan" in cleaned) or ("tiep" in cleaned)):
             date_col = col
             break
     if date_col:
-        df[date_col] = pd.to_datetime(df[date_col], errors='coerce')
+        df[date_col] = parse_date_column(df, date_col)
         df["Năm"] = df[date_col].dt.year
         df["Tháng"] = df[date_col].dt.month
         df["Quý"] = df[date_col].dt.quarter
     return df
 
-def extract_time_filter_from_question(question):
-    years = re.findall(r"(20\d{2})", question)
-    years = [int(y) for y in years]
-    months = re.findall(r"tháng\s*(\d{1,2})", question)
-    months = [int(m) for m in months if 0 < int(m) <= 12]
-    quarters = re.findall(r"quý\s*([1234IiVv]+)", question)
-    quarter_map = {
-        "1": 1, "I": 1, "i": 1,
-        "2": 2, "II": 2, "ii": 2,
-        "3": 3, "III": 3, "iii": 3,
-        "4": 4, "IV": 4, "iv": 4,
+def _coerce_column(series, dtype):
+    if dtype == "category":
+        if isinstance(series.dtype, pd.CategoricalDtype) or pd.api.types.is_numeric_dtype(series):
+            return series
+        return series.astype("category")
+    numeric = pd.to_numeric(series, errors="coerce")
+    # Cột có giá trị chữ (vd "x", "Có") thì giữ nguyên để không mất thông tin
+    if numeric.isna().sum() > series.isna().sum():
+        return series
+    if dtype == "int8":
+        numeric = numeric.fillna(0)
+    values = numeric.dropna()
+    bounds = np.iinfo(dtype.lower())
+    if (values % 1 != 0).any() or (len(values) and (values.min() < bounds.min or values.max() > bounds.max)):
+        return series
+    return numeric.astype(dtype)
+
+def apply_schema(df, column_mapping=COLUMN_MAPPING, column_dtypes=COLUMN_DTYPES):
+    """
+    Ép các cột chuẩn (tìm theo COLUMN_MAPPING) về kiểu gọn để giảm RAM mỗi phiên.
+    Trả về (df, report) với report gồm cột đã đổi kiểu và bộ nhớ trước/sau (bytes).
+    """
+    mem_before = int(df.memory_usage(deep=True).sum())
+    converted = {}
+    colmap = ColumnMap(df.columns, column_mapping)
+    for key, dtype in column_dtypes.items():
+        col = colmap.get(key)
+        if col is None or col in converted:
+            continue
+        before = str(df[col].dtype)
+        df[col] = _coerce_column(df[col], dtype)
+        converted[col] = f"{before} → {df[col].dtype}"
+    mem_after = int(df.memory_usage(deep=True).sum())
+    report = {
+        "columns": converted,
+        "memory_before": mem_before,
+        "memory_after": mem_after,
     }
-    q_norm = []
-    for q in quarters:
-        qv = str(q).upper()
-        if qv in quarter_map:
-            q_norm.append(quarter_map[qv])
+    return df, report
+
+def count_values(series):
+    """
+    value_counts() nhưng bỏ các category không xuất hiện (khi cột là category)
+    """
+    counts = series.value_counts()
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        counts = counts[counts > 0]
+    return counts
+
+# Một regex biên dịch sẵn cho mọi khe thời gian trong câu hỏi: "tháng 3", "quý II",
+# "năm 2024" hoặc năm đứng riêng dạng 20xx; quét một lượt bằng finditer
+TIME_SLOT_PATTERN = re.compile(
+    r"tháng\s*(?P<month>\d{1,2})(?!\d)"
+    r"|quý\s*(?P<quarter>iv|i{1,3}|[1-4])(?!\w)"
+    r"|năm\s*(?P<year>\d{4})(?!\d)"
+    r"|(?<!\d)(?P<bare_year>20\d{2})(?!\d)",
+    re.IGNORECASE,
+)
+ROMAN_QUARTERS = {"i": 1, "ii": 2, "iii": 3, "iv": 4}
+
+TimeSlots = namedtuple("TimeSlots", ["years", "months", "quarters"])
+
+@lru_cache(maxsize=4096)
+def extract_time_slots(question):
+    """
+    Tách năm/tháng/quý (theo thứ tự xuất hiện) trong một lượt quét. Kết quả là
+    các tuple bất biến nên được nhớ lại cho các câu hỏi lặp lại.
+    """
+    years, months, quarters = [], [], []
+    for match in TIME_SLOT_PATTERN.finditer(question or ""):
+        if match["month"]:
+            month = int(match["month"])
+            if 1 <= month <= 12:
+                months.append(month)
+        elif match["quarter"]:
+            quarter = match["quarter"].lower()
+            quarters.append(ROMAN_QUARTERS.get(quarter) or int(quarter))
         else:
-            try:
-                q_norm.append(int(qv))
-            except:
-                pass
-    quarters = [q for q in q_norm if 1 <= q <= 4]
-    return years, months, quarters
-
-def filter_df_by_time(df, years=None, months=None, quarters=None):
-    df2 = df.copy()
-    if years and "Năm" in df2.columns:
-        df2 = df2[df2["Năm"].isin(years)]
-    if months and "Tháng" in df2.columns:
-        df2 = df2[df2["Tháng"].isin(months)]
-    if quarters and "Quý" in df2.columns:
-        df2 = df2[df2["Quý"].isin(quarters)]
-    return df2
+            years.append(int(match["year"] or match["bare_year"]))
+    return TimeSlots(tuple(years), tuple(months), tuple(quarters))
+
+def extract_time_filter_from_question(question):
+    years, months, quarters = extract_time_slots(question)
+    return list(years), list(months), list(quarters)
+
+def filter_df_by_time(df, years=None, months=None, quarters=None, version=None):
+    from rma_filters import FilterSpec
+    spec = FilterSpec.build(years=years, months=months, quarters=quarters)
+    return spec.apply(df, version=version)
 import streamlit as st
 
-def bo_loc_da_nang(df):
-    df_filtered = df.copy()
-    
+def bo_loc_da_nang_spec(df):
+    """
+    Vẽ bộ lọc nâng cao ở sidebar và trả về FilterSpec (chưa lọc dữ liệu)
+    """
+    from rma_filters import FilterSpec
+
     with st.sidebar.expander("📕 Bộ lọc nâng cao", expanded=False):
         col1, col2 = st.columns(2)
         years = sorted(df["Năm"].dropna().unique())
@@ -198,21 +426,19 @@ def bo_loc_da_nang(df):
         selected_quarters = col3.multiselect("Quý", quarters)
         date_range = col4.date_input("Ngày tiếp nhận (Từ – Đến)", [])
 
-        if selected_years:
-            df_filtered = df_filtered[df_filtered["Năm"].isin(selected_years)]
-        if selected_months:
-            df_filtered = df_filtered[df_filtered["Tháng"].isin(selected_months)]
-        if selected_quarters:
-            df_filtered = df_filtered[df_filtered["Quý"].isin(selected_quarters)]
-        if isinstance(date_range, list) and len(date_range) == 2:
-            col_date = find_col(df.columns, "ngày tiếp nhận")
-            if col_date:
-                df_filtered = df_filtered[
-                    (df_filtered[col_date] >= pd.to_datetime(date_range[0])) &
-                    (df_filtered[col_date] <= pd.to_datetime(date_range[1]))
-                ]
+    date_from = date_to = None
+    if isinstance(date_range, (list, tuple)) and len(date_range) == 2:
+        date_from, date_to = date_range
+    return FilterSpec.build(
+        years=selected_years,
+        months=selected_months,
+        quarters=selected_quarters,
+        date_from=date_from,
+        date_to=date_to,
+    )
 
-    return df_filtered
+def bo_loc_da_nang(df, version=None):
+    return bo_loc_da_nang_spec(df).apply(df, version=version)
 
 
 def render_result_table(results):
@@ -225,3 +451,14 @@ def render_result_table(results):
         html += f"<tr><td>{i}</td><td>{product}</td><td>{count}</td></tr>"
     html += "</table>"
     return html
+
+
+def percentile(values, q):
+    """
+    Phân vị `q` (0–1) theo hạng gần nhất của các số đo (ms, ...), làm tròn 1 chữ số;
+    None khi chưa có số đo nào. Dùng chung cho thống kê độ trễ của client, batch, báo cáo, API
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 1)
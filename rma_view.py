@@ -0,0 +1,151 @@
+import math
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+from rma_utils import fold_for_match
+
+PAGE_SIZES = (50, 100, 500, 1000)
+VIEW_CACHE_SIZE = 8
+# Số bộ lọc / cách sắp xếp nhớ lại trên mỗi kết quả
+STEP_CACHE_SIZE = 8
+
+_view_cache = OrderedDict()
+_view_lock = threading.Lock()
+
+
+def _remember(cache, key, value, size=STEP_CACHE_SIZE):
+    cache[key] = value
+    cache.move_to_end(key)
+    while len(cache) > size:
+        cache.popitem(last=False)
+    return value
+
+
+class ResultView:
+    """
+    Một bảng kết quả được giữ ở server: lọc chuỗi (không phân biệt dấu) và sắp xếp
+    tính một lần rồi nhớ lại dưới dạng mảng vị trí dòng, mỗi lần hiển thị chỉ cắt ra
+    đúng một trang.
+    """
+
+    def __init__(self, df):
+        self.df = df
+        self.n = len(df)
+        self._masks = OrderedDict()
+        self._orders = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _column_mask(self, series, needle):
+        # So khớp trên các giá trị phân biệt rồi ánh xạ lại theo mã, không duyệt từng dòng
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            codes, values = series.cat.codes.to_numpy(), series.cat.categories
+        else:
+            codes, values = pd.factorize(series)
+        hits = np.fromiter((needle in fold_for_match(v) for v in values), dtype=bool, count=len(values))
+        hits = np.append(hits, False)  # mã -1 (giá trị trống) trỏ vào phần tử cuối
+        return hits[codes]
+
+    def mask(self, query):
+        needle = fold_for_match(query or "")
+        if not needle:
+            return None
+        with self._lock:
+            if needle in self._masks:
+                self._masks.move_to_end(needle)
+                return self._masks[needle]
+        mask = np.zeros(self.n, dtype=bool)
+        for col in self.df.columns:
+            series = self.df[col]
+            if pd.api.types.is_numeric_dtype(series) and not isinstance(series.dtype, pd.CategoricalDtype):
+                continue
+            if pd.api.types.is_datetime64_any_dtype(series):
+                continue
+            mask |= self._column_mask(series, needle)
+        with self._lock:
+            return _remember(self._masks, needle, mask)
+
+    def order(self, sort_by=None, ascending=True):
+        if not sort_by or sort_by not in self.df.columns:
+            return None
+        key = (sort_by, ascending)
+        with self._lock:
+            if key in self._orders:
+                self._orders.move_to_end(key)
+                return self._orders[key]
+        series = self.df[sort_by].reset_index(drop=True)
+        try:
+            order = series.sort_values(ascending=ascending, kind="stable", na_position="last").index.to_numpy()
+        except TypeError:
+            # Cột lẫn kiểu (số và chữ) thì sắp theo dạng chuỗi
+            order = series.astype(str).sort_values(ascending=ascending, kind="stable").index.to_numpy()
+        with self._lock:
+            return _remember(self._orders, key, order)
+
+    def positions(self, query=None, sort_by=None, ascending=True):
+        """
+        Vị trí các dòng khớp `query`, theo thứ tự sắp xếp (None = giữ nguyên thứ tự)
+        """
+        mask = self.mask(query)
+        order = self.order(sort_by, ascending)
+        if order is None:
+            return np.flatnonzero(mask) if mask is not None else np.arange(self.n)
+        return order[mask[order]] if mask is not None else order
+
+    def page(self, page=1, page_size=PAGE_SIZES[0], query=None, sort_by=None, ascending=True):
+        """
+        Trả về (frame của trang, số dòng khớp, số trang); `page` bị kẹp vào khoảng hợp lệ
+        """
+        positions = self.positions(query, sort_by, ascending)
+        total = len(positions)
+        pages = max(1, math.ceil(total / page_size))
+        page = min(max(1, int(page)), pages)
+        start = (page - 1) * page_size
+        return self.df.iloc[positions[start:start + page_size]], total, pages
+
+
+def get_result_view(df, key=None):
+    """
+    ResultView nhớ theo `key` (vd phiên bản dữ liệu + bộ lọc + truy vấn); key None thì
+    không nhớ. Cùng key nhưng frame khác kích thước/bộ cột thì dựng lại.
+    """
+    if key is None:
+        return ResultView(df)
+    with _view_lock:
+        view = _view_cache.get(key)
+        if view is not None and view.n == len(df) and view.df.columns.equals(df.columns):
+            _view_cache.move_to_end(key)
+            return view
+    view = ResultView(df)
+    with _view_lock:
+        return _remember(_view_cache, key, view, VIEW_CACHE_SIZE)
+
+
+def render_table(df, key, cache_key=None, page_size=PAGE_SIZES[0]):
+    """
+    Hiển thị `df` trong Streamlit theo trang: ô lọc, chọn cột sắp xếp, tổng số dòng;
+    chỉ trang đang xem được gửi xuống trình duyệt
+    """
+    import streamlit as st
+
+    view = get_result_view(df, cache_key)
+    query_col, sort_col, order_col, size_col = st.columns([3, 2, 1, 1])
+    query = query_col.text_input("Lọc trong kết quả", key=f"{key}_query", placeholder="Gõ từ khoá…")
+    sort_by = sort_col.selectbox("Sắp xếp theo", ["(giữ nguyên)", *map(str, df.columns)], key=f"{key}_sort")
+    ascending = order_col.radio("Thứ tự", ["Tăng", "Giảm"], key=f"{key}_asc") == "Tăng"
+    page_size = size_col.selectbox("Số dòng/trang", PAGE_SIZES, index=PAGE_SIZES.index(page_size), key=f"{key}_size")
+    sort_by = None if sort_by == "(giữ nguyên)" else next(c for c in df.columns if str(c) == sort_by)
+
+    page_key = f"{key}_page"
+    frame, total, pages = view.page(st.session_state.get(page_key, 1), page_size, query, sort_by, ascending)
+    # Đổi bộ lọc làm ít trang đi thì kẹp lại số trang trước khi vẽ ô chọn trang
+    page = min(max(1, int(st.session_state.get(page_key, 1))), pages)
+    if page_key in st.session_state:
+        st.session_state[page_key] = page
+    st.dataframe(frame, use_container_width=True)
+    if pages > 1:
+        st.number_input("Trang", min_value=1, max_value=pages, step=1, key=page_key)
+    first = (page - 1) * page_size
+    shown = f"{first + 1}–{first + len(frame)}" if len(frame) else "0"
+    st.caption(f"Dòng {shown} / {total} khớp (tổng {len(df)} dòng) · trang {page}/{pages}")
+    return total
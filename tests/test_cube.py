@@ -0,0 +1,80 @@
+import datetime
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.synth_data import make_csv  # noqa: E402
+from rma_cube import RMACube, cube_for_spec  # noqa: E402
+from rma_data import parse_sheet_csv  # noqa: E402
+from rma_filters import FilterSpec  # noqa: E402
+from rma_reports import REPORTS_BY_KEY, ReportContext, ReportExecutor  # noqa: E402
+from rma_utils import column_index  # noqa: E402
+
+CUBE_REPORTS = [("total_by_group", {"group_by": "Quý"}), ("success_rate_by_group", {"group_by": "Tháng"}),
+                ("top_customers", {}), ("top_products", {}), ("top_errors", {}), ("technician_summary", {})]
+
+
+@pytest.fixture(scope="module")
+def frame():
+    data, _ = parse_sheet_csv(make_csv(3000, seed=3))
+    # Vài dòng không có ngày tiếp nhận: khoảng ngày phủ hết dữ liệu vẫn phải loại chúng
+    data.loc[data.index[:25], "Ngày tiếp nhận"] = pd.NaT
+    data.loc[data.index[:25], ["Năm", "Tháng", "Quý"]] = None
+    colmap = column_index(data.columns)
+    return data, colmap, RMACube(data, colmap)
+
+
+def _specs(data):
+    low, high = data["Ngày tiếp nhận"].min(), data["Ngày tiếp nhận"].max()
+    groups = data["Nhóm hàng"].dropna().unique().tolist()[:2]
+    return [
+        FilterSpec(groups=groups),
+        FilterSpec(years=(2023,), quarters=(2, 3)),
+        FilterSpec(date_from=low.date(), date_to=high.date(), groups=groups[:1]),
+    ]
+
+
+def test_cube_for_spec_matches_filtered_rows(frame):
+    data, colmap, cube = frame
+    for spec in _specs(data):
+        restricted = cube_for_spec(cube, spec, colmap)
+        assert restricted is not None
+        filtered = spec.apply(data, colmap=colmap)
+        assert restricted.rows == len(filtered) < len(data)
+        for key, params in CUBE_REPORTS:
+            report = REPORTS_BY_KEY[key]
+            _, from_cube = report.run(ReportContext(filtered, colmap, restricted, data, None), **params)
+            _, from_rows = report.run(ReportContext(filtered, colmap, None, data, None), **params)
+            pd.testing.assert_frame_equal(from_cube.reset_index(drop=True), from_rows.reset_index(drop=True),
+                                          check_dtype=False, check_categorical=False)
+
+
+def test_partial_date_range_needs_rows(frame):
+    data, colmap, cube = frame
+    low = data["Ngày tiếp nhận"].min()
+    spec = FilterSpec(date_from=low + datetime.timedelta(days=30))
+    assert cube_for_spec(cube, spec, colmap) is None
+    assert cube_for_spec(cube, FilterSpec(keyword="router", keyword_field="Sản phẩm"), colmap) is None
+
+
+def test_cube_built_only_on_cache_miss(frame):
+    data, colmap, cube = frame
+    builds = []
+
+    def cube_source():
+        builds.append(1)
+        return cube
+
+    executor = ReportExecutor()
+    ctx = ReportContext(data, colmap, cube_source, data, ("v1", FilterSpec()))
+    first = executor.run(REPORTS_BY_KEY["top_products"], ctx)
+    second = executor.run(REPORTS_BY_KEY["top_products"], ctx)
+    assert (first.cached, second.cached) == (False, True)
+    assert len(builds) == 1
+    # Báo cáo không dùng cube thì không dựng cube
+    executor.run(REPORTS_BY_KEY["avg_processing_time"], ctx)
+    assert len(builds) == 1
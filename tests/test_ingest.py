@@ -0,0 +1,30 @@
+import os
+import sys
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rma_data import load_csv_dataset  # noqa: E402
+from rma_ingest import IngestLoader  # noqa: E402
+from rma_turnaround import TURNAROUND_COL  # noqa: E402
+
+# Dòng đầu mơ hồ (05/02 đọc được cả mm/dd), các dòng sau chỉ đúng với dd/mm
+DDMM_CSV = """Ngày tiếp nhận,Tên khách hàng,Sản phẩm,Ngày trả khách
+05/02/2024,Phong Vũ,Router AX3000,09/02/2024
+20/02/2024,Đức Trí,SSD 1TB NVMe,28/02/2024
+13/03/2024,An Khang,Camera IP 2MP,25/03/2024
+"""
+
+
+def test_ingest_parses_ddmm_like_sheet(tmp_path):
+    path = tmp_path / "chi_nhanh.csv"
+    path.write_text(DDMM_CSV, encoding="utf-8")
+    data = IngestLoader(str(tmp_path), ttl=0, workers=1).get().data
+    expected = load_csv_dataset(str(path)).data
+
+    received = ["2024-02-05", "2024-02-20", "2024-03-13"]
+    assert data["Ngày tiếp nhận"].tolist() == [pd.Timestamp(day) for day in received]
+    assert data[TURNAROUND_COL].tolist() == [4.0, 8.0, 12.0]
+    for col in ["Ngày tiếp nhận", "Năm", "Tháng", "Quý", TURNAROUND_COL]:
+        assert data[col].tolist() == expected[col].tolist()
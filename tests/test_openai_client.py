@@ -0,0 +1,232 @@
+import http.server
+import json
+import os
+import sys
+import threading
+import time
+
+import openai
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import rma_ai  # noqa: E402
+from rma_openai_client import OpenAIBusyError, OpenAIClientManager  # noqa: E402
+
+STREAM_PAUSE = 0.3
+
+
+class ChatStub:
+    """
+    Server chat-completions cục bộ: trả lần lượt các mã trong `script` (hết thì 200),
+    chờ `delay` giây mỗi request, đếm số request và số request đồng thời lớn nhất.
+    Request stream gửi chunk đầu ngay, nghỉ STREAM_PAUSE giây rồi mới gửi phần còn lại.
+    """
+
+    def __init__(self, script=(), delay=0.0):
+        self.script = list(script)
+        self.delay = delay
+        self.hits = 0
+        self.active = 0
+        self.max_active = 0
+        self.lock = threading.Lock()
+        stub = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                with stub.lock:
+                    stub.hits += 1
+                    stub.active += 1
+                    stub.max_active = max(stub.max_active, stub.active)
+                    status = stub.script.pop(0) if stub.script else 200
+                try:
+                    time.sleep(stub.delay)
+                    if status != 200:
+                        self._json(status, {"error": {"message": f"stub {status}", "type": "stub"}})
+                    elif body.get("stream"):
+                        self._stream(body["model"])
+                    else:
+                        self._json(200, _completion(body["model"], "xin chào"))
+                finally:
+                    with stub.lock:
+                        stub.active -= 1
+
+            def _json(self, status, payload):
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                if status == 429:
+                    self.send_header("Retry-After", "0")
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _stream(self, model):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.end_headers()
+                for i, text in enumerate(["Phong", " Vũ", " gửi", " nhiều nhất"]):
+                    self.wfile.write(f"data: {json.dumps(_chunk(model, text))}\n\n".encode("utf-8"))
+                    self.wfile.flush()
+                    if i == 0:
+                        time.sleep(STREAM_PAUSE)
+                self.wfile.write(b"data: [DONE]\n\n")
+
+            def log_message(self, *args):
+                pass
+
+        self.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server.server_port}/v1"
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def _completion(model, text):
+    return {
+        "id": "chatcmpl-stub", "object": "chat.completion", "created": 0, "model": model,
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+    }
+
+
+def _chunk(model, text):
+    return {
+        "id": "chatcmpl-stub", "object": "chat.completion.chunk", "created": 0, "model": model,
+        "choices": [{"index": 0, "delta": {"content": text}, "finish_reason": None}],
+    }
+
+
+@pytest.fixture
+def stub_factory(monkeypatch):
+    stubs = []
+
+    def make(**kwargs):
+        stub = ChatStub(**kwargs)
+        stubs.append(stub)
+        monkeypatch.setenv("OPENAI_BASE_URL", stub.base_url)
+        return stub
+
+    yield make
+    for stub in stubs:
+        stub.close()
+
+
+def _manager(**kwargs):
+    kwargs.setdefault("backoff_base", 0.01)
+    return OpenAIClientManager(**kwargs)
+
+
+def _messages():
+    return [{"role": "user", "content": "xin chào"}]
+
+
+def test_retries_429_and_5xx_then_succeeds(stub_factory):
+    stub = stub_factory(script=[429, 503])
+    manager = _manager(max_retries=3)
+    response = manager.chat(api_key="test", model="gpt-stub", messages=_messages())
+    assert response.choices[0].message.content == "xin chào"
+    assert stub.hits == 3
+    stats = manager.stats()
+    assert (stats["requests"], stats["successes"], stats["retries"]) == (1, 1, 2)
+    assert stats["errors"] == {}
+
+
+def test_gives_up_after_max_retries(stub_factory):
+    stub = stub_factory(script=[500, 500, 500])
+    manager = _manager(max_retries=2)
+    with pytest.raises(openai.InternalServerError):
+        manager.chat(api_key="test", model="gpt-stub", messages=_messages())
+    assert stub.hits == 3
+    assert manager.stats()["retries"] == 2
+    assert manager.stats()["errors"] == {"InternalServerError": 1}
+
+
+def test_non_retryable_error_is_raised_at_once(stub_factory):
+    stub = stub_factory(script=[400])
+    manager = _manager(max_retries=3)
+    with pytest.raises(openai.BadRequestError):
+        manager.chat(api_key="test", model="gpt-stub", messages=_messages())
+    assert stub.hits == 1
+    stats = manager.stats()
+    assert stats["retries"] == 0
+    assert stats["errors"] == {"BadRequestError": 1}
+    assert stats["in_flight"] == 0
+
+
+def test_concurrency_cap(stub_factory):
+    stub = stub_factory(delay=0.2)
+    manager = _manager(max_concurrency=2)
+    threads = [threading.Thread(target=manager.chat, kwargs={"api_key": "test", "model": "gpt-stub",
+                                                              "messages": _messages()})
+               for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert stub.hits == 6
+    assert stub.max_active == 2
+    stats = manager.stats()
+    assert stats["max_in_flight"] == 2
+    assert stats["successes"] == 6
+    assert stats["queue_wait_ms"] > 0
+
+
+def test_busy_when_queue_timeout_expires(stub_factory):
+    stub_factory(delay=0.5)
+    manager = _manager(max_concurrency=1, queue_timeout=0.05)
+    first = threading.Thread(target=manager.chat, kwargs={"api_key": "test", "model": "gpt-stub",
+                                                          "messages": _messages()})
+    first.start()
+    time.sleep(0.1)
+    with pytest.raises(OpenAIBusyError):
+        manager.chat(api_key="test", model="gpt-stub", messages=_messages())
+    first.join()
+    assert manager.stats()["errors"] == {"busy": 1}
+
+
+def test_chat_stream_first_token_before_completion(stub_factory):
+    stub_factory()
+    manager = _manager()
+    started = time.perf_counter()
+    first_at = None
+    parts = []
+    for chunk in manager.chat_stream(api_key="test", model="gpt-stub", messages=_messages()):
+        if first_at is None:
+            first_at = time.perf_counter() - started
+        parts.append(chunk.choices[0].delta.content)
+    total = time.perf_counter() - started
+    assert "".join(parts) == "Phong Vũ gửi nhiều nhất"
+    assert first_at < STREAM_PAUSE <= total
+    stats = manager.stats()
+    assert stats["ttft_ms_p50"] < STREAM_PAUSE * 1000 <= stats["latency_ms_p50"]
+    assert stats["in_flight"] == 0
+
+
+def test_answer_stream_ttft(stub_factory, monkeypatch):
+    # Đường stream của AIQuery.ask(stream=True): AnswerStream đọc từ _stream_completion
+    stub_factory()
+    manager = _manager()
+    monkeypatch.setattr(rma_ai, "get_client_manager", lambda: manager)
+    answer_stream = rma_ai.AnswerStream(None, "llm")
+    answer_stream._chunks = rma_ai._stream_completion(answer_stream, "test", "gpt-stub", "xin chào")
+    assert "".join(answer_stream) == "Phong Vũ gửi nhiều nhất"
+    assert answer_stream.ok
+    assert answer_stream.ttft_ms < STREAM_PAUSE * 1000 <= answer_stream.total_ms
+
+
+def test_answer_stream_reports_error(stub_factory, monkeypatch):
+    stub_factory(script=[400])
+    manager = _manager()
+    monkeypatch.setattr(rma_ai, "get_client_manager", lambda: manager)
+    answer_stream = rma_ai.AnswerStream(None, "llm")
+    answer_stream._chunks = rma_ai._stream_completion(answer_stream, "test", "gpt-stub", "xin chào")
+    text = "".join(answer_stream)
+    assert not answer_stream.ok
+    assert "Lỗi khi gọi OpenAI" in text
@@ -0,0 +1,28 @@
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rma_cube import RMACube  # noqa: E402
+from rma_query_templates import query_19_top_technicians  # noqa: E402
+from rma_utils import column_index  # noqa: E402
+
+
+@pytest.mark.parametrize("header", ["KTV", "Kỹ thuật viên"])
+def test_top_technicians_finds_sheet_header(header):
+    # Sheet thật đặt tên cột là "KTV"; query_19 phải khớp cả hai cách đặt tên
+    df = pd.DataFrame({
+        "Ngày tiếp nhận": pd.to_datetime(["2024-01-05", "2024-01-09", "2024-02-01"]),
+        "Năm": [2024, 2024, 2024],
+        "Tháng": [1, 1, 2],
+        "Quý": [1, 1, 1],
+        header: ["Minh", "Minh", "Lan"],
+    })
+    colmap = column_index(df.columns)
+    for cube in (None, RMACube(df, colmap)):
+        _, result = query_19_top_technicians(df, colmap=colmap, cube=cube)
+        assert result["Kỹ thuật viên"].tolist() == ["Minh", "Lan"]
+        assert result["Số lượng"].tolist() == [2, 1]
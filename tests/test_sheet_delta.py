@@ -0,0 +1,66 @@
+import os
+import sys
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rma_data import hash_records, merge_sheet_delta, parse_sheet_csv, split_sheet_records  # noqa: E402
+from rma_turnaround import TURNAROUND_COL  # noqa: E402
+
+HEADER = "Ngày tiếp nhận,Tên khách hàng,Sản phẩm,Ngày trả khách\n"
+OLD_ROWS = [
+    "13/01/2024,Phong Vũ,Router AX3000,20/01/2024",
+    "25/01/2024,Đức Trí,SSD 1TB NVMe,",
+    "03/02/2024,An Khang,Camera IP 2MP,14/02/2024",
+]
+# Dòng mới đầu tiên mơ hồ (05/02 đọc được cả mm/dd), dòng sau chỉ đúng với dd/mm
+NEW_ROWS = [
+    "05/02/2024,Phong Vũ,Switch 8P PoE,09/02/2024",
+    "20/02/2024,FPT Shop,HDD 4TB NAS,28/02/2024",
+]
+
+
+def _csv(rows):
+    return (HEADER + "\n".join(rows) + "\n").encode("utf-8")
+
+
+def _incremental(old_rows, new_rows):
+    prev, _ = parse_sheet_csv(_csv(old_rows))
+    prev_header, prev_records = split_sheet_records(_csv(old_rows))
+    header, records = split_sheet_records(_csv(old_rows + new_rows))
+    merged = merge_sheet_delta(prev, prev_header, hash_records(prev_records), header, records, hash_records(records))
+    assert merged is not None
+    data, n_parsed = merged
+    assert n_parsed == len(new_rows)
+    return data
+
+
+def _assert_same_dates(incremental, full):
+    for col in ["Ngày tiếp nhận", "Năm", "Tháng", "Quý", TURNAROUND_COL]:
+        pd.testing.assert_series_equal(incremental[col], full[col], check_dtype=False, check_categorical=False)
+
+
+def test_incremental_dates_match_full_parse():
+    full, _ = parse_sheet_csv(_csv(OLD_ROWS + NEW_ROWS))
+    data = _incremental(OLD_ROWS, NEW_ROWS)
+    _assert_same_dates(data, full)
+    assert data["Ngày tiếp nhận"].iloc[-2:].tolist() == [pd.Timestamp("2024-02-05"), pd.Timestamp("2024-02-20")]
+    assert data.attrs["date_formats"] == full.attrs["date_formats"]
+
+
+def test_ambiguous_first_row_uses_whole_column():
+    rows = NEW_ROWS + OLD_ROWS
+    full, _ = parse_sheet_csv(_csv(rows))
+    assert full.attrs["date_formats"]["Ngày tiếp nhận"] == "%d/%m/%Y"
+    assert full["Ngày tiếp nhận"].notna().all()
+    _assert_same_dates(_incremental(rows[:2], rows[2:]), full)
+
+
+def test_merge_without_date_formats_falls_back_to_full_parse():
+    prev, _ = parse_sheet_csv(_csv(OLD_ROWS))
+    prev.attrs.pop("date_formats")
+    prev_header, prev_records = split_sheet_records(_csv(OLD_ROWS))
+    header, records = split_sheet_records(_csv(OLD_ROWS + NEW_ROWS))
+    assert merge_sheet_delta(prev, prev_header, hash_records(prev_records), header, records,
+                             hash_records(records)) is None
@@ -0,0 +1,43 @@
+import os
+import sys
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rma_turnaround import turnaround_trend  # noqa: E402
+
+ROLLED = "P50 (ngày) – TB 3 tháng"
+
+
+def _frame(rows):
+    received, returned, groups = zip(*rows)
+    return pd.DataFrame({
+        "Ngày tiếp nhận": pd.to_datetime(received),
+        "Ngày trả khách": pd.to_datetime(returned),
+        "Nhóm hàng": groups,
+    })
+
+
+def test_rolling_window_counts_calendar_months():
+    # Tháng 3–5 trống: TB 3 tháng của tháng 6 chỉ gồm chính tháng 6
+    df = _frame([
+        ("2024-01-10", "2024-01-12", "A"),
+        ("2024-02-10", "2024-02-20", "A"),
+        ("2024-06-10", "2024-06-30", "A"),
+    ])
+    trend = turnaround_trend(df)
+    assert trend["Tháng"].tolist() == ["2024-01", "2024-02", "2024-06"]
+    assert trend[ROLLED].tolist() == [2.0, 6.0, 20.0]
+
+
+def test_rolling_window_per_group():
+    df = _frame([
+        ("2024-01-10", "2024-01-12", "A"),
+        ("2024-04-10", "2024-04-20", "A"),
+        ("2024-01-10", "2024-01-11", "B"),
+        ("2024-03-10", "2024-03-14", "B"),
+    ])
+    trend = turnaround_trend(df, by="Nhóm hàng").set_index(["Nhóm hàng", "Tháng"])
+    assert trend.loc[("A", "2024-04"), ROLLED] == 10.0
+    assert trend.loc[("B", "2024-03"), ROLLED] == 2.5